@@ -160,6 +160,20 @@ doc_events = {
         "on_submit": "sb.sb.stock_hooks.update_length_in_sle",
         "on_cancel": "sb.sb.stock_hooks.clear_length_in_sle"
 
+    },
+    "Item": {
+        "on_update": "sb.sb.uom.clear_item_uom_cache",
+        "on_trash": "sb.sb.uom.clear_item_uom_cache"
+    },
+    "UOM Conversion Factor": {
+        "on_update": "sb.sb.uom.clear_uom_cache",
+        "on_trash": "sb.sb.uom.clear_uom_cache"
+    },
+    "Repost Item Valuation": {
+        "on_submit": "sb.sb.stock_snapshots.invalidate_snapshots"
+    },
+    "Stock Ledger Entry": {
+        "on_submit": "sb.sb.stock_snapshots.invalidate_snapshots"
     }
 }
 
@@ -167,6 +181,12 @@ doc_events = {
 # Scheduled Tasks
 # ---------------
 
+scheduler_events = {
+    "daily_long": [
+        "sb.sb.stock_snapshots.build_snapshots"
+    ]
+}
+
 # scheduler_events = {
 # 	"all": [
 # 		"sb.tasks.all"
@@ -0,0 +1,5 @@
+from sb.sb.length_bins import rebuild_length_bins
+
+
+def execute():
+    rebuild_length_bins()
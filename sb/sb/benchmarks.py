@@ -0,0 +1,461 @@
+# benchmarks.py
+# Copyright (c) 2025, ptpratul2@gmail.com and contributors
+# For license information, please see license.txt
+
+"""
+Benchmarks for the heavy paths of this app. Run them against a development
+site, for example
+
+    bench --site <site> execute sb.sb.benchmarks.raw_material_write
+
+Every benchmark rolls back the data it creates, except `reservation_stress`,
+which needs committed rows to race on and cleans them up itself. Peak memory is the Python
+allocation peak reported by tracemalloc for that run; max RSS is the
+process high-water mark, so it only ever grows across runs.
+"""
+
+import resource
+import time
+import tracemalloc
+
+import frappe
+from frappe.utils import flt
+
+from sb.sb.bulk_write import insert_child_rows, touch_parent
+from sb.sb.fg_rules import expand_fg_code, parse_fg_code
+
+SAMPLE_FG_CODES = (
+    "150|0|B|2400|",
+    "125|100|SL|1200|",
+    "100|50|SXC|900|900",
+    "300|0|TSE|1800|",
+    "150|0|MB|600|",
+    "175|0|K|1900|",
+)
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        fn()
+    finally:
+        elapsed = time.perf_counter() - start
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "seconds": round(elapsed, 3),
+        "peak_mb": round(peak / 1024 / 1024, 1),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def print_results(title, results):
+    print(title)
+    for result in results:
+        print("  " + "  ".join(f"{key}={value}" for key, value in result.items()))
+
+
+def synthetic_processed_codes(row_count):
+    """Yield `(fg_code, planning_bom, rm_rows)` like FGRawMaterialSelector.iter_raw_materials."""
+    produced = 0
+    i = 0
+    while produced < row_count:
+        fg_code = SAMPLE_FG_CODES[i % len(SAMPLE_FG_CODES)]
+        i += 1
+        a, b, fg_code_part, l1, l2 = parse_fg_code(fg_code)
+        rm_table = []
+        for rm in expand_fg_code(a, b, fg_code_part, l1, l2)[: row_count - produced]:
+            rm_table.append({
+                "fg_code": fg_code,
+                "raw_material_code": rm["code"],
+                "item_code": rm["code"],
+                "a": a,
+                "b": b,
+                "code": fg_code_part,
+                "l1": l1,
+                "l2": l2,
+                "bom_qty": 1,
+                "dimension": rm["dimension"],
+                "remark": rm["remark"],
+                "quantity": rm["quantity"],
+            })
+        produced += len(rm_table)
+        yield fg_code, None, rm_table
+
+
+def raw_material_write(sizes=(1000, 10000, 100000)):
+    """Compare `append()` + `save()` against the bulk INSERT path for FG Raw Material Item rows."""
+    results = []
+    for size in sizes:
+        for bulk_write in (0, 1):
+            doc = frappe.get_doc({"doctype": "FG Raw Material Selector", "bulk_write": bulk_write})
+            doc.insert(ignore_permissions=True)
+
+            def run():
+                if bulk_write:
+                    doc.write_raw_materials_bulk(synthetic_processed_codes(size))
+                    touch_parent(doc)
+                else:
+                    doc.append_raw_materials(synthetic_processed_codes(size))
+                    doc.save(ignore_permissions=True)
+
+            results.append({"rows": size, "path": "bulk" if bulk_write else "document", **measure(run)})
+            frappe.db.rollback()
+
+    print_results("FG Raw Material Item write", results)
+    return results
+
+
+def cutting(sizes=(1000, 10000), stock_length=4820):
+    """Bars, waste and time of each cutting method on random cut lists."""
+    import random
+
+    from sb.sb.cutting import METHODS, pack
+
+    results = []
+    rng = random.Random(42)
+    for size in sizes:
+        cuts = [rng.choice((2400, 1850, 1200, 900, 600, rng.randint(20, 240) * 10)) for _ in range(size)]
+        for method in METHODS:
+            plan = None
+
+            def run():
+                nonlocal plan
+                plan = pack(cuts, stock_length, method)
+
+            timing = measure(run)
+            results.append({
+                "cuts": size,
+                "method": method,
+                "bars": plan.bar_count,
+                "lower_bound": plan.lower_bound,
+                "waste": plan.total_waste,
+                **timing
+            })
+
+    print_results("Cutting plan", results)
+    return results
+
+
+def offcut_lookup(item_code, queries=10000, warehouse=None):
+    """Time best-fit lookups against the offcut index once the item is loaded."""
+    import random
+
+    from sb.sb.offcut_index import get_offcut_index
+
+    index = get_offcut_index()
+    pieces = index.get_pieces(item_code, warehouse)
+    rng = random.Random(42)
+    lengths = [rng.randint(10, 480) * 10 for _ in range(queries)]
+
+    def run():
+        for length in lengths:
+            index.best_fit(item_code, length, warehouse)
+
+    timing = measure(run)
+    results = [{
+        "pieces": len(pieces),
+        "queries": queries,
+        "us_per_query": round(timing["seconds"] / queries * 1e6, 2),
+        **timing
+    }]
+    print_results("Offcut index lookup", results)
+    return results
+
+
+def reservation_stress(item_code, qty=1, jobs=8, source="Raw Material - VD", target="Reserved Stock - VD"):
+    """Race `jobs` calls of each reservation endpoint for the same bars and check none over-reserves.
+
+    Every call runs in its own thread and database connection, through the
+    whitelisted endpoint a planner would use: `create_stock_entry_client`
+    (draft transfers), `soft_reserve_stock` and `reserve_stock_physically`.
+    Exactly `floor(free / qty)` calls may succeed, and open Soft
+    Reservations must never exceed the Bin. Neither drafts nor Soft
+    Reservations are guarded by ERPNext, so only the Bin lock keeps these
+    true. Unlike the other benchmarks this one has to commit; what it
+    creates is cancelled or deleted again at the end.
+    """
+    import math
+    import threading
+
+    from sb.sb.doctype.fg_raw_material_selector.fg_raw_material_selector import create_stock_entry_client
+    from sb.sb.stock_availability import get_soft_reserved_qtys
+    from sb.sb.stock_locks import get_draft_transfer_qtys
+    from sb.sb.stock_reserve import reserve_stock_physically, soft_reserve_stock
+
+    site = frappe.local.site
+    user = frappe.session.user
+    key = (item_code, source)
+    stock_uom = frappe.db.get_value("Item", item_code, "stock_uom")
+
+    selectors = []
+    for _ in range(jobs):
+        selector = frappe.get_doc({
+            "doctype": "FG Raw Material Selector",
+            "raw_materials": [{
+                "item_code": item_code, "quantity": qty, "uom": stock_uom,
+                "warehouse": source, "status": "IS", "reserve_tag": 1,
+            }],
+        })
+        selector.insert(ignore_permissions=True, ignore_mandatory=True)
+        selectors.append(selector.name)
+    frappe.db.commit()
+
+    endpoints = {
+        "draft transfer": lambda selector: create_stock_entry_client(
+            [{"item_code": item_code, "qty": qty, "uom": stock_uom, "s_warehouse": source, "t_warehouse": target}]
+        ),
+        "soft reservation": lambda selector: soft_reserve_stock(selector) and selector,
+        "physical reservation": lambda selector: reserve_stock_physically(selector)["stock_entry"],
+    }
+
+    def race(endpoint):
+        barrier = threading.Barrier(jobs)
+        outcomes = []
+
+        def job(selector):
+            frappe.init(site=site)
+            frappe.connect()
+            frappe.set_user(user)
+            try:
+                barrier.wait()
+                name = endpoint(selector)
+                frappe.db.commit()
+                outcomes.append(name)
+            except frappe.ValidationError:
+                frappe.db.rollback()
+                outcomes.append(None)
+            finally:
+                frappe.destroy()
+
+        threads = [threading.Thread(target=job, args=(selector,)) for selector in selectors]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return [name for name in outcomes if name]
+
+    def bin_qty():
+        return flt(frappe.db.get_value("Bin", {"item_code": item_code, "warehouse": source}, "actual_qty"))
+
+    results = []
+    failures = []
+    for label, endpoint in endpoints.items():
+        frappe.db.rollback()
+        free = bin_qty() - get_soft_reserved_qtys([item_code], [source]).get(key, 0)
+        if label == "draft transfer":
+            free -= get_draft_transfer_qtys([key]).get(key, 0)
+        expected = min(jobs, max(0, math.floor(free / qty + 1e-9)))
+
+        made = []
+        timing = measure(lambda: made.extend(race(endpoint)))
+        frappe.db.rollback()
+        soft_reserved = get_soft_reserved_qtys([item_code], [source]).get(key, 0)
+        result = {
+            "endpoint": label,
+            "jobs": jobs,
+            "free": free,
+            "expected": expected,
+            "reserved": len(made),
+            "soft_reserved": soft_reserved,
+            "bin_qty": bin_qty(),
+            **timing
+        }
+        results.append(result)
+        if len(made) != expected:
+            failures.append(f"{label}: {len(made)} calls succeeded, expected {expected}")
+        if soft_reserved > bin_qty() + 1e-9:
+            failures.append(f"{label}: {soft_reserved} soft reserved but only {bin_qty()} in the Bin")
+
+        if label == "draft transfer":
+            for name in made:
+                frappe.delete_doc("Stock Entry", name, ignore_permissions=True)
+        elif label == "soft reservation":
+            frappe.db.delete("Soft Reservation", {"fg_raw_material_selector": ["in", selectors]})
+        else:
+            for name in made:
+                frappe.get_doc("Stock Entry", name).cancel()
+        frappe.db.commit()
+
+    for name in selectors:
+        frappe.delete_doc("FG Raw Material Selector", name, ignore_permissions=True, force=True)
+    frappe.db.commit()
+
+    print_results("Concurrent reservation", results)
+    if failures:
+        raise AssertionError("; ".join(failures))
+    return results
+
+
+def length_hook(item_code, warehouse, sizes=(10, 100, 1000), company="Vidhi (Demo)"):
+    """Submit latency of a Material Receipt with lengths, and the share spent in the SLE length hook."""
+    from sb.sb.stock_hooks import update_length_in_sle
+
+    results = []
+    for size in sizes:
+        entry = frappe.get_doc({
+            "doctype": "Stock Entry",
+            "stock_entry_type": "Material Receipt",
+            "purpose": "Material Receipt",
+            "company": company,
+            "items": [
+                {
+                    "item_code": item_code,
+                    "qty": 1,
+                    "t_warehouse": warehouse,
+                    "basic_rate": 1,
+                    "custom_length": 1000 + i,
+                }
+                for i in range(size)
+            ],
+        })
+        entry.insert(ignore_permissions=True)
+
+        submit = measure(entry.submit)
+        hook = measure(lambda: update_length_in_sle(entry, "on_submit"))
+        results.append({"lines": size, "submit_seconds": submit["seconds"], "hook_seconds": hook["seconds"]})
+        frappe.db.rollback()
+
+    print_results("Stock Entry submit with lengths", results)
+    return results
+
+
+def synthetic_bundle_sles(sle_count, rows_per_bundle):
+    """Yield `(sle, bundle_rows)` shaped like the Stock Balance with Length report's rows."""
+    for i in range(sle_count):
+        qty = rows_per_bundle * 2
+        sle = frappe._dict(
+            item_code="RM-1", date=None, warehouse="Raw Material - VD", posting_date=None, posting_time=None,
+            length=1200, total_length=1200 * qty, actual_qty=qty, incoming_rate=10, valuation_rate=10,
+            company="Vidhi (Demo)", voucher_type="Purchase Receipt", voucher_no=f"PR-{i}",
+            qty_after_transaction=qty * (i + 1), stock_value_difference=10 * qty, stock_value=10 * qty * (i + 1),
+            serial_and_batch_bundle=f"SABB-{i}", batch_no=None, serial_no=None, project=None,
+            item_name="RM 1", description="RM 1", item_group="Raw Material", brand=None, stock_uom="Nos",
+        )
+        bundle_rows = [
+            frappe._dict(qty=2, incoming_rate=10, stock_value_difference=20, batch_no=f"B-{j}", serial_no=None)
+            for j in range(rows_per_bundle)
+        ]
+        yield sle, bundle_rows
+
+
+def segregated_bundles(sizes=(10000, 100000, 1000000), rows_per_bundle=4):
+    """Time splitting SLEs into per-batch report rows, against the deep copy it used to make per row."""
+    import copy
+
+    from sb.sb.report.stock_balance_with_length.stock_balance_with_length import get_segregated_bundle_entries
+
+    filters = frappe._dict(batch_no="B-0")
+    results = []
+    for size in sizes:
+        def segregate():
+            batch_balances = frappe._dict()
+            for sle, bundle_rows in synthetic_bundle_sles(size, rows_per_bundle):
+                get_segregated_bundle_entries(sle, bundle_rows, batch_balances, filters)
+
+        def deep_copies():
+            for sle, bundle_rows in synthetic_bundle_sles(size, rows_per_bundle):
+                for _row in bundle_rows:
+                    copy.deepcopy(sle)
+
+        timing = measure(segregate)
+        results.append({
+            "sles": size,
+            "bundle_rows": size * rows_per_bundle,
+            "seconds": timing["seconds"],
+            "peak_mb": timing["peak_mb"],
+            "deepcopy_seconds": measure(deep_copies)["seconds"],
+        })
+
+    print_results("Segregated bundle entries", results)
+    return results
+
+
+def design_import(sizes=(1000, 10000, 50000)):
+    """Read and write time of a Project Design Upload sheet of each size."""
+    import os
+    import tempfile
+
+    import pandas as pd
+
+    from sb.sb.doctype.project_design_upload.project_design_upload import import_design_rows, iter_design_chunks
+
+    results = []
+    for size in sizes:
+        codes = [SAMPLE_FG_CODES[i % len(SAMPLE_FG_CODES)] for i in range(size)]
+        sheet = pd.DataFrame({
+            "FG Code": codes,
+            "Quantity": [1 + i % 5 for i in range(size)],
+            "A": [code.split("|")[0] for code in codes],
+            "B": [code.split("|")[1] for code in codes],
+            "Code": [code.split("|")[2] for code in codes],
+            "L1": [code.split("|")[3] for code in codes],
+            "Room No": [f"R{i % 40}" for i in range(size)],
+            "Flat No": [f"F{i % 200}" for i in range(size)],
+        })
+        with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as f:
+            path = f.name
+        doc = None
+        try:
+            sheet.to_excel(path, index=False)
+            doc = frappe.get_doc({"doctype": "Project Design Upload"}).insert(ignore_permissions=True)
+            read = measure(lambda: sum(len(chunk) for chunk in iter_design_chunks(path, "Project Design Upload Item")))
+            write = measure(lambda: import_design_rows(doc, path))
+            results.append({
+                "rows": size,
+                "read_seconds": read["seconds"],
+                "read_peak_mb": read["peak_mb"],
+                "import_seconds": write["seconds"],
+                "peak_mb": write["peak_mb"],
+            })
+        finally:
+            os.remove(path)
+            # The import commits per chunk, so remove what it wrote
+            frappe.db.rollback()
+            if doc:
+                frappe.delete_doc("Project Design Upload", doc.name, force=True, ignore_permissions=True)
+                frappe.db.commit()
+
+    print_results("Project Design Upload import", results)
+    return results
+
+
+def consolidation(uploads=50, rows=2000):
+    """Time consolidating `uploads` Project Design Uploads of `rows` rows each into a Planning BOM."""
+    from sb.sb.doctype.planning_bom.planning_bom import (
+        consolidate_project_design_uploads,
+        get_consolidation_preview,
+        get_project_design_upload_summary,
+    )
+
+    upload_names = []
+    for _ in range(uploads):
+        upload = frappe.get_doc({"doctype": "Project Design Upload"}).insert(ignore_permissions=True)
+        insert_child_rows(upload, "items", (
+            {
+                "fg_code": SAMPLE_FG_CODES[i % len(SAMPLE_FG_CODES)],
+                "quantity": 1 + i % 5,
+                "u_area": 0.5,
+                "dwg_no": f"DWG-{i % 30}",
+            }
+            for i in range(rows)
+        ))
+        upload_names.append(upload.name)
+
+    bom = frappe.get_doc({
+        "doctype": "Planning BOM",
+        "project_design_upload": [{"project_design": name} for name in upload_names],
+    }).insert(ignore_permissions=True)
+
+    results = [{
+        "rows": uploads * rows,
+        "consolidate_seconds": measure(lambda: consolidate_project_design_uploads(bom.name))["seconds"],
+        "preview_seconds": measure(lambda: get_consolidation_preview(bom.name))["seconds"],
+        "summary_seconds": measure(lambda: get_project_design_upload_summary(bom.name))["seconds"],
+    }]
+    frappe.db.rollback()
+
+    print_results("Planning BOM consolidation", results)
+    return results
@@ -0,0 +1,150 @@
+# bulk_write.py
+# Copyright (c) 2025, ptpratul2@gmail.com and contributors
+# For license information, please see license.txt
+
+"""
+Direct child-table writes for documents with very large tables.
+
+`doc.append()` followed by `doc.save()` validates the whole parent and
+inserts child rows one at a time. For tables with tens of thousands of
+computed rows these helpers write multi-row INSERTs instead and only touch
+the parent's `modified`. `update_rows()` does the same for `db_set()` on
+many rows. Nothing here commits, so the caller's transaction covers the
+whole write.
+"""
+
+from collections import defaultdict
+
+import frappe
+from frappe.query_builder import Case
+from frappe.query_builder.functions import Max
+from frappe.utils import cint, now_datetime
+
+DEFAULT_CHUNK_SIZE = 1000
+
+STANDARD_CHILD_FIELDS = (
+    "name", "parent", "parenttype", "parentfield", "idx", "docstatus",
+    "owner", "modified_by", "creation", "modified",
+)
+
+
+def get_child_doctype(doc, parentfield):
+    return doc.meta.get_field(parentfield).options
+
+
+def get_max_idx(doc, parentfield):
+    """Return the highest `idx` stored for a child table, 0 when it is empty."""
+    child = frappe.qb.DocType(get_child_doctype(doc, parentfield))
+    result = (
+        frappe.qb.from_(child)
+        .select(Max(child.idx))
+        .where((child.parent == doc.name) & (child.parenttype == doc.doctype) & (child.parentfield == parentfield))
+    ).run()
+    return cint(result[0][0]) if result else 0
+
+
+def delete_child_rows(doc, parentfield, filters=None):
+    """Delete the rows of a child table, optionally narrowed by extra filters."""
+    conditions = {"parent": doc.name, "parenttype": doc.doctype, "parentfield": parentfield}
+    conditions.update(filters or {})
+    frappe.db.delete(get_child_doctype(doc, parentfield), conditions)
+
+
+def insert_child_rows(doc, parentfield, rows, start_idx=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Stream `rows` (dicts of child fields) into the child table and return how many were written.
+
+    Keys that are not columns of the child doctype are ignored, the same as
+    with `doc.append()`. Rows are numbered on from `start_idx` unless they
+    carry their own `idx`.
+    """
+    child_doctype = get_child_doctype(doc, parentfield)
+    valid_columns = set(frappe.get_meta(child_doctype).get_valid_columns()) - set(STANDARD_CHILD_FIELDS)
+    context = frappe._dict(
+        doctype=child_doctype,
+        valid_columns=valid_columns,
+        parent=doc.name,
+        parenttype=doc.doctype,
+        parentfield=parentfield,
+        docstatus=doc.docstatus or 0,
+        user=frappe.session.user,
+        now=now_datetime(),
+    )
+
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            _insert_chunk(context, chunk, start_idx + count)
+            count += len(chunk)
+            chunk = []
+
+    if chunk:
+        _insert_chunk(context, chunk, start_idx + count)
+        count += len(chunk)
+
+    return count
+
+
+def _insert_chunk(context, chunk, start_idx):
+    fields = sorted({key for row in chunk for key in row} & context.valid_columns)
+    values = [
+        (
+            frappe.generate_hash(length=10),
+            context.parent,
+            context.parenttype,
+            context.parentfield,
+            row.get("idx") or start_idx + i,
+            context.docstatus,
+            context.user,
+            context.user,
+            context.now,
+            context.now,
+            *(row.get(field) for field in fields),
+        )
+        for i, row in enumerate(chunk)
+    ]
+    frappe.db.bulk_insert(context.doctype, list(STANDARD_CHILD_FIELDS) + fields, values)
+
+
+def update_rows(doctype, updates, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write `{name: {field: value}}` with one UPDATE per chunk of rows and return the statement count.
+
+    A field that gets the same value on every row of a chunk is a plain
+    SET; otherwise it is a CASE on the row name. `modified` is bumped on
+    every row, the same as `db_set()`.
+    """
+    table = frappe.qb.DocType(doctype)
+    names = list(updates)
+    now = now_datetime()
+    statements = 0
+    for start in range(0, len(names), chunk_size):
+        chunk = names[start:start + chunk_size]
+        columns = defaultdict(dict)
+        for name in chunk:
+            for field, value in updates[name].items():
+                columns[field][name] = value
+
+        query = frappe.qb.update(table).set(table.modified, now).set(table.modified_by, frappe.session.user)
+        for field, values in columns.items():
+            distinct = set(values.values())
+            if len(values) == len(chunk) and len(distinct) == 1:
+                query = query.set(table[field], distinct.pop())
+                continue
+
+            case = Case()
+            for name, value in values.items():
+                case = case.when(table.name == name, value)
+            query = query.set(table[field], case.else_(table[field]))
+
+        query.where(table.name.isin(chunk)).run()
+        statements += 1
+
+    return statements
+
+
+def touch_parent(doc, values=None):
+    """Bump the parent's modified timestamp, writing any extra parent fields alongside it."""
+    values = dict(values or {})
+    values.update({"modified": now_datetime(), "modified_by": frappe.session.user})
+    frappe.db.set_value(doc.doctype, doc.name, values, update_modified=False)
@@ -0,0 +1,557 @@
+# cutting.py
+# Copyright (c) 2025, ptpratul2@gmail.com and contributors
+# For license information, please see license.txt
+
+"""
+One-dimensional cutting-stock engine for raw material bars.
+
+`pack()` lays the cuts of a single item out on stock bars. It returns the
+bar count, the cut pattern and waste of every bar, and a lower bound on
+the number of bars. Three methods are available:
+
+    ffd  first-fit decreasing, O(n log n) with a max segment tree
+    bfd  best-fit decreasing, tightest open bar first
+    bnb  the best of ffd, bfd and max-fill pattern generation (each
+         pattern is a bounded knapsack solved by branch and bound), then,
+         for up to EXACT_SEARCH_LIMIT cuts, an exact branch and bound
+         over the cuts; all within a time budget. `optimal` is set when
+         the bar count is proven minimal
+
+`plan_cutting()` runs `pack()` for every item of an FG Raw Material
+Selector with the stock lengths, kerf and end trim from Cutting Settings,
+and `summarize_offcuts()` turns the plans into the remaining-length rows
+of the Offcut Report. Stock reservation and Material Requests take their
+bar counts from the same plans.
+
+With `use_offcuts`, `plan_cutting()` first takes the pieces lying in the
+offcut warehouse from the offcut index (`sb.sb.offcut_index`) and fills
+them before any new bar is opened, so the plan names the offcuts to pull
+from stock.
+"""
+
+import math
+import time
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+
+import frappe
+from frappe import _
+from frappe.utils import flt
+
+STANDARD_STOCK_LENGTH = 4820.0
+METHODS = ("ffd", "bfd", "bnb")
+DEFAULT_TIME_BUDGET = 2.0
+EXACT_SEARCH_LIMIT = 200
+PATTERN_NODE_LIMIT = 5000
+EPSILON = 1e-6
+
+
+def pack(cuts, stock_lengths=STANDARD_STOCK_LENGTH, method="ffd", time_budget=None, kerf=0, end_trim=0, offcuts=None):
+    """Lay `cuts` out on stock bars and return the cutting plan.
+
+    `offcuts` are pieces already in stock (dicts with at least `length`).
+    They are filled first, each with the fullest pattern of the cuts still
+    open, and only the rest of the cuts go on new bars. `bar_count` counts
+    new bars only; bars cut from an offcut have `source` "Offcut".
+
+    `stock_lengths` is one bar length or every length the item is bought
+    in. With several, the cuts are packed once per length and each bar is
+    then taken from the shortest length its pattern fits; the mix with the
+    least total bar length wins. Every cut loses `kerf` to the saw (the last
+    piece of a bar needs none when it ends flush) and every bar loses
+    `end_trim`. Cuts that fit no bar are returned in `oversize`.
+    """
+    if method not in METHODS:
+        frappe.throw(_("Unknown cutting method {0}. Use one of {1}.").format(method, ", ".join(METHODS)))
+
+    kerf = flt(kerf)
+    end_trim = flt(end_trim)
+    if not isinstance(stock_lengths, (list, tuple, set)):
+        stock_lengths = [stock_lengths]
+    lengths = sorted({flt(length) for length in stock_lengths if flt(length) > end_trim}) or [STANDARD_STOCK_LENGTH]
+
+    # A bar of length L holds n cuts when sum(cut + kerf) <= L - end_trim + kerf
+    def capacity(length):
+        return length - end_trim + kerf
+
+    cuts = sorted((flt(cut) for cut in cuts if flt(cut) > 0), reverse=True)
+    oversize = [cut for cut in cuts if cut + kerf > capacity(lengths[-1]) + EPSILON]
+    items = [cut + kerf for cut in cuts[len(oversize):]]
+    offcut_bars, items = fill_offcuts(items, offcuts or [], kerf)
+    lower_bound = get_lower_bound(items, capacity(lengths[-1]))
+
+    if method == "bnb" and time_budget is None:
+        time_budget = flt(frappe.conf.get("sb_cutting_time_budget")) or DEFAULT_TIME_BUDGET
+
+    best = None
+    for length in lengths:
+        if items and items[0] > capacity(length) + EPSILON:
+            continue
+
+        if method == "ffd":
+            patterns = first_fit_decreasing(items, capacity(length))
+            optimal = len(patterns) == get_lower_bound(items, capacity(length))
+        elif method == "bfd":
+            patterns = best_fit_decreasing(items, capacity(length))
+            optimal = len(patterns) == get_lower_bound(items, capacity(length))
+        else:
+            patterns, optimal = branch_and_bound(
+                items, capacity(length), get_lower_bound(items, capacity(length)), time_budget / len(lengths)
+            )
+
+        bars = []
+        for pattern in patterns:
+            content = sum(pattern)
+            stock_length = next(option for option in lengths if capacity(option) >= content - EPSILON)
+            pieces = [flt(item - kerf, 6) for item in pattern]
+            used = sum(pieces)
+            waste = flt(max(stock_length - end_trim - content, 0), 3)
+            bars.append({
+                "source": "Stock",
+                "stock_length": stock_length,
+                "cuts": pieces,
+                "used": flt(used, 3),
+                "kerf_loss": flt(stock_length - end_trim - used - waste, 3),
+                "end_trim": end_trim,
+                "waste": waste
+            })
+
+        key = (sum(bar["stock_length"] for bar in bars), len(bars))
+        if best is None or key < best[0]:
+            best = (key, bars, optimal and len(lengths) == 1)
+
+    _key, bars, optimal = best
+    return frappe._dict(
+        method=method,
+        stock_lengths=lengths,
+        kerf=kerf,
+        end_trim=end_trim,
+        bar_count=len(bars),
+        offcut_count=len(offcut_bars),
+        bars=offcut_bars + bars,
+        oversize=oversize,
+        total_stock_length=flt(sum(bar["stock_length"] for bar in bars), 3),
+        total_waste=flt(sum(bar["waste"] for bar in offcut_bars + bars), 3),
+        lower_bound=lower_bound,
+        optimal=optimal
+    )
+
+
+def fill_offcuts(items, offcuts, kerf):
+    """Fill offcut pieces, longest first, with the fullest pattern of the open items.
+
+    `items` are cut lengths plus kerf. Offcuts have square ends, so no end
+    trim applies. Returns `(offcut_bars, remaining_items)`.
+    """
+    demand = Counter(items)
+    bars = []
+    for offcut in sorted(offcuts, key=lambda piece: flt(piece["length"]), reverse=True):
+        lengths = sorted((length for length, count in demand.items() if count), reverse=True)
+        if not lengths:
+            break
+
+        length = flt(offcut["length"])
+        take = max_fill_pattern(lengths, [demand[item] for item in lengths], length + kerf)
+        if not any(take):
+            continue
+
+        pattern = [item for item, count in zip(lengths, take) for _ in range(count)]
+        for item in pattern:
+            demand[item] -= 1
+        pieces = [flt(item - kerf, 6) for item in pattern]
+        used = sum(pieces)
+        waste = flt(max(length - sum(pattern), 0), 3)
+        bars.append({
+            "source": "Offcut",
+            "offcut": offcut,
+            "stock_length": length,
+            "cuts": pieces,
+            "used": flt(used, 3),
+            "kerf_loss": flt(length - used - waste, 3),
+            "end_trim": 0,
+            "waste": waste
+        })
+
+    remaining = sorted((item for item, count in demand.items() for _ in range(count)), reverse=True)
+    return bars, remaining
+
+
+def get_lower_bound(cuts, capacity):
+    """Martello-Toth L2 bound on the number of bars; never below ceil(total / capacity)."""
+    if not cuts:
+        return 0
+
+    bound = math.ceil(sum(cuts) / capacity - EPSILON)
+    half = capacity / 2
+    counts = Counter(cuts)
+    for k in [0] + sorted(size for size in counts if size <= half):
+        large = medium = 0
+        medium_sum = small_sum = 0.0
+        for size, count in counts.items():
+            if size > capacity - k + EPSILON:
+                large += count
+            elif size > half + EPSILON:
+                medium += count
+                medium_sum += size * count
+            elif size >= k - EPSILON:
+                small_sum += size * count
+        spare = medium * capacity - medium_sum
+        bound = max(bound, large + medium + max(0, math.ceil((small_sum - spare) / capacity - EPSILON)))
+    return bound
+
+
+def first_fit_decreasing(cuts, capacity):
+    """Put every cut (sorted descending) on the first bar it fits on.
+
+    The leaves of a max segment tree hold the remaining length of each bar,
+    unopened bars included, so the leftmost fitting bar is found in O(log n).
+    """
+    size = 1
+    while size < len(cuts):
+        size *= 2
+    tree = [capacity] * (2 * size)
+    patterns = []
+
+    for cut in cuts:
+        node = 1
+        while node < size:
+            node = 2 * node if tree[2 * node] >= cut - EPSILON else 2 * node + 1
+        bar = node - size
+        if bar == len(patterns):
+            patterns.append([])
+        patterns[bar].append(cut)
+
+        tree[node] -= cut
+        node //= 2
+        while node:
+            tree[node] = max(tree[2 * node], tree[2 * node + 1])
+            node //= 2
+
+    return patterns
+
+
+def best_fit_decreasing(cuts, capacity):
+    """Put every cut (sorted descending) on the open bar it leaves the least over on."""
+    remaining = []
+    patterns = []
+
+    for cut in cuts:
+        pos = bisect_left(remaining, (cut - EPSILON, -1))
+        if pos < len(remaining):
+            rest, bar = remaining.pop(pos)
+        else:
+            rest, bar = capacity, len(patterns)
+            patterns.append([])
+        patterns[bar].append(cut)
+        insort(remaining, (rest - cut, bar))
+
+    return patterns
+
+
+def max_fill_pattern(lengths, counts, capacity, node_limit=PATTERN_NODE_LIMIT):
+    """Return how many of each length (descending, `counts` available) fill one bar the most.
+
+    Branch and bound over the distinct lengths: a branch is dropped when all
+    the length still available cannot beat the best fill, and the search
+    stops at a perfect fit or after `node_limit` nodes.
+    """
+    n = len(lengths)
+    negated = [-length for length in lengths]
+    suffix = [0.0] * (n + 1)
+    for i in range(n - 1, -1, -1):
+        suffix[i] = suffix[i + 1] + lengths[i] * counts[i]
+
+    take = [0] * n
+    best = [0.0, [0] * n]
+    nodes = [0]
+
+    def search(start, used):
+        nodes[0] += 1
+        if used > best[0] + EPSILON:
+            best[0], best[1] = used, list(take)
+            if capacity - used < EPSILON:
+                return True
+        if nodes[0] > node_limit:
+            return False
+
+        # Skip straight to the longest length that still fits
+        j = max(start, bisect_left(negated, -(capacity - used) - EPSILON))
+        while j < n:
+            if used + suffix[j] <= best[0] + EPSILON:
+                return False
+            k = min(counts[j], int((capacity - used + EPSILON) // lengths[j]))
+            while k >= 1:
+                take[j] = k
+                if search(j + 1, used + k * lengths[j]):
+                    return True
+                k -= 1
+            take[j] = 0
+            j += 1
+        return False
+
+    search(0, 0.0)
+    return best[1]
+
+
+def pattern_fill(cuts, capacity, deadline):
+    """Repeatedly cut the fullest bar pattern as often as the remaining cuts allow.
+
+    Returns None when the deadline passes first.
+    """
+    demand = Counter(cuts)
+    lengths = sorted(demand, reverse=True)
+    counts = [demand[length] for length in lengths]
+    patterns = []
+
+    while any(counts):
+        if time.perf_counter() > deadline:
+            return None
+        open_idx = [i for i, count in enumerate(counts) if count]
+        open_lengths = [lengths[i] for i in open_idx]
+        open_counts = [counts[i] for i in open_idx]
+
+        take = max_fill_pattern(open_lengths, open_counts, capacity)
+        repeats = min(open_counts[j] // t for j, t in enumerate(take) if t)
+        pattern = [open_lengths[j] for j, t in enumerate(take) for _ in range(t)]
+        for j, t in enumerate(take):
+            counts[open_idx[j]] -= t * repeats
+        patterns.extend(list(pattern) for _ in range(repeats))
+
+    return patterns
+
+
+def branch_and_bound(cuts, capacity, lower_bound, time_budget):
+    """Search for the fewest bars within `time_budget` seconds.
+
+    The incumbent is the best of FFD, BFD and `pattern_fill`. Small
+    instances then get an exact depth-first search: cuts are placed in
+    descending order, trying the tightest open bar first and each distinct
+    remaining length only once, and a branch is dropped when the bars
+    already open plus the bars the unplaced length still needs reach the
+    incumbent. Returns `(patterns, optimal)`.
+    """
+    deadline = time.perf_counter() + time_budget
+    best = min(first_fit_decreasing(cuts, capacity), best_fit_decreasing(cuts, capacity), key=len)
+    if len(best) <= lower_bound:
+        return best, True
+
+    filled = pattern_fill(cuts, capacity, deadline)
+    if filled is not None and len(filled) < len(best):
+        best = filled
+    if len(best) <= lower_bound:
+        return best, True
+    if len(cuts) > EXACT_SEARCH_LIMIT:
+        return best, False
+
+    suffix = [0.0] * (len(cuts) + 1)
+    for i in range(len(cuts) - 1, -1, -1):
+        suffix[i] = suffix[i + 1] + cuts[i]
+
+    remaining = []
+    patterns = []
+
+    def candidates(depth):
+        free = sum(remaining)
+        needed = max(0, math.ceil((suffix[depth] - free) / capacity - EPSILON))
+        if len(patterns) + needed >= len(best):
+            return []
+
+        cut = cuts[depth]
+        seen = set()
+        choices = []
+        for bar in sorted(range(len(remaining)), key=remaining.__getitem__):
+            rest = round(remaining[bar], 6)
+            if remaining[bar] >= cut - EPSILON and rest not in seen:
+                seen.add(rest)
+                choices.append(bar)
+        if len(patterns) + 1 < len(best):
+            choices.append(None)
+        return choices
+
+    # Each frame is [choices for cuts[depth], next choice, bar the cut went on]
+    frames = [[candidates(0), 0, None]]
+    optimal = True
+    while frames:
+        if time.perf_counter() > deadline:
+            optimal = False
+            break
+
+        depth = len(frames) - 1
+        frame = frames[-1]
+        if frame[2] is not None:
+            bar = frame[2]
+            remaining[bar] += patterns[bar].pop()
+            if not patterns[bar]:
+                patterns.pop()
+                remaining.pop()
+            frame[2] = None
+
+        if frame[1] >= len(frame[0]):
+            frames.pop()
+            continue
+
+        bar = frame[0][frame[1]]
+        frame[1] += 1
+        cut = cuts[depth]
+        if bar is None:
+            bar = len(patterns)
+            patterns.append([])
+            remaining.append(capacity)
+        patterns[bar].append(cut)
+        remaining[bar] -= cut
+        frame[2] = bar
+
+        if depth + 1 == len(cuts):
+            best = [list(pattern) for pattern in patterns]
+            if len(best) <= lower_bound:
+                break
+        else:
+            frames.append([candidates(depth + 1), 0, None])
+
+    return best, optimal
+
+
+def get_required_cuts(raw_materials):
+    """Group the cut lengths of FG Raw Material Item rows by item code.
+
+    `dimension` holds comma-separated lengths; each is cut `quantity` times.
+    """
+    cuts = defaultdict(list)
+    for row in raw_materials:
+        if row.dimension and flt(row.quantity) > 0:
+            dims = [flt(v.strip()) for v in row.dimension.split(',') if v.strip()]
+            cuts[row.item_code].extend(dims * int(flt(row.quantity)))
+    return cuts
+
+
+def make_cutting_settings(default_stock_length=STANDARD_STOCK_LENGTH, kerf=0, end_trim=0, method="ffd", stock_lengths=None, offcut_warehouse=None):
+    """Build the settings `plan_cutting()` reads; `stock_lengths` maps item codes to their bar lengths."""
+    return frappe._dict(
+        default_stock_length=flt(default_stock_length) or STANDARD_STOCK_LENGTH,
+        kerf=flt(kerf),
+        end_trim=flt(end_trim),
+        method=method or "ffd",
+        stock_lengths=stock_lengths or {},
+        offcut_warehouse=offcut_warehouse
+    )
+
+
+def get_cutting_settings():
+    settings = frappe.get_cached_doc("Cutting Settings")
+    stock_lengths = defaultdict(list)
+    for row in settings.stock_lengths:
+        stock_lengths[row.item_code].append(flt(row.stock_length))
+
+    return make_cutting_settings(
+        settings.default_stock_length, settings.kerf, settings.end_trim, settings.cutting_method, stock_lengths,
+        settings.offcut_warehouse
+    )
+
+
+def get_stock_lengths(item_code, settings):
+    return settings.stock_lengths.get(item_code) or [settings.default_stock_length]
+
+
+def get_offcut_pieces(item_codes, warehouse):
+    """Return `{item_code: [piece, ...]}` for the offcuts lying in `warehouse`.
+
+    Pieces are rebuilt from the Stock Ledger Entries that carry a length:
+    receipts add pieces and issues take the oldest piece of the same length,
+    so every remaining piece points at the entry that brought it in.
+    """
+    item_codes = list(item_codes)
+    if not item_codes or not warehouse:
+        return {}
+
+    entries = frappe.get_all(
+        "Stock Ledger Entry",
+        filters={
+            "warehouse": warehouse,
+            "item_code": ["in", item_codes],
+            "is_cancelled": 0,
+            "custom_length": [">", 0]
+        },
+        fields=["name", "item_code", "custom_length", "actual_qty", "voucher_type", "voucher_no"],
+        order_by="posting_date asc, posting_time asc, creation asc"
+    )
+
+    stacks = defaultdict(list)
+    for entry in entries:
+        key = (entry.item_code, flt(entry.custom_length, 3))
+        qty = int(flt(entry.actual_qty))
+        if qty > 0:
+            stacks[key].extend(
+                {
+                    "item_code": entry.item_code,
+                    "length": key[1],
+                    "warehouse": warehouse,
+                    "stock_ledger_entry": entry.name,
+                    "voucher_type": entry.voucher_type,
+                    "voucher_no": entry.voucher_no
+                }
+                for _i in range(qty)
+            )
+        elif qty < 0:
+            del stacks[key][:-qty]
+
+    pieces = defaultdict(list)
+    for (item_code, _length), stack in stacks.items():
+        pieces[item_code].extend(stack)
+    return pieces
+
+
+def plan_cutting(raw_materials, method=None, settings=None, time_budget=None, use_offcuts=False, offcuts=None):
+    """Return `{item_code: plan}` for the rows of an FG Raw Material Selector.
+
+    Stock lengths, kerf, end trim and the default method come from Cutting
+    Settings unless `settings` is given. For `bnb` the time budget is shared
+    by all items. With `use_offcuts` the pieces in the offcut warehouse, or
+    the `{item_code: pieces}` given in `offcuts`, are cut first.
+    """
+    if settings is None:
+        settings = get_cutting_settings()
+    method = method or settings.method
+    if time_budget is None:
+        time_budget = flt(frappe.conf.get("sb_cutting_time_budget")) or DEFAULT_TIME_BUDGET
+    deadline = time.perf_counter() + time_budget
+
+    required_cuts = get_required_cuts(raw_materials)
+    if use_offcuts and offcuts is None:
+        from sb.sb.offcut_index import get_offcut_index
+
+        index = get_offcut_index()
+        offcuts = {item_code: index.get_pieces(item_code, settings.offcut_warehouse) for item_code in required_cuts}
+
+    plans = {}
+    for item_code, cuts in required_cuts.items():
+        if cuts:
+            budget = max(0.0, deadline - time.perf_counter())
+            plans[item_code] = pack(
+                cuts, get_stock_lengths(item_code, settings), method, budget, settings.kerf, settings.end_trim,
+                offcuts=(offcuts or {}).get(item_code) if use_offcuts else None
+            )
+    return plans
+
+
+def get_required_bars(item_code, plans, total_length, settings):
+    """Bars to reserve or buy for an item, from its cutting plan.
+
+    Rows whose quantity does not give whole pieces have no plan; they fall
+    back to the total length over the default stock length.
+    """
+    plan = plans.get(item_code)
+    if plan:
+        return plan.bar_count
+    return math.ceil(flt(total_length) / settings.default_stock_length)
+
+
+def summarize_offcuts(plans):
+    """Count the leftover length of every bar per item, longest first."""
+    report_data = []
+    for item_code, plan in plans.items():
+        length_counts = Counter(bar["waste"] for bar in plan.bars if bar["waste"] > EPSILON)
+        for length, qty in length_counts.items():
+            report_data.append({"rm": item_code, "remaining_length": length, "quantity": qty})
+
+    report_data.sort(key=lambda x: (x['rm'], -x['remaining_length']))
+    return report_data
@@ -0,0 +1,15 @@
+# Copyright (c) 2025, ptpratul2@gmail.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils import flt
+
+
+class CuttingSettings(Document):
+	def validate(self):
+		lengths = [flt(self.default_stock_length)] + [flt(row.stock_length) for row in self.stock_lengths]
+		for length in lengths:
+			if length <= flt(self.end_trim):
+				frappe.throw(_("Stock length {0} must be longer than the end trim {1}.").format(length, self.end_trim))
@@ -0,0 +1,76 @@
+# Copyright (c) 2025, ptpratul2@gmail.com and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from sb.sb.cutting import get_offcut_pieces, make_cutting_settings, pack, plan_cutting, summarize_offcuts
+
+
+class TestCuttingSettings(FrappeTestCase):
+	def test_cutting_methods(self):
+		# FFD pairs 2410 with 1928 and needs a third bar; 2410+1446+964 and 1928+1928+964 fill two exactly
+		cuts = [2410, 1928, 1928, 1446, 964, 964]
+		self.assertEqual(pack(cuts, 4820, "ffd").bar_count, 3)
+		self.assertEqual(pack(cuts, 4820, "bfd").bar_count, 3)
+
+		plan = pack(cuts + [5000], 4820, "bnb", time_budget=5)
+		self.assertEqual((plan.bar_count, plan.lower_bound, plan.optimal), (2, 2, True))
+		self.assertEqual(plan.oversize, [5000])
+		self.assertEqual(sorted(cut for bar in plan.bars for cut in bar["cuts"]), sorted(cuts))
+		self.assertEqual([bar["waste"] for bar in plan.bars], [0, 0])
+
+	def test_offcut_summary(self):
+		rows = [
+			frappe._dict(item_code="RM-1", dimension="2400", quantity=3),
+			frappe._dict(item_code="RM-1", dimension="1000,", quantity=1),
+			frappe._dict(item_code="RM-2", dimension="", quantity=5),
+		]
+		plans = plan_cutting(rows, "ffd", make_cutting_settings())
+		self.assertEqual(list(plans), ["RM-1"])
+		self.assertEqual(plans["RM-1"].bar_count, 2)
+		self.assertEqual(summarize_offcuts(plans), [
+			{"rm": "RM-1", "remaining_length": 1420.0, "quantity": 1},
+			{"rm": "RM-1", "remaining_length": 20.0, "quantity": 1},
+		])
+
+	def test_kerf_trim_and_stock_lengths(self):
+		bar = pack([2400, 2400], 4820, kerf=5).bars[0]
+		self.assertEqual((bar["used"], bar["kerf_loss"], bar["waste"]), (4800, 10, 10))
+
+		# The last piece needs no kerf when it ends flush with the bar
+		self.assertEqual(pack([2400, 2400], 4820, kerf=15).bar_count, 1)
+		self.assertEqual(pack([2400, 2400], 4820, end_trim=30).bar_count, 2)
+
+		plan = pack([3000, 3000, 2900], [4820, 6000])
+		self.assertEqual([bar["stock_length"] for bar in plan.bars], [6000, 4820])
+		self.assertEqual(plan.total_stock_length, 10820)
+
+		settings = make_cutting_settings(kerf=5, stock_lengths={"RM-1": [6000]})
+		plans = plan_cutting([frappe._dict(item_code="RM-1", dimension="2000", quantity=3)], settings=settings)
+		self.assertEqual((plans["RM-1"].bar_count, plans["RM-1"].bars[0]["waste"]), (2, 1990))
+
+	def test_offcuts_first(self):
+		offcuts = [{"length": 1000, "stock_ledger_entry": "SLE-1"}, {"length": 2500, "stock_ledger_entry": "SLE-2"}]
+		plan = pack([2400, 1900, 900, 600], 4820, offcuts=offcuts)
+		self.assertEqual((plan.offcut_count, plan.bar_count), (2, 1))
+		self.assertEqual([bar["offcut"]["stock_ledger_entry"] for bar in plan.bars[:2]], ["SLE-2", "SLE-1"])
+		self.assertEqual([bar["cuts"] for bar in plan.bars], [[1900, 600], [900], [2400]])
+		self.assertEqual(plan.total_stock_length, 4820)
+
+		# Receipts add pieces, issues take the oldest piece of that length
+		entries = [
+			frappe._dict(name="SLE-1", item_code="RM-1", custom_length=1500, actual_qty=2, voucher_type="Stock Entry", voucher_no="SE-1"),
+			frappe._dict(name="SLE-2", item_code="RM-1", custom_length=1500, actual_qty=1, voucher_type="Stock Entry", voucher_no="SE-2"),
+			frappe._dict(name="SLE-3", item_code="RM-1", custom_length=1500, actual_qty=-2, voucher_type="Stock Entry", voucher_no="SE-3"),
+		]
+		with patch("frappe.get_all", return_value=entries):
+			pieces = get_offcut_pieces(["RM-1"], "Off-Cut - VD")
+		self.assertEqual([piece["stock_ledger_entry"] for piece in pieces["RM-1"]], ["SLE-2"])
+
+		settings = make_cutting_settings(offcut_warehouse="Off-Cut - VD")
+		rows = [frappe._dict(item_code="RM-1", dimension="1400", quantity=2)]
+		plans = plan_cutting(rows, settings=settings, use_offcuts=True, offcuts=pieces)
+		self.assertEqual((plans["RM-1"].offcut_count, plans["RM-1"].bar_count), (1, 1))
@@ -25,9 +25,20 @@ frappe.ui.form.on('FG Raw Material Selector', {
             }).addClass('btn-primary');
         }
 
+        // Listen for per-chunk progress of the background jobs
+        frappe.realtime.off('fg_materials_progress');
+        frappe.realtime.on('fg_materials_progress', function (data) {
+            if (frm.doc.name === data.docname) {
+                frappe.show_progress(__('Processing FG Codes'), data.completed, data.total,
+                    __('{0} of {1} chunks processed', [data.completed, data.total]));
+            }
+        });
+
         // Listen for real-time job completion
+        frappe.realtime.off('fg_materials_done');
         frappe.realtime.on('fg_materials_done', function (data) {
             if (frm.doc.name === data.docname) {
+                frappe.hide_progress();
                 frappe.show_alert({ message: __('FG Raw Material processing is complete.'), indicator: 'green' });
                 frm.reload_doc();
             }
@@ -7,725 +7,379 @@ from frappe import _
 from frappe.model.document import Document
 import json
 from frappe.utils.background_jobs import enqueue
-from frappe.utils import flt
+from frappe.utils import cint, flt, get_datetime
 import math
 from collections import defaultdict
 
+from sb.sb.bulk_write import delete_child_rows, get_max_idx, insert_child_rows, touch_parent, update_rows
+from sb.sb.cutting import get_cutting_settings, get_required_bars, plan_cutting, summarize_offcuts
+from sb.sb.fg_expansion_cache import get_expansion_cache
+from sb.sb.fg_rules import FG_SECTION_MAP, parse_fg_code
+from sb.sb.stock_availability import RESERVATION_WAREHOUSES, get_soft_reserved_qtys, get_stock_snapshot
+from sb.sb.stock_locks import lock_available, retry_on_deadlock
+from sb.sb.uom import get_conversion_factor
+from sb.sb.tracing import get_tracer
+
+# FG components per background job when a selector is fanned out
+FG_CHUNK_SIZE = 500
+CHUNK_RESULT_EXPIRY = 6 * 60 * 60
+
+# FG Components fields read by iter_raw_materials, shipped to the chunk jobs
+FG_COMPONENT_FIELDS = ("name", "fg_code", "quantity", "uom", "ipo_name", "a", "b", "code", "l1", "l2")
+
+# Rows without a priority are reserved after every prioritised row
+LOWEST_RESERVATION_PRIORITY = 99
+RESERVATION_FIELDS = ("status", "reserve_tag", "warehouse", "available_quantity")
+
 class FGRawMaterialSelector(Document):
+    @property
+    def tracer(self):
+        if getattr(self, "_tracer", None) is None:
+            self._tracer = get_tracer("fg_selector", self)
+        return self._tracer
+
     def validate(self):
-        frappe.log_error(
-            message=f"Validating FG Raw Material Selector: {self.name}",
-            title="FG Validation Debug"
-        )
-        pass
+        self.tracer.debug("Validating FG Raw Material Selector: %s", self.name)
 
-    def process_fg_codes(self):
+    def process_fg_codes(self, fg_codes_all=None, plan=None):
+        """Expand and write the FG components of the Planning BOMs in `plan` in this worker."""
+        tracer = self.tracer
         try:
-            frappe.log_error(
-                message=f"Starting process_fg_codes for document: {self.name}",
-                title="FG Process Debug"
-            )
+            tracer.info("Starting process_fg_codes for document: %s", self.name)
+            if plan is None:
+                plan = self.get_expansion_plan()
+            if fg_codes_all is None:
+                fg_codes_all = self.collect_fg_components(plan.expand)
+            plan.clear_all = plan.full and bool(fg_codes_all)
+            if plan.full and not fg_codes_all:
+                tracer.info("No FG codes to process. Skipping raw_materials clear.")
+
+            self.expansion_cache_hits = 0
+            self.expansion_cache_misses = 0
+            self.save_raw_materials(self.iter_raw_materials(fg_codes_all), plan)
 
-            # Collect Planning BOM names from planning_bom child table
-            pbom_names = [row.get("planning_bom") for row in self.planning_bom if row.get("planning_bom")]
-            frappe.log_error(
-                message=f"Processing Planning BOMs: {json.dumps(pbom_names, indent=2)}",
-                title="FG Process Debug"
+        except Exception as e:
+            tracer.error("Error in process_fg_codes: %s", e, title="FG Raw Material Error")
+            frappe.publish_realtime(
+                event='msgprint',
+                message=f'Error processing FG codes: {str(e)}',
+                user=frappe.session.user
             )
 
-            # if not self.planning_bom or not isinstance(self.planning_bom, list):
-            #     frappe.log_error(
-            #         message="No Planning BOMs selected or invalid format.",
-            #         title="FG Raw Material Error"
-            #     )
-            #     frappe.throw("No Planning BOMs selected or invalid format.")
-
-            output = []
-
-            valid_fg_codes = (
-                ["B", "CP", "CPP", "CPPP", "D", "K", "PC", "PH", "PLB", "SB",
-                 "T", "TS", "W", "WR", "WRB", "WRS", "WS", "WX", "WXS"] +
-                ["BC", "BCE", "KC", "KCE", "BCY", "KCY", "BCZ", "KCZ"] +
-                ["CC", "CCL", "CCR", "IC", "ICB", "ICXB", "ICT", "ICX",
-                 "LS", "LSK", "LSL", "LSR", "LSW", "SL", "SLR"] +
-                ["SC", "SCE", "SCY", "SCZ", "LSC", "LSCE", "LSCK", "LSCEK", "LSCY", "LSCZ"] +
-                ["JL", "JLB", "JLT", "JLX", "JR", "JRB", "JRT", "JRX",
-                 "SX", "LSX", "LSXK"] +
-                ["SXC", "SXCE", "SXCY", "SXCZ", "LSXC", "LSXCE", "LSXCK", "LSXCEK"] +
-                ["PCE", "SBE", "TSE", "WRBSE", "WRSE", "WSE", "WXSE"] +
-                ["DP", "EB", "MB", "EC", "ECH", "ECT", "ECX", "ECB",
-                 "ECK", "RK"]
+    def enqueue_fg_code_chunks(self):
+        """Fan the FG components out to one `long` queue job per chunk.
+
+        Small selectors are processed inline. Otherwise the last chunk to
+        finish enqueues `merge_fg_code_chunks`, which writes the rows in
+        chunk order, so the result matches `process_fg_codes`.
+        """
+        plan = self.get_expansion_plan()
+        fg_codes_all = self.collect_fg_components(plan.expand)
+        chunk_size = cint(frappe.conf.get("sb_fg_chunk_size")) or FG_CHUNK_SIZE
+        if len(fg_codes_all) <= chunk_size:
+            # Supersede any run still in flight, so its merge cannot overwrite this result
+            frappe.cache().delete_value(get_run_key(self.name))
+            self.process_fg_codes(fg_codes_all, plan)
+            return None
+
+        plan.clear_all = plan.full
+        run_id = frappe.generate_hash(length=10)
+        frappe.cache().set_value(get_run_key(self.name), run_id, expires_in_sec=CHUNK_RESULT_EXPIRY)
+        frappe.cache().set_value(get_plan_key(run_id), plan, expires_in_sec=CHUNK_RESULT_EXPIRY)
+
+        chunks = [fg_codes_all[i:i + chunk_size] for i in range(0, len(fg_codes_all), chunk_size)]
+        for chunk_index, chunk in enumerate(chunks):
+            frappe.enqueue(
+                'sb.sb.doctype.fg_raw_material_selector.fg_raw_material_selector.process_fg_code_chunk',
+                queue='long',
+                timeout=3600,
+                docname=self.name,
+                run_id=run_id,
+                chunk_index=chunk_index,
+                chunk_count=len(chunks),
+                components=[
+                    ({field: fg_component.get(field) for field in FG_COMPONENT_FIELDS}, pbom_project, pbom_name)
+                    for fg_component, pbom_project, pbom_name in chunk
+                ]
             )
 
-            batch_size = 100
-            fg_codes_all = []
+        self.tracer.info("Enqueued %s chunks of %s FG components for %s (run %s)", len(chunks), len(fg_codes_all), self.name, run_id)
+        return run_id
 
-            for pbom_entry in self.planning_bom:
-                pbom_name = pbom_entry.get("planning_bom")
-                if not pbom_name or not isinstance(pbom_name, str):
-                    frappe.log_error(
-                        message=f"Invalid Planning BOM name: {pbom_name}",
-                        title="FG Raw Material Error"
-                    )
-                    continue
+    def get_expansion_plan(self):
+        """Work out which Planning BOMs to expand and whose raw material rows are stale.
 
-                try:
-                    pbom_doc = frappe.get_doc("Planning BOM", pbom_name)
-                    frappe.log_error(
-                        message=f"Fetched Planning BOM: {pbom_name}",
-                        title="FG Process Debug"
-                    )
-                except frappe.DoesNotExistError:
-                    frappe.log_error(
-                        message=f"Planning BOM {pbom_name} not found",
-                        title="FG Raw Material Error"
-                    )
-                    continue
+        With `incremental_update` only the PBOMs whose `modified` differs from
+        the `expanded_modified` stamped on their selector row are expanded,
+        and rows of PBOMs that are no longer selected are dropped. Without it
+        every selected PBOM is expanded and the whole table is rebuilt.
+        """
+        selected = {
+            row.planning_bom: row for row in self.planning_bom
+            if row.get("planning_bom") and isinstance(row.planning_bom, str)
+        }
+        modified = {}
+        if selected:
+            modified = dict(frappe.get_all(
+                "Planning BOM", filters={"name": ["in", list(selected)]}, fields=["name", "modified"], as_list=True
+            ))
+
+        if not self.incremental_update:
+            return frappe._dict(full=True, expand=list(selected), stale=[], modified=modified)
+
+        expand = [
+            pbom_name for pbom_name, row in selected.items()
+            if pbom_name in modified
+            and (not row.expanded_modified or get_datetime(row.expanded_modified) != get_datetime(modified[pbom_name]))
+        ]
+        expanded = frappe.get_all(
+            "FG Raw Material Item",
+            filters={"parent": self.name, "parenttype": self.doctype, "parentfield": "raw_materials"},
+            pluck="planning_bom",
+            distinct=True
+        )
+        stale = [pbom_name for pbom_name in expanded if pbom_name not in modified or pbom_name in expand]
+        self.tracer.info("Expansion plan for %s: expand %s, drop rows of %s", self.name, expand, stale)
+        return frappe._dict(full=False, expand=expand, stale=stale, modified=modified)
+
+    def collect_fg_components(self, pbom_names=None):
+        """Return `(fg_component, project, planning_bom)` for every FG component of the selected Planning BOMs.
+
+        `pbom_names` narrows the selection; the selector's row order is kept.
+        """
+        tracer = self.tracer
+        tracer.debug("Processing Planning BOMs: %s", pbom_names)
+
+        fg_codes_all = []
+        for pbom_entry in self.planning_bom:
+            pbom_name = pbom_entry.get("planning_bom")
+            if not pbom_name or not isinstance(pbom_name, str):
+                tracer.warning("Invalid Planning BOM name: %s", pbom_name)
+                continue
+            if pbom_names is not None and pbom_name not in pbom_names:
+                continue
 
-                pbom_project = pbom_doc.get("project")
-                pbom_items = pbom_doc.get("items", [])
-
-                pbom_items_serializable = [
-                    {
-                        "fg_code": fg.get("fg_code"),
-                        "quantity": fg.get("quantity"),
-                        "uom": fg.get("uom"),
-                        "ipo_name": fg.get("ipo_name"),
-                        "a": fg.get("a"),
-                        "b": fg.get("b"),
-                        "code": fg.get("code"),
-                        "l1": fg.get("l1"),
-                        "l2": fg.get("l2"),
-                        "u_area": fg.get("u_area")
-                    } for fg in pbom_items
-                ]
-                frappe.log_error(
-                    message=f"FG Codes for PBOM {pbom_name}: {json.dumps(pbom_items_serializable, indent=2)}",
-                    title="FG Process Debug"
-                )
-
-                if not pbom_items:
-                    frappe.msgprint(f"No FG Components found for Planning BOM: {pbom_name}")
-                    frappe.log_error(
-                        message=f"No FG Components found for Planning BOM: {pbom_name}",
-                        title="FG Raw Material Error"
-                    )
-                    continue
+            try:
+                pbom_doc = frappe.get_doc("Planning BOM", pbom_name)
+                tracer.debug("Fetched Planning BOM: %s", pbom_name)
+            except frappe.DoesNotExistError:
+                tracer.warning("Planning BOM %s not found", pbom_name)
+                continue
 
-                fg_codes_all.extend([(fg_component, pbom_project, pbom_name) for fg_component in pbom_items])
+            pbom_project = pbom_doc.get("project")
+            pbom_items = pbom_doc.get("items", [])
+            tracer.debug("Planning BOM %s has %s FG Components", pbom_name, len(pbom_items))
 
-            if fg_codes_all:
-                self.raw_materials = []
-                frappe.log_error(
-                    message="Cleared existing raw_materials table.",
-                    title="FG Process Debug"
-                )
-            else:
-                frappe.log_error(
-                    message="No FG codes to process. Skipping raw_materials clear.",
-                    title="FG Process Debug"
-                )
-
-            # Process in batches
-            for i in range(0, len(fg_codes_all), batch_size):
-                batch = fg_codes_all[i:i + batch_size]
-                for fg_component, pbom_project, pbom_name in batch:
-                    fg_code = fg_component.get("fg_code")
-                    component_quantity = fg_component.get("quantity", 1)
-                    component_uom = fg_component.get("uom")
-                    ipo_name = fg_component.get("ipo_name")
-                    a = fg_component.get("a", 0)
-                    b = fg_component.get("b", 0)
-                    sec_code = fg_component.get("code", "")
-                    l1 = fg_component.get("l1", 0)
-                    l2 = fg_component.get("l2", 0)
-                    bom_qty = fg_component.get("quantity", 0)
-                    planning_bom_item_reference = fg_component.get("name")
-
-                    if not fg_code or not isinstance(fg_code, str):
-                        frappe.log_error(
-                            message=f"Invalid FG Code in PBOM: {pbom_name}, FG Code: {fg_code}",
-                            title="FG Raw Material Error"
-                        )
-                        continue
+            if not pbom_items:
+                frappe.msgprint(f"No FG Components found for Planning BOM: {pbom_name}")
+                tracer.warning("No FG Components found for Planning BOM: %s", pbom_name)
+                continue
 
-                    parts = fg_code.split('|')
-                    if len(parts) != 5 or parts[2] not in valid_fg_codes:
-                        frappe.log_error(
-                            message=f"Skipping invalid FG Code: {fg_code} in PBOM: {pbom_name}",
-                            title="FG Raw Material Error"
-                        )
-                        continue
+            fg_codes_all.extend([(fg_component, pbom_project, pbom_name) for fg_component in pbom_items])
 
-                    try:
-                        raw_materials = self.process_single_fg_code(fg_code)
-                        frappe.log_error(
-                            message=f"Processed FG Code {fg_code}: {json.dumps(raw_materials, indent=2)}",
-                            title="FG Process Debug"
-                        )
-                        if not isinstance(raw_materials, list):
-                            frappe.log_error(
-                                message=f"Invalid data for FG Code '{fg_code}': {raw_materials}",
-                                title="FG Raw Material Error"
-                            )
-                            continue
-                    except Exception as e:
-                        frappe.log_error(
-                            message=f"Error processing FG Code '{fg_code}' in PBOM {pbom_name}: {str(e)}",
-                            title="FG Raw Material Error"
-                        )
-                        continue
+        return fg_codes_all
 
-                    rm_table = []
-                    for rm in raw_materials:
-                        if not isinstance(rm, dict):
-                            frappe.log_error(
-                                message=f"Invalid raw material for FG Code '{fg_code}': {rm}",
-                                title="FG Raw Material Error"
-                            )
-                            continue
-
-                        rm_quantity = rm.get("quantity", 1) * component_quantity
-                        rm_entry = {
-                            "fg_code": fg_code,
-                            "raw_material_code": rm.get("code"),
-                            "item_code": rm.get("code"),
-                            "a": a,
-                            "b": b,
-                            "code": sec_code,
-                            "l1": l1,
-                            "l2": l2,
-                            "bom_qty": bom_qty,
-                            "dimension": rm.get("dimension"),
-                            "remark": rm.get("remark"),
-                            "quantity": rm_quantity,
-                            "project": pbom_project,
-                            "ipo_name": ipo_name,
-                            "planning_bom": pbom_name,
-                            "status": rm.get("status"),
-                            "warehouse": rm.get("warehouse"),
-                            "planning_bom_item_reference": planning_bom_item_reference
-                        }
-                        if component_uom:
-                            rm_entry["uom"] = component_uom
-
-                        rm_table.append(rm_entry)
-
-                        try:
-                            self.append("raw_materials", rm_entry)
-                            frappe.log_error(
-                                message=f"Appended raw material for FG Code '{fg_code}': {json.dumps(rm_entry, indent=2)}",
-                                title="FG Process Debug"
-                            )
-                        except Exception as e:
-                            frappe.log_error(
-                                message=f"Error appending raw material for FG Code '{fg_code}': {str(e)}",
-                                title="FG Raw Material Error"
-                            )
-                            continue
-
-                    output.append({
-                        "fg_code": fg_code,
-                        "planning_bom": pbom_name,
-                        "raw_materials": rm_table
-                    })
-
-            if output:
-                frappe.log_error(
-                    message=f"Processing output: {json.dumps(output, indent=2)}",
-                    title="FG Raw Material Output"
-                )
+    def save_raw_materials(self, processed_codes, plan):
+        """Drop the stale rows of `plan`, write the expanded rows, stamp the PBOMs and tell the client."""
+        tracer = self.tracer
+        stale = set(plan.stale)
+        if self.bulk_write:
+            start_idx = 1
+            if plan.clear_all:
+                delete_child_rows(self, "raw_materials")
             else:
-                frappe.msgprint("No valid FG codes processed. Check the Error Log for details.")
-                frappe.log_error(
-                    message="No valid FG codes processed.",
-                    title="FG Raw Material Error"
-                )
-
+                if stale - {None}:
+                    delete_child_rows(self, "raw_materials", {"planning_bom": ["in", list(stale - {None})]})
+                if None in stale:
+                    delete_child_rows(self, "raw_materials", {"planning_bom": ["is", "not set"]})
+                start_idx = get_max_idx(self, "raw_materials") + 1
+            output = self.write_raw_materials_bulk(processed_codes, replace=False, start_idx=start_idx)
+        else:
+            if plan.clear_all:
+                self.raw_materials = []
+            elif stale:
+                self.raw_materials = [row for row in self.raw_materials if row.planning_bom not in stale]
+                for idx, row in enumerate(self.raw_materials, start=1):
+                    row.idx = idx
+            output = self.append_raw_materials(processed_codes)
+
+        if output:
+            tracer.info("Processed %s FG codes for %s", len(output), self.name)
+        elif plan.expand:
+            frappe.msgprint("No valid FG codes processed. Check the Error Log for details.")
+            tracer.error("No valid FG codes processed for %s.", self.name, title="FG Raw Material Error")
+        else:
+            tracer.info("Raw materials of %s are up to date.", self.name)
+
+        for row in self.planning_bom:
+            if row.planning_bom in plan.expand:
+                row.expanded_modified = plan.modified[row.planning_bom]
+                if self.bulk_write:
+                    frappe.db.set_value(row.doctype, row.name, "expanded_modified", row.expanded_modified, update_modified=False)
+
+        if self.bulk_write:
+            touch_parent(self, {
+                "expansion_cache_hits": self.expansion_cache_hits,
+                "expansion_cache_misses": self.expansion_cache_misses
+            })
+        else:
             self.save()
 
-            frappe.publish_realtime(
-                event='fg_materials_done',
-                message='FG Raw Material processing completed successfully.',
-                user=frappe.session.user,
-                docname=self.name
-            )
+        frappe.publish_realtime(
+            event='fg_materials_done',
+            message={'docname': self.name, 'message': 'FG Raw Material processing completed successfully.'},
+            user=frappe.session.user,
+            docname=self.name
+        )
 
-        except Exception as e:
-            frappe.log_error(
-                message=f"Error in process_fg_codes: {str(e)}",
-                title="FG Raw Material Error"
-            )
-            frappe.publish_realtime(
-                event='msgprint',
-                message=f'Error processing FG codes: {str(e)}',
-                user=frappe.session.user
-            )
+    def iter_raw_materials(self, fg_codes_all, batch_size=100):
+        """Yield `(fg_code, planning_bom, rm_rows)` for every valid FG component.
+
+        Once exhausted, the expansion cache hits and misses of the run are
+        added to `expansion_cache_hits` / `expansion_cache_misses`.
+        """
+        tracer = self.tracer
+        cache_stats = get_expansion_cache().stats()
+        for i in range(0, len(fg_codes_all), batch_size):
+            batch = fg_codes_all[i:i + batch_size]
+            for fg_component, pbom_project, pbom_name in batch:
+                fg_code = fg_component.get("fg_code")
+                component_quantity = fg_component.get("quantity", 1)
+                component_uom = fg_component.get("uom")
+                ipo_name = fg_component.get("ipo_name")
+                a = fg_component.get("a", 0)
+                b = fg_component.get("b", 0)
+                sec_code = fg_component.get("code", "")
+                l1 = fg_component.get("l1", 0)
+                l2 = fg_component.get("l2", 0)
+                bom_qty = fg_component.get("quantity", 0)
+                planning_bom_item_reference = fg_component.get("name")
+
+                if not fg_code or not isinstance(fg_code, str):
+                    tracer.warning("Invalid FG Code in PBOM: %s, FG Code: %s", pbom_name, fg_code)
+                    continue
 
-    def process_single_fg_code(self, fg_code):
-        def safe_int(val, default=0):
-            try:
-                return int(val)
-            except (ValueError, TypeError):
-                return default
-        
-        fg_section_map = {
-            'B': 'CH SECTION', 'CP': 'CH SECTION', 'CPP': 'CH SECTION', 'CPPP': 'CH SECTION',
-            'D': 'CH SECTION', 'K': 'CH SECTION', 'PC': 'CH SECTION', 'PH': 'CH SECTION',
-            'PLB': 'CH SECTION', 'SB': 'CH SECTION', 'T': 'CH SECTION', 'TS': 'CH SECTION',
-            'W': 'CH SECTION', 'WR': 'CH SECTION', 'WRB': 'CH SECTION', 'WRS': 'CH SECTION',
-            'WS': 'CH SECTION', 'WX': 'CH SECTION', 'WXS': 'CH SECTION',
-            'BC': 'CH SECTION CORNER', 'BCE': 'CH SECTION CORNER', 'KC': 'CH SECTION CORNER',
-            'KCE': 'CH SECTION CORNER', 'BCY': 'CH SECTION CORNER', 'BCZ': 'CH SECTION CORNER',
-            'KCY': 'CH SECTION CORNER', 'KCZ': 'CH SECTION CORNER',
-            'CC': 'IC SECTION', 'CCL': 'IC SECTION', 'CCR': 'IC SECTION', 'IC': 'IC SECTION',
-            'ICB': 'IC SECTION', 'ICT': 'IC SECTION', 'ICX': 'IC SECTION', 'ICXB': 'IC SECTION',
-            'LS': 'IC SECTION', 'LSK': 'IC SECTION', 'LSL': 'IC SECTION', 'LSR': 'IC SECTION',
-            'LSW': 'IC SECTION', 'SL': 'IC SECTION', 'SLR': 'IC SECTION',
-            'SC': 'IC SECTION CORNER', 'SCE': 'IC SECTION CORNER', 'SCY': 'IC SECTION CORNER',
-            'SCZ': 'IC SECTION CORNER', 'LSC': 'IC SECTION CORNER', 'LSCE': 'IC SECTION CORNER',
-            'LSCK': 'IC SECTION CORNER', 'LSCEK': 'IC SECTION CORNER', 'LSCY': 'IC SECTION CORNER',
-            'LSCZ': 'IC SECTION CORNER',
-            'JL': 'J SECTION', 'JLB': 'J SECTION', 'JLT': 'J SECTION', 'JLX': 'J SECTION',
-            'JR': 'J SECTION', 'JRB': 'J SECTION', 'JRT': 'J SECTION', 'JRX': 'J SECTION',
-            'SX': 'J SECTION', 'LSX': 'J SECTION', 'LSXK': 'J SECTION',
-            'SXC': 'J SECTION CORNER', 'SXCE': 'J SECTION CORNER', 'SXCY': 'J SECTION CORNER',
-            'SXCZ': 'J SECTION CORNER', 'LSXC': 'J SECTION CORNER', 'LSXCK': 'J SECTION CORNER',
-            'LSXCE': 'J SECTION CORNER', 'LSXCEK': 'J SECTION CORNER',
-            'PCE': 'T SECTION', 'SBE': 'T SECTION', 'TSE': 'T SECTION', 'WRBSE': 'T SECTION',
-            'WRSE': 'T SECTION', 'WSE': 'T SECTION', 'WXSE': 'T SECTION',
-            'DP': 'MISC SECTION', 'EB': 'MISC SECTION', 'MB': 'MISC SECTION',
-            'EC': 'MISC SECTION', 'ECH': 'MISC SECTION', 'ECT': 'MISC SECTION',
-            'ECX': 'MISC SECTION', 'ECB': 'MISC SECTION', 'ECK': 'MISC SECTION', 'RK': 'MISC SECTION'
-        }
-        
-        try:
-            frappe.log_error(message=f"Processing FG Code: {fg_code}", title="FG Single Code Debug")
-            parts = fg_code.split('|')
-            if len(parts) != 5:
-                frappe.log_error(message=f"Invalid FG Code format. Expected 5 parts, got {len(parts)}: {fg_code}", title="FG Raw Material Error")
-                return []
-            frappe.log_error(message=f"Server-Side Parts: {parts}", title="FG Single Code Debug")
-            a = safe_int(parts[0])
-            b = safe_int(parts[1]) if parts[1] else 0
-            fg_code_part = parts[2]
-            l1 = safe_int(parts[3])
-            l2 = safe_int(parts[4]) if parts[4] else 0
-            frappe.log_error(message=f"Parsed: A={a}, B={b}, FG_CODE={fg_code_part}, L1={l1}, L2={l2}", title="FG Single Code Debug")
-        except Exception as e:
-            frappe.log_error(message=f"Error parsing FG Code: {str(e)}", title="FG Raw Material Error")
-            return []
+                parts = fg_code.split('|')
+                if len(parts) != 5 or parts[2] not in FG_SECTION_MAP:
+                    tracer.warning("Skipping invalid FG Code: %s in PBOM: %s", fg_code, pbom_name)
+                    continue
 
-        # Define FG groups
-        ch_straight = ["B", "CP", "CPP", "CPPP", "D", "K", "PC", "PH", "PLB", "SB", "T", "TS", "W", "WR", "WRS", "WRB", "WS", "WX", "WXS"]
-        ch_corner = ["BC", "BCE", "BCY", "KC", "KCE", "BCZ", "KCY", "KCZ"]
-        ic_straight = ["CC", "CCL", "CCR", "IC", "ICB", "ICT", "ICX", "ICXB", "LSK", "LS", "LSL", "LSR", "LSW", "SL", "SLR"]
-        ic_corner = ["SC", "SCE", "SCY", "SCZ", "LSC", "LSCE", "LSCK", "LSCEK", "LSCY", "LSCZ"]
-        j_straight = ["JL", "JLB", "JLT", "JLX", "JR", "JRB", "JRT", "JRX", "SX", "LSX", "LSXK"]
-        j_corner = ["SXC", "SXCE", "SXCY", "SXCZ", "LSXC", "LSXCE", "LSXCK", "LSXCEK"]
-        t_straight = ["PCE", "SBE", "TSE", "WRBSE", "WRSE", "WSE", "WXSE"]
-        misc_straight = ["DP", "EB", "MB", "EC", "ECH", "ECT", "ECX", "ECK", "ECB", "RK"]
-
-        # Channel section mappings
-        ch_sections = {
-            50: "50 CH", 75: "75 CH", 100: "100 CH", 125: "125 CH",
-            150: "150 CH", 175: "175 CH", 200: "200 CH", 250: "250 CH",
-            300: "300 CH", 350: "350 CH", 400: "400 CH", 600: "600 CH"
-        }
+                try:
+                    raw_materials = self.process_single_fg_code(fg_code)
+                    tracer.debug("Processed FG Code %s: %s raw materials", fg_code, len(raw_materials))
+                    if not isinstance(raw_materials, list):
+                        tracer.error("Invalid data for FG Code '%s': %s", fg_code, raw_materials, title="FG Raw Material Error")
+                        continue
+                except Exception as e:
+                    tracer.error("Error processing FG Code '%s' in PBOM %s: %s", fg_code, pbom_name, e, title="FG Raw Material Error")
+                    continue
 
-        # IC section mappings for exact matches
-        ic_sections = {
-            (100, 100): ("100 IC", "-"),
-            (125, 100, "SL"): ("125 SL", "-"),
-            (100, 125, "SL"): ("125 SL", "-"),
-            (125, 100, "CC"): ("125 SL", "-"),
-            (100, 125, "CC"): ("125 SL", "-"),
-            (125, 100, "CCR"): ("125 SL", "-"),
-            (125, 100, "CCL"): ("125 SL", "-"),
-            (125, 100): ("125 IC", "-"),
-            (150, 100): ("150 IC", "-"),
-            (100, 150): ("150 IC", "-")
-        }
+                rm_table = []
+                for rm in raw_materials:
+                    if not isinstance(rm, dict):
+                        tracer.error("Invalid raw material for FG Code '%s': %s", fg_code, rm, title="FG Raw Material Error")
+                        continue
 
-        # L-section mappings for IC straight and corner
-        ic_l_sections = {
-            (50, 125): ("130 L", "130 L"),
-            (126, 150): ("155 L", "155 L"),
-            (151, 175): ("180 L", "180 L"),
-            (176, 200): ("205 L", "205 L"),
-            (201, 225): ("230 L", "230 L"),
-            (226, 250): ("255 L", "255 L"),
-            (251, 275): ("280 L", "280 L"),
-            (276, 300): ("305 L", "305 L"),
-            (301, 600): ("AL SHEET", "155 L")
-        }
+                    rm_quantity = rm.get("quantity", 1) * component_quantity
+                    rm_entry = {
+                        "fg_code": fg_code,
+                        "raw_material_code": rm.get("code"),
+                        "item_code": rm.get("code"),
+                        "a": a,
+                        "b": b,
+                        "code": sec_code,
+                        "l1": l1,
+                        "l2": l2,
+                        "bom_qty": bom_qty,
+                        "dimension": rm.get("dimension"),
+                        "remark": rm.get("remark"),
+                        "quantity": rm_quantity,
+                        "project": pbom_project,
+                        "ipo_name": ipo_name,
+                        "planning_bom": pbom_name,
+                        "status": rm.get("status"),
+                        "warehouse": rm.get("warehouse"),
+                        "planning_bom_item_reference": planning_bom_item_reference
+                    }
+                    if component_uom:
+                        rm_entry["uom"] = component_uom
+
+                    rm_table.append(rm_entry)
+
+                yield fg_code, pbom_name, rm_table
+
+        run_stats = get_expansion_cache().stats()
+        self.expansion_cache_hits = cint(self.expansion_cache_hits) + run_stats["hits"] - cache_stats["hits"]
+        self.expansion_cache_misses = cint(self.expansion_cache_misses) + run_stats["misses"] - cache_stats["misses"]
+
+    def append_raw_materials(self, processed_codes):
+        """Append expanded rows to the document; the caller saves it."""
+        tracer = self.tracer
+        output = []
+        for fg_code, pbom_name, rm_table in processed_codes:
+            for rm_entry in rm_table:
+                try:
+                    self.append("raw_materials", rm_entry)
+                    tracer.debug("Appended raw material %s for FG Code '%s'", rm_entry["item_code"], fg_code)
+                except Exception as e:
+                    tracer.error("Error appending raw material for FG Code '%s': %s", fg_code, e, title="FG Raw Material Error")
+                    continue
 
-        # L-section mappings for CH straight
-        ch_l_sections_straight = {
-            (51, 125): ("130 L", "MAIN FRAME"),
-            (126, 149): ("155 L", "MAIN FRAME"),
-            (151, 174): ("180 L", "MAIN FRAME"),
-            (176, 199): ("205 L", "MAIN FRAME"),
-            (201, 225): ("230 L", "MAIN FRAME"),
-            (226, 249): ("255 L", "MAIN FRAME"),
-            (251, 275): ("280 L", "MAIN FRAME"),
-            (276, 300): ("305 L", "MAIN FRAME"),
-            (301, 325): ("180 L", "155 L"),
-            (326, 350): ("180 L", "180 L"),
-            (351, 375): ("205 L", "180 L"),
-            (376, 400): ("205 L", "205 L"),
-            (401, 425): ("230 L", "205 L"),
-            (426, 450): ("230 L", "230 L"),
-            (451, 475): ("255 L", "230 L"),
-            (476, 500): ("255 L", "255 L"),
-            (501, 525): ("280 L", "255 L"),
-            (526, 550): ("280 L", "280 L"),
-            (551, 575): ("305 L", "280 L"),
-            (576, 600): ("305 L", "305 L")
-        }
+            output.append({
+                "fg_code": fg_code,
+                "planning_bom": pbom_name,
+                "raw_materials": rm_table
+            })
+        return output
 
-        # L-section mappings for CH corner
-        ch_l_sections_corner = {
-            (51, 125): ("130 L", "MAIN FRAME"),
-            (126, 149): ("155 L", "MAIN FRAME"),
-            (151, 174): ("180 L", "MAIN FRAME"),
-            (176, 199): ("205 L", "MAIN FRAME"),
-            (201, 225): ("230 L", "MAIN FRAME"),
-            (226, 249): ("255 L", "MAIN FRAME"),
-            (251, 275): ("280 L", "MAIN FRAME"),
-            (276, 300): ("305 L", "MAIN FRAME"),
-            (301, 325): ("180 L", "155 L"),
-            (326, 350): ("180 L", "180 L"),
-            (351, 375): ("205 L", "180 L"),
-            (376, 400): ("205 L", "205 L"),
-            (401, 425): ("230 L", "205 L"),
-            (426, 450): ("230 L", "230 L"),
-            (451, 475): ("255 L", "230 L"),
-            (476, 500): ("255 L", "255 L"),
-            (501, 525): ("280 L", "255 L"),
-            (526, 550): ("280 L", "280 L"),
-            (551, 575): ("305 L", "280 L"),
-            (576, 600): ("305 L", "305 L")
-        }
+    def write_raw_materials_bulk(self, processed_codes, replace=True, start_idx=1):
+        """Stream expanded rows straight into `tabFG Raw Material Item` in multi-row INSERTs.
 
-        # J section mappings
-        j_sections = {
-            (25, 50): ("J SEC", "-"),
-            (25, 115): ("115 T", "-"),
-            (116, 250): ("AL SHEET", "-")
-        }
+        Returns a per-FG-code summary (no row payloads) so memory stays flat.
+        """
+        output = []
 
-        j_l_sections = {
-            (50, 125): ("130 L"),
-            (126, 150): ("155 L"),
-            (151, 175): ("180 L"),
-            (176, 200): ("205 L"),
-            (201, 225): ("230 L"),
-            (226, 250): ("255 L"),
-            (251, 275): ("280 L"),
-            (276, 300): ("305 L")
-        }
+        def rows():
+            for fg_code, pbom_name, rm_table in processed_codes:
+                output.append({
+                    "fg_code": fg_code,
+                    "planning_bom": pbom_name,
+                    "raw_materials": len(rm_table)
+                })
+                yield from rm_table
 
-        # T section mappings
-        t_sections = {
-            (230,): ("100 T", "-", "-"),
-            (231, 360): ("115 T", "115 T", "-"),
-            (380,): ("250 CH", "EC", "-"),
-            (430,): ("300 CH", "EC", "-"),
-            (361, 380): ("255 L", "MAIN FRAME", "EC"),
-            (381, 405): ("280 L", "MAIN FRAME", "EC"),
-            (406, 430): ("305 L", "MAIN FRAME", "EC"),
-            (431, 455): ("180 L", "155 L", "EC"),
-            (456, 480): ("180 L", "180 L", "EC")
-        }
+        if replace:
+            delete_child_rows(self, "raw_materials")
+        insert_child_rows(self, "raw_materials", rows(), start_idx=start_idx)
+        return output
 
-        # Misc section mappings
-        misc_sections = {
-            (100, "EB"): ("EB MB 100", "-"),
-            (150, "EB"): ("EB MB 150", "-"),
-            (100, "MB"): ("EB MB 100", "-"),
-            (150, "MB"): ("EB MB 150", "-"),
-            (100, "DP"): ("DP 100", "-"),
-            (150, "DP"): ("DP 150", "-"),
-            (130,): ("EXTERNAL CORNER", "-"),
-            (50, "RK"): ("RK-50", "-")
-        }
+    def process_single_fg_code(self, fg_code):
+        tracer = self.tracer
+        try:
+            parsed = parse_fg_code(fg_code)
+            if not parsed:
+                tracer.warning("Invalid FG Code format. Expected 5 parts, got %s: %s", len(fg_code.split('|')), fg_code)
+                return []
+            a, b, fg_code_part, l1, l2 = parsed
+            tracer.debug("Parsed %s: A=%s, B=%s, FG_CODE=%s, L1=%s, L2=%s", fg_code, a, b, fg_code_part, l1, l2)
+        except Exception as e:
+            tracer.error("Error parsing FG Code %s: %s", fg_code, e, title="FG Raw Material Error")
+            return []
 
-        raw_materials = []
-        child_parts = []
-        degree_cutting = getattr(self, 'degree_cutting', False)
-        
-        # Apply 5mm cutting tolerance to initial lengths
-        l1 = l1 + 0 if l1 else 0
-        l2 = l2 + 0 if l2 else 0
-
-        if fg_code_part in ch_straight or fg_code_part in ch_corner:
-            is_corner = fg_code_part in ch_corner
-            section_map = ch_l_sections_corner if is_corner else ch_l_sections_straight
-            cut_dim1, cut_dim2 = str(l1), str(l2) if l2 else "-"
-            if fg_code_part in ["WR", "WRS"]:
-                cut_dim1, cut_dim2 = f"{l1-50+5}", f"{l2-50+5}" if l2 else "-"
-            if is_corner:
-                if fg_code_part in ["BCE", "KCE"]:
-                    cut_dim1, cut_dim2 = f"{l1+65+10+5}", f"{l2+65+10+5}" if l2 else "-"
-                elif fg_code_part in ["BCY", "KCY"]:
-                    cut_dim1, cut_dim2 = f"{l1+65+10+5}", f"{l2+10+5}" if l2 else "-"
-                elif fg_code_part in ["BC", "KC", "BCZ", "KCZ"]:
-                    cut_dim1, cut_dim2 = f"{l1+10+5}", f"{l2+10+5}" if l2 else "-"
-            
-            if a <= 300 and a % 25 == 0 and a in ch_sections:
-                rm_code = ch_sections[a]
-                cut_dim = f"{cut_dim1},{cut_dim2}" if is_corner else cut_dim1
-                raw_materials.append({"code": rm_code, "dimension": cut_dim, "remark": fg_section_map[fg_code_part], "quantity": 1})
-                frappe.log_error(message=f"CH {'Corner' if is_corner else 'Straight'}: A={a}, using RM1={rm_code}, Cut={cut_dim}", title="CH Section Logic")
-            elif a in [350, 400, 600] and a in ch_sections:
-                rm_code = ch_sections[a]
-                cut_dim = f"{cut_dim1},{cut_dim2}" if is_corner else cut_dim1
-                raw_materials.append({"code": rm_code, "dimension": cut_dim, "remark": fg_section_map[fg_code_part], "quantity": 1})
-                frappe.log_error(message=f"CH {'Corner' if is_corner else 'Straight'}: A={a}, using RM1={rm_code}, Cut={cut_dim}", title="CH Section Logic")
-            else:
-                for (min_a, max_a), (rm1, rm2) in section_map.items():
-                    if min_a <= a <= max_a:
-                        cut_dim = f"{cut_dim1},{cut_dim2}" if is_corner else cut_dim1
-                        raw_materials.append({"code": rm1, "dimension": cut_dim, "remark": fg_section_map[fg_code_part], "quantity": 1})
-                        if rm2 != "MAIN FRAME":
-                            raw_materials.append({"code": rm2, "dimension": cut_dim, "remark": fg_section_map[fg_code_part], "quantity": 1})
-                        else:
-                            raw_materials.append({"code": "MAIN FRAME", "dimension": cut_dim, "remark": fg_section_map[fg_code_part], "quantity": 1})
-                        frappe.log_error(message=f"CH {'Corner' if is_corner else 'Straight'}: A={a} in range {min_a}-{max_a}, using RM1={rm1}, RM2={rm2}, Cut={cut_dim}", title="CH Section Logic")
-                        break
-            
-            if fg_code_part != "PLB":
-                side_rail_qty = 1 if degree_cutting and fg_code_part in ["WR", "WRB", "WRS"] else 2
-                child_parts.append({"code": "SIDE RAIL", "dimension": f"{a-16+5}", "remark": "CHILD PART", "quantity": side_rail_qty})
-                raw_materials.append({"code": "SIDE RAIL", "dimension": f"{a-16+5}", "remark": "CHILD PART", "quantity": side_rail_qty})
-            
-            if fg_code_part == "K" and l1 >= 1800:
-                child_parts.append({"code": "STIFF PLATE", "dimension": f"{a-4}X{l1-12+5}X4", "remark": "CHILD PART", "quantity": 5})
-                raw_materials.append({"code": "STIFF PLATE", "dimension": f"{a-4}X{l1-12+5}X4", "remark": "CHILD PART", "quantity": 5})
-
-        elif fg_code_part in ic_straight or fg_code_part in ic_corner:
-            is_corner = fg_code_part in ic_corner
-            cut_dim1, cut_dim2 = str(l1), str(l2) if l2 else "-"
-            length1, length2 = l1, l2 if l2 else 0
-            if fg_code_part in ["ICXB", "ICB"]:
-                cut_dim1 = f"{l1-8+5}"
-                length1 = l1 - 8 + 5
-            elif fg_code_part in ["ICT", "ICX"]:
-                cut_dim1 = f"{l1-4+5}"
-                length1 = l1 - 4 + 5
-            elif fg_code_part in ["SCE", "LSCE", "LSCEK"]:
-                cut_dim1, cut_dim2 = f"{l1+b+10+5}", f"{l2+b+10+5}" if l2 else "-"
-                length1, length2 = l1 + b + 10 + 5, l2 + b + 10 + 5 if l2 else 0
-            elif fg_code_part in ["SCY", "LSCY"]:
-                cut_dim1, cut_dim2 = f"{l1+65+10+5}", f"{l2+10+5}" if l2 else "-"
-                length1, length2 = l1 + 65 + 10 + 5, l2 + 10 + 5 if l2 else 0
-            elif fg_code_part in ["SCZ", "LSCZ"]:
-                cut_dim1, cut_dim2 = f"{l1+10+5}", f"{l2+65+10+5}" if l2 else "-"
-                length1, length2 = l1 + 10 + 5, l2 + 65 + 10 + 5 if l2 else 0
-            elif fg_code_part in ["SC", "SCE", "SCY", "SCZ", "LSC", "LSCE", "LSCK", "LSCEK", "LSCY", "LSCZ"]:
-                cut_dim1, cut_dim2 = f"{l1+10+5}", f"{l2+10+5}" if l2 else "-"
-                length1, length2 = l1 + 10 + 5, l2 + 10 + 5 if l2 else 0
-            
-            cut_dim = f"{cut_dim1},{cut_dim2}" if is_corner else cut_dim1
-            matched = False
-            for key in ic_sections:
-                if isinstance(key, tuple) and len(key) == 3:
-                    if (a, b, fg_code_part) == key or (b, a, fg_code_part) == key:
-                        rm1, rm2 = ic_sections[key]
-                        raw_materials.append({"code": rm1, "dimension": cut_dim, "remark": fg_section_map[fg_code_part], "quantity": 1, "length": cut_dim1 if not is_corner else f"{length1},{length2}"})
-                        if rm2 != "-":
-                            raw_materials.append({"code": rm2, "dimension": cut_dim, "remark": fg_section_map[fg_code_part], "quantity": 1, "length": cut_dim1 if not is_corner else f"{length1},{length2}"})
-                        matched = True
-                        frappe.log_error(message=f"IC {'Corner' if is_corner else 'Straight'}: A={a}, B={b}, FG={fg_code_part}, using RM1={rm1}, RM2={rm2}, Cut={cut_dim}", title="IC Section Logic")
-                        break
-                elif isinstance(key, tuple) and len(key) == 2:
-                    if (a, b) == key or (b, a) == key:
-                        rm1, rm2 = ic_sections[key]
-                        raw_materials.append({"code": rm1, "dimension": cut_dim, "remark": fg_section_map[fg_code_part], "quantity": 1, "length": cut_dim1 if not is_corner else f"{length1},{length2}"})
-                        if rm2 != "-":
-                            raw_materials.append({"code": rm2, "dimension": cut_dim, "remark": fg_section_map[fg_code_part], "quantity": 1, "length": cut_dim1 if not is_corner else f"{length1},{length2}"})
-                        matched = True
-                        frappe.log_error(message=f"IC {'Corner' if is_corner else 'Straight'}: A={a}, B={b}, using RM1={rm1}, RM2={rm2}, Cut={cut_dim}", title="IC Section Logic")
-                        break
-            
-            if not matched:
-                for (min_a, max_a), (rm1, rm2) in ic_l_sections.items():
-                    if min_a <= a <= max_a:
-                        remark = "L SECTION" if rm1.endswith("L") or rm2.endswith("L") else fg_section_map[fg_code_part]
-                        raw_materials.append({"code": rm1, "dimension": cut_dim, "remark": remark, "quantity": 1, "length": cut_dim1 if not is_corner else f"{length1},{length2}"})
-                        if rm2 != "-":
-                            raw_materials.append({"code": rm2, "dimension": cut_dim, "remark": remark, "quantity": 1, "length": cut_dim1 if not is_corner else f"{length1},{length2}"})
-                        frappe.log_error(message=f"IC {'Corner' if is_corner else 'Straight'}: A={a} in range {min_a}-{max_a}, using RM1={rm1}, RM2={rm2}, Cut={cut_dim}, Remark={remark}", title="IC Section Logic")
-                        break
-            
-            if fg_code_part in ["IC", "ICT", "ICX", "ICB", "ICXB"]:
-                side_rail_qty = 2
-                child_parts.append({"code": "SIDE RAIL", "dimension": f"{a-16+5}", "remark": "CHILD PART", "quantity": side_rail_qty, "length": f"{a-16+5}"})
-                raw_materials.append({"code": "SIDE RAIL", "dimension": f"{a-16+5}", "remark": "CHILD PART", "quantity": side_rail_qty, "length": f"{a-16+5}"})
-            
-            if fg_code_part in ["SC", "SCE", "LSC", "LSCE", "LSCK", "LSCEK"]:
-                outer_cap_dim = f"{a+65+5}X{l1}X4,{a+65+5}X{l2}X4" if is_corner else f"{a+65+5}X{l1}X4"
-                child_parts.append({"code": "OUTER CAP", "dimension": outer_cap_dim, "remark": "CHILD PART", "quantity": 1, "length": outer_cap_dim})
-                raw_materials.append({"code": "OUTER CAP", "dimension": outer_cap_dim, "remark": "CHILD PART", "quantity": 1, "length": outer_cap_dim})
-            elif fg_code_part in ["SCY", "SCZ"]:
-                outer_cap_dim = f"{b/math.sin(math.radians(45))+5}X{a}X4"
-                child_parts.append({"code": "OUTER CAP", "dimension": outer_cap_dim, "remark": "CHILD PART", "quantity": 1, "length": outer_cap_dim})
-                raw_materials.append({"code": "OUTER CAP", "dimension": outer_cap_dim, "remark": "CHILD PART", "quantity": 1, "length": outer_cap_dim})
-
-        elif fg_code_part in j_straight or fg_code_part in j_corner:
-            is_corner = fg_code_part in j_corner
-            cut_dim1, cut_dim2 = str(l1), str(l2) if l2 else "-"
-            length1, length2 = l1, l2 if l2 else 0
-            if fg_code_part in ["JLT", "JRT", "JLX", "JRX"]:
-                cut_dim1 = f"{l1-8+5}"
-                length1 = l1 - 8 + 5
-            elif fg_code_part in ["LSX"]:
-                cut_dim1 = f"{l1+5}"
-                length1 = l1 + 5
-            elif fg_code_part in ["JL", "JLB", "JLT", "JLX", "JR", "JRB", "JRT", "JRX"]:
-                cut_dim1 = f"{l1-4+5}"
-                length1 = l1 - 4 + 5
-            elif fg_code_part in ["SXC", "SXCE", "SXCZ", "LSXC", "LSXCK", "LSXCE", "LSXCEK"]:
-                cut_dim1 = f"{l1+10+5}" if fg_code_part in ["SXC", "SXCZ", "LSXCK"] else f"{l1+b+10+5}"
-                cut_dim2 = f"{l2+10+5}" if fg_code_part in ["SXC", "SXCZ", "LSXCK"] else f"{l2+b+10+5}" if l2 else "-"
-                length1 = l1 + 10 + 5 if fg_code_part in ["SXC", "SXCZ", "LSXCK"] else l1 + b + 10 + 5
-                length2 = l2 + 10 + 5 if fg_code_part in ["SXC", "SXCZ", "LSXCK"] else l2 + b + 10 + 5 if l2 else 0
-            elif fg_code_part in ["SXCY"]:
-                cut_dim1 = f"{l1+10+5}"
-                cut_dim2 = f"{l2+10+5}" if l2 else "-"
-                length1, length2 = l1 + 10 + 5, l2 + 10 + 5 if l2 else 0
-            
-            cut_dim = f"{cut_dim1},{cut_dim2}" if is_corner else cut_dim1
-            length = f"{length1},{length2}" if is_corner else cut_dim1
-            
-            if (a <= 50 and b == 100) or (b <= 50 and a == 100):
-                raw_materials.append({"code": "J SEC", "dimension": cut_dim, "remark": fg_section_map[fg_code_part], "quantity": 1, "length": length})
-                frappe.log_error(message=f"J {'Corner' if is_corner else 'Straight'}: A={a}, B={b}, using J SEC, Cut={cut_dim}", title="J Section Logic")
-            else:
-                for (min_a, max_a), (rm1, rm2) in j_sections.items():
-                    if min_a <= a <= max_a:
-                        rm_dim = f"{a+65+5}X{l1}X4,{a+65+5}X{l2}X4" if is_corner and rm1 == "AL SHEET" else f"{a+65+5}X{l1}X4" if rm1 == "AL SHEET" else cut_dim
-                        length = f"{a+65+5}X{l1}X4,{a+65+5}X{l2}X4" if is_corner and rm1 == "AL SHEET" else f"{a+65+5}X{l1}X4" if rm1 == "AL SHEET" else length
-                        raw_materials.append({"code": rm1, "dimension": rm_dim, "remark": fg_section_map[fg_code_part], "quantity": 1, "length": length})
-                        frappe.log_error(message=f"J {'Corner' if is_corner else 'Straight'}: A={a}, using RM1={rm1}, Cut={rm_dim}", title="J Section Logic")
-                        if rm2 != "-" and not ((25 <= a <= 50 and b == 100) or (25 <= b <= 50 and a == 100)):
-                            for (min_b, max_b), rm2 in j_l_sections.items():
-                                if min_b <= b <= max_b:
-                                    raw_materials.append({"code": rm2, "dimension": cut_dim, "remark": "J SECTION", "quantity": 1, "length": length})
-                                    frappe.log_error(message=f"J {'Corner' if is_corner else 'Straight'}: B={b}, using RM2={rm2}, Cut={cut_dim}", title="J Section Logic")
-                                    break
-                        break
-            
-            if fg_code_part in ["SX", "SXC", "SXCE", "LSX", "LSXC", "SXCZ", "SXCY", "LSXCK", "LSXCE", "LSXCEK"]:
-                side_rail_dim = f"{b-16+5}" if any(rm["code"] == "J SEC" for rm in raw_materials) else f"{b-12+5}"
-                stiff_qty = 5 if fg_code_part == "SX" else 2
-                child_parts.append({"code": "SIDE RAIL", "dimension": side_rail_dim, "remark": "CHILD PART", "quantity": 2, "length": side_rail_dim})
-                raw_materials.append({"code": "SIDE RAIL", "dimension": side_rail_dim, "remark": "CHILD PART", "quantity": 2, "length": side_rail_dim})
-                stiff_dim = f"{a-4}X{b-12+5}X4" if any(rm["code"] == "J SEC" for rm in raw_materials) else f"{a-4}X{b-12+5}X4"
-                child_parts.append({"code": "STIFF PLATE", "dimension": stiff_dim, "remark": "CHILD PART", "quantity": stiff_qty, "length": stiff_dim})
-                raw_materials.append({"code": "STIFF PLATE", "dimension": stiff_dim, "remark": "CHILD PART", "quantity": stiff_qty, "length": stiff_dim})
-
-        elif fg_code_part in t_straight:
-            cut_dim = str(l1)
-            length = str(l1)
-            if fg_code_part in ["WRBSE", "WRSE"] and not degree_cutting:
-                cut_dim = f"{l1-50+5}"
-                length = f"{l1-50+5}"
-            
-            for key, (rm1, rm2, rm3) in t_sections.items():
-                if isinstance(key, tuple) and len(key) == 2:
-                    if key[0] <= a <= key[1]:
-                        raw_materials.append({"code": rm1, "dimension": cut_dim, "remark": fg_section_map[fg_code_part], "quantity": 1, "length": length})
-                        if rm2 != "-":
-                            raw_materials.append({"code": rm2, "dimension": cut_dim, "remark": fg_section_map[fg_code_part], "quantity": 1, "length": length})
-                        if rm3 != "-":
-                            raw_materials.append({"code": rm3, "dimension": cut_dim, "remark": fg_section_map[fg_code_part], "quantity": 2 if rm3 == "EC" else 1, "length": length})
-                        frappe.log_error(message=f"T Straight: A={a}, using RM1={rm1}, RM2={rm2}, RM3={rm3}, Cut={cut_dim}", title="T Section Logic")
-                        break
-                elif isinstance(key, tuple) and len(key) == 1:
-                    if a == key[0]:
-                        raw_materials.append({"code": rm1, "dimension": cut_dim, "remark": fg_section_map[fg_code_part], "quantity": 1, "length": length})
-                        if rm2 != "-":
-                            raw_materials.append({"code": rm2, "dimension": cut_dim, "remark": fg_section_map[fg_code_part], "quantity": 2 if rm2 == "EC" else 1, "length": length})
-                        if rm3 != "-":
-                            raw_materials.append({"code": rm3, "dimension": cut_dim, "remark": fg_section_map[fg_code_part], "quantity": 2 if rm3 == "EC" else 1, "length": length})
-                        frappe.log_error(message=f"T Straight: A={a}, using RM1={rm1}, RM2={rm2}, RM3={rm3}, Cut={cut_dim}", title="T Section Logic")
-                        break
-            
-            side_rail_qty = 1 if degree_cutting and fg_code_part in ["WRBSE", "WRSE"] else 2
-            side_rail_dim = f"{a-131+5}" if any(rm["code"].endswith("T") for rm in raw_materials) else f"{a-146+5}"
-            if fg_code_part in ["TSE", "WRBSE", "WRSE"]:
-                side_rail_dim = f"{a-146+5}" if any(rm["code"].endswith("T") or rm["code"].endswith("CH") for rm in raw_materials) else f"{a-146+5}"
-            
-            child_parts.append({"code": "SIDE RAIL", "dimension": side_rail_dim, "remark": "CHILD PART", "quantity": side_rail_qty, "length": side_rail_dim})
-            raw_materials.append({"code": "SIDE RAIL", "dimension": side_rail_dim, "remark": "CHILD PART", "quantity": side_rail_qty, "length": side_rail_dim})
-            
-            if fg_code_part in ["WRBSE", "WRSE"] and not degree_cutting:
-                child_parts.append({"code": "RK-50", "dimension": f"{a-130+5}", "remark": "CHILD PART", "quantity": 1, "length": f"{a-130+5}"})
-                raw_materials.append({"code": "RK-50", "dimension": f"{a-130+5}", "remark": "CHILD PART", "quantity": 1, "length": f"{a-130+5}"})
-            
-            if fg_code_part in ["TSE", "WRBSE", "WRSE", "WSE", "WXSE"]:
-                stiff_dim = side_rail_dim
-                u_stiff_qty = 5 if fg_code_part == "TSE" else 8
-                child_parts.append({"code": "U STIFFNER", "dimension": stiff_dim, "remark": "CHILD PART", "quantity": u_stiff_qty, "length": stiff_dim})
-                raw_materials.append({"code": "U STIFFNER", "dimension": stiff_dim, "remark": "CHILD PART", "quantity": u_stiff_qty, "length": stiff_dim})
-            
-            if fg_code_part in ["WRBSE", "WRSE", "WSE", "WXSE"]:
-                child_parts.append({"code": "H STIFFNER", "dimension": side_rail_dim, "remark": "CHILD PART", "quantity": 2, "length": side_rail_dim})
-                raw_materials.append({"code": "H STIFFNER", "dimension": side_rail_dim, "remark": "CHILD PART", "quantity": 2, "length": side_rail_dim})
-            
-            if fg_code_part in ["PCE", "SBE"]:
-                child_parts.append({"code": "I STIFFNER", "dimension": side_rail_dim, "remark": "CHILD PART", "quantity": 8, "length": side_rail_dim})
-                raw_materials.append({"code": "I STIFFNER", "dimension": side_rail_dim, "remark": "CHILD PART", "quantity": 8, "length": side_rail_dim})
-
-        elif fg_code_part in misc_straight:
-            cut_dim = str(l1 + 150 + 5) if fg_code_part == "MB" and a == 150 else str(l1 + 100 + 5) if fg_code_part == "MB" and a == 100 else str(l1)
-            length = cut_dim
-            key = (a, fg_code_part) if fg_code_part in ["EB", "MB", "DP", "RK"] else (a,)
-            if key in misc_sections:
-                rm1, rm2 = misc_sections[key]
-                raw_materials.append({"code": rm1, "dimension": cut_dim, "remark": fg_section_map[fg_code_part], "quantity": 1, "length": length})
-                if rm2 != "-":
-                    raw_materials.append({"code": rm2, "dimension": cut_dim, "remark": fg_section_map[fg_code_part], "quantity": 1, "length": length})
-                frappe.log_error(message=f"Misc Straight: A={a}, FG={fg_code_part}, using RM1={rm1}, Cut={cut_dim}", title="Misc Section Logic")
-            elif fg_code_part == "RK" and a != 50:
-                for (min_a, max_a), (rm1, rm2) in ic_l_sections.items():
-                    if min_a <= a <= max_a:
-                        raw_materials.append({"code": rm1, "dimension": cut_dim, "remark": "MISC SECTION", "quantity": 1, "length": length})
-                        frappe.log_error(message=f"Misc Straight: RK with A={a}, using RM1={rm1}, Cut={cut_dim}, Remark=MISC SECTION", title="Misc Section Logic")
-                        break
-            
-            if fg_code_part == "DP":
-                child_parts.append({"code": "ROUND PIPE", "dimension": "196", "remark": "CHILD PART", "quantity": 1, "length": "196"})
-                raw_materials.append({"code": "ROUND PIPE", "dimension": "196", "remark": "CHILD PART", "quantity": 1, "length": "196"})
-            
-            if a == 150:
-                child_parts.append({"code": "SQUARE PLATE", "dimension": "150X150X4", "remark": "CHILD PART", "quantity": 1, "length": "150X150X4"})
-                raw_materials.append({"code": "SQUARE PLATE", "dimension": "150X150X4", "remark": "CHILD PART", "quantity": 1, "length": "150X150X4"})
-            
-            if fg_code_part in ["EB", "MB"] and a == 150:
-                child_parts.append({"code": "SUPPORT PIPE", "dimension": "105", "remark": "CHILD PART", "quantity": 1, "length": "105"})
-                raw_materials.append({"code": "SUPPORT PIPE", "dimension": "105", "remark": "CHILD PART", "quantity": 1, "length": "105"})
-        
-        else:
-            frappe.log_error(message=f"Skipping invalid FG Code: {fg_code_part}, Full Code: {fg_code}", title="FG Raw Material Error")
+        if fg_code_part not in FG_SECTION_MAP:
+            tracer.warning("Skipping invalid FG Code: %s, Full Code: %s", fg_code_part, fg_code)
             return []
-        
-        frappe.log_error(message=f"Child Parts for FG Code {fg_code_part}: {json.dumps(child_parts, indent=2)}", title="Child Parts Debug")
-        frappe.log_error(message=f"Returning raw_materials for FG Code {fg_code}: {json.dumps(raw_materials, indent=2)}", title="FG Single Code Debug")
-        return raw_materials
 
+        degree_cutting = getattr(self, 'degree_cutting', False)
+        return get_expansion_cache().get(a, b, fg_code_part, l1, l2, degree_cutting)
 
 
 
 @frappe.whitelist()
 def get_raw_materials(docname=None, planning_bom=None):
+    tracer = get_tracer("fg_selector")
     try:
-        frappe.log_error(
-            message=f"get_raw_materials called with docname: {docname}, planning_bom: {planning_bom}",
-            title="FG Get Raw Materials Debug"
-        )
+        tracer.debug("get_raw_materials called with docname: %s, planning_bom: %s", docname, planning_bom)
         if not docname:
             frappe.throw(_("No FG Raw Material Selector document specified."))
         if not planning_bom:
@@ -765,7 +419,7 @@ def get_raw_materials(docname=None, planning_bom=None):
         existing = {row.planning_bom for row in doc.planning_bom}
         for pb in pbom_list:
             if pb not in existing:
-                doc.append("raw_materials", {"planning_bom": pb})
+                doc.append("planning_bom", {"planning_bom": pb})
 
         doc.save()
 
@@ -785,19 +439,167 @@ def get_raw_materials(docname=None, planning_bom=None):
         frappe.throw(_("Failed to fetch raw materials: {0}").format(str(e)))
 @frappe.whitelist()
 def process_fg_codes_background(docname):
+    tracer = get_tracer("fg_selector")
     try:
-        frappe.log_error(message=f"Starting background job for FG Raw Material Selector: {docname}", title="FG Background Debug")
+        tracer.info("Starting background job for FG Raw Material Selector: %s", docname)
         doc = frappe.get_doc("FG Raw Material Selector", docname)
-        doc.process_fg_codes()
-        frappe.log_error(message=f"Completed background job for FG Raw Material Selector: {docname}", title="FG Background Debug")
+        doc.enqueue_fg_code_chunks()
+        tracer.info("Completed background job for FG Raw Material Selector: %s", docname)
     except Exception as e:
-        frappe.log_error(message=f"Error in background job for {docname}: {str(e)}", title="FG Raw Material Error")
+        tracer.error("Error in background job for %s: %s", docname, e, title="FG Raw Material Error")
         raise
 
+
+def get_run_key(docname):
+    return f"sb_fg_chunk_run:{docname}"
+
+
+def get_plan_key(run_id):
+    return f"sb_fg_chunk_plan:{run_id}"
+
+
+def get_chunk_key(run_id, chunk_index):
+    return f"sb_fg_chunk:{run_id}:{chunk_index}"
+
+
+def get_chunk_status_key(run_id, chunk_index):
+    return f"sb_fg_chunk_status:{run_id}:{chunk_index}"
+
+
+class ChunkFailure(Exception):
+    """A chunk of an FG expansion run failed or its result is gone."""
+
+
+def process_fg_code_chunk(docname, run_id, chunk_index, chunk_count, components):
+    """Expand one chunk of FG components and park the result in Redis until the merge."""
+    cache = frappe.cache()
+    # Only the settings are needed here; loading the saved raw_materials table in every chunk would dominate the job
+    settings = frappe.db.get_value("FG Raw Material Selector", docname, ["name", "trace_level"], as_dict=True)
+    doc = frappe.get_doc({"doctype": "FG Raw Material Selector", **settings})
+    tracer = doc.tracer
+    if cache.get_value(get_run_key(docname)) != run_id:
+        tracer.info("Skipping chunk %s of superseded run %s for %s", chunk_index, run_id, docname)
+        return
+
+    result = {"processed": [], "hits": 0, "misses": 0, "error": None}
+    try:
+        doc.expansion_cache_hits = 0
+        doc.expansion_cache_misses = 0
+        result["processed"] = list(doc.iter_raw_materials(components))
+        result["hits"] = doc.expansion_cache_hits
+        result["misses"] = doc.expansion_cache_misses
+    except Exception as e:
+        # Still count the chunk as done so the merge is not held up forever; the merge aborts on the error
+        tracer.error("Error in chunk %s of %s for %s: %s", chunk_index, chunk_count, docname, e, title="FG Raw Material Error")
+        result = {"processed": [], "hits": 0, "misses": 0, "error": str(e) or e.__class__.__name__}
+
+    cache.set_value(get_chunk_key(run_id, chunk_index), result, expires_in_sec=CHUNK_RESULT_EXPIRY)
+    # A small status next to the result lets the merge check every chunk before it touches the table
+    cache.set_value(get_chunk_status_key(run_id, chunk_index), result["error"] or "", expires_in_sec=CHUNK_RESULT_EXPIRY)
+
+    counter_key = cache.make_key(f"sb_fg_chunks_done:{run_id}")
+    completed = cache.incr(counter_key)
+    cache.expire(counter_key, CHUNK_RESULT_EXPIRY)
+
+    frappe.publish_realtime(
+        event='fg_materials_progress',
+        message={'docname': docname, 'completed': completed, 'total': chunk_count},
+        user=frappe.session.user,
+        docname=docname
+    )
+
+    if completed == chunk_count:
+        cache.delete(counter_key)
+        frappe.enqueue(
+            'sb.sb.doctype.fg_raw_material_selector.fg_raw_material_selector.merge_fg_code_chunks',
+            queue='long',
+            timeout=3600,
+            docname=docname,
+            run_id=run_id,
+            chunk_count=chunk_count
+        )
+
+
+def merge_fg_code_chunks(docname, run_id, chunk_count):
+    """Write the results of every chunk of a run in chunk order.
+
+    If any chunk failed or its result is gone, nothing is written: the
+    existing raw material rows stay and the user is told why.
+    """
+    cache = frappe.cache()
+    doc = frappe.get_doc("FG Raw Material Selector", docname)
+    tracer = doc.tracer
+    if cache.get_value(get_run_key(docname)) != run_id:
+        tracer.info("Skipping merge of superseded run %s for %s", run_id, docname)
+        return
+
+    plan = cache.get_value(get_plan_key(run_id))
+    if plan is None:
+        tracer.error("Missing expansion plan of run %s for %s", run_id, docname, title="FG Raw Material Error")
+        return
+
+    doc.expansion_cache_hits = 0
+    doc.expansion_cache_misses = 0
+
+    def merged_codes():
+        for chunk_index in range(chunk_count):
+            chunk_key = get_chunk_key(run_id, chunk_index)
+            result = cache.get_value(chunk_key)
+            if result is None:
+                raise ChunkFailure(f"result of chunk {chunk_index + 1} of {chunk_count} expired")
+            if result.get("error"):
+                raise ChunkFailure(f"chunk {chunk_index + 1} of {chunk_count} failed: {result['error']}")
+            doc.expansion_cache_hits += result["hits"]
+            doc.expansion_cache_misses += result["misses"]
+            yield from result["processed"]
+            cache.delete_value(chunk_key)
+
+    try:
+        failures = get_chunk_failures(run_id, chunk_count)
+        if failures:
+            raise ChunkFailure("; ".join(failures))
+        doc.save_raw_materials(merged_codes(), plan)
+    except ChunkFailure as e:
+        # Whatever the merge already wrote goes, so the old rows stay intact
+        frappe.db.rollback()
+        tracer.error("Merge of run %s for %s aborted: %s", run_id, docname, e, title="FG Raw Material Error")
+        frappe.publish_realtime(
+            event='msgprint',
+            message=f'Raw materials were not updated because {e}. Please run Get Raw Materials again.',
+            user=frappe.session.user
+        )
+    except Exception as e:
+        tracer.error("Error merging chunks of run %s for %s: %s", run_id, docname, e, title="FG Raw Material Error")
+        frappe.publish_realtime(
+            event='msgprint',
+            message=f'Error processing FG codes: {str(e)}',
+            user=frappe.session.user
+        )
+        raise
+    finally:
+        cache.delete_value(get_run_key(docname))
+        cache.delete_value(get_plan_key(run_id))
+        for chunk_index in range(chunk_count):
+            cache.delete_value(get_chunk_key(run_id, chunk_index))
+            cache.delete_value(get_chunk_status_key(run_id, chunk_index))
+
+
+def get_chunk_failures(run_id, chunk_count):
+    """Describe every chunk of a run that failed or whose result expired."""
+    failures = []
+    for chunk_index in range(chunk_count):
+        status = frappe.cache().get_value(get_chunk_status_key(run_id, chunk_index))
+        if status is None:
+            failures.append(f"result of chunk {chunk_index + 1} of {chunk_count} expired")
+        elif status:
+            failures.append(f"chunk {chunk_index + 1} of {chunk_count} failed: {status}")
+    return failures
+
 @frappe.whitelist()
 def create_bom_from_fg_selector(fg_selector_name, fg_code=None, project_design_upload=None):
+    tracer = get_tracer("fg_selector")
     try:
-        frappe.log_error(message=f"Creating BOM for FG Selector: {fg_selector_name}, FG Code: {fg_code}, PDU: {project_design_upload}", title="FG BOM Debug")
+        tracer.info("Creating BOM for FG Selector: %s, FG Code: %s, PDU: %s", fg_selector_name, fg_code, project_design_upload)
         fg_doc = frappe.get_doc("FG Raw Material Selector", fg_selector_name)
         bom = frappe.new_doc("BOM")
         bom.item = fg_code.split('|')[2] if fg_code else fg_doc.raw_materials[0].fg_code.split('|')[2] if fg_doc.raw_materials else ""
@@ -812,14 +614,15 @@ def create_bom_from_fg_selector(fg_selector_name, fg_code=None, project_design_u
                 "uom": rm.uom if rm.uom else "Nos"
             })
         bom.save()
-        frappe.log_error(message=f"Created BOM: {bom.name}", title="FG BOM Debug")
+        tracer.info("Created BOM: %s", bom.name)
         return bom.name
     except Exception as e:
-        frappe.log_error(message=f"Error creating BOM: {str(e)}", title="FG Raw Material Error")
+        tracer.error("Error creating BOM: %s", e, title="FG Raw Material Error")
         frappe.throw(f"Failed to create BOM: {str(e)}")
 
 
 @frappe.whitelist()
+@retry_on_deadlock
 def create_stock_entry_client(items, project=None):
     if isinstance(items, str):
         items = json.loads(items)
@@ -838,6 +641,7 @@ def create_stock_entry_client(items, project=None):
     # Default warehouses
     source_wh_default = "Raw Material - VD"
     target_wh_default = "Reserved Stock - VD"
+    requirements = defaultdict(float)
 
     for idx, item in enumerate(items, start=1):
         source_wh = (item.get("s_warehouse") or source_wh_default).strip()
@@ -861,53 +665,40 @@ def create_stock_entry_client(items, project=None):
             "cost_center": "Main - VD",
             "project": project
         })
+        requirements[(item.get("item_code"), source_wh)] += flt(item.get("qty")) * get_conversion_factor(item.get("item_code"), item.get("uom"))
 
-    frappe.logger().info(f"Final Stock Entry: {se.as_dict()}")
+    # The draft moves no stock and the commit below releases the Bin locks, so
+    # open draft transfers out of the same Bins count as taken
+    lock_available(
+        requirements, get_soft_reserved_qtys({item_code for item_code, _wh in requirements}), include_drafts=True
+    )
+
+    get_tracer("fg_selector").debug("Final Stock Entry: %s", se.as_dict())
     se.insert(ignore_permissions=True)
     frappe.db.commit()
 
     return se.name
 
 
-def get_actual_qty(item_code, warehouse, uom):
-    try:
-        bin = frappe.db.get_value("Bin", {"item_code": item_code, "warehouse": warehouse}, ["actual_qty"], as_dict=True)
-        if not bin:
-            frappe.log_error(message=f"No bin found for item {item_code} in warehouse {warehouse}", title="FG Stock Debug")
-            return 0
-        stock_uom = frappe.db.get_value("Item", item_code, "stock_uom")
-        conversion_factor = 1
-        if stock_uom != uom:
-            from erpnext.stock.doctype.item.item import get_uom_conv_factor as get_uom_conversion_factor
-            try:
-                conversion_factor = get_uom_conversion_factor(item_code, uom)
-            except Exception as e:
-                frappe.log_error(message=f"Error getting UOM conversion factor for {item_code}: {str(e)}", title="FG Stock Debug")
-                conversion_factor = 0
-        qty = flt(bin.actual_qty) / flt(conversion_factor or 1)
-        frappe.log_error(message=f"Actual qty for {item_code} in {warehouse}: {qty}", title="FG Stock Debug")
-        return qty
-    except Exception as e:
-        frappe.log_error(message=f"Error in get_actual_qty for {item_code}: {str(e)}", title="FG Raw Material Error")
-        return 0
-
 @frappe.whitelist()
 def clear_reservation(fg_selector_name):
+    tracer = get_tracer("fg_selector")
     try:
-        frappe.log_error(message=f"Clearing reservation for FG Selector: {fg_selector_name}", title="FG Stock Debug")
+        tracer.info("Clearing reservation for FG Selector: %s", fg_selector_name)
         doc = frappe.get_doc("FG Raw Material Selector", fg_selector_name)
+        tracer = doc.tracer
         for row in doc.raw_materials:
             row.db_set("status", "")
             row.db_set("reserve_tag", 0)
             row.db_set("warehouse", "")
             row.db_set("available_quantity", 0)
-        frappe.log_error(message=f"Reservation cleared for {fg_selector_name}", title="FG Stock Debug")
+        tracer.info("Reservation cleared for %s", fg_selector_name)
         return {
             "status": "success",
             "message": f"Reservation cleared for {fg_selector_name}"
         }
     except Exception as e:
-        frappe.log_error(message=f"Error clearing reservation: {str(e)}", title="FG Raw Material Error")
+        tracer.error("Error clearing reservation: %s", e, title="FG Raw Material Error")
         raise
 
 @frappe.whitelist()
@@ -927,6 +718,9 @@ def create_material_request(fg_selector_name):
         mr.material_request_type = "Purchase"
         mr.transaction_date = frappe.utils.nowdate()
 
+        settings = get_cutting_settings()
+        plans = plan_cutting([row for rows in groups.values() for row in rows], settings=settings)
+
         for item_code, group_rows in groups.items():
             total_length = 0.0
             total_piece_qty = 0.0
@@ -942,7 +736,7 @@ def create_material_request(fg_selector_name):
                     total_piece_qty += flt(row.quantity)
 
             if total_length > 0:
-                required = math.ceil(total_length / 4820)
+                required = get_required_bars(item_code, plans, total_length, settings)
             else:
                 required = math.ceil(total_piece_qty)
 
@@ -967,7 +761,7 @@ def create_material_request(fg_selector_name):
             return "No shortfalls to request."
 
     except Exception as e:
-        frappe.log_error(message=f"Error creating Material Request: {str(e)}", title="FG Raw Material Error")
+        get_tracer("fg_selector").error("Error creating Material Request: %s", e, title="FG Raw Material Error")
         
 
 @frappe.whitelist()
@@ -998,164 +792,85 @@ def create_offcut_stock_entry(fg_selector_name, item_code, remaining_length, rat
         se.insert(ignore_permissions=True)
         frappe.db.commit()
 
-        frappe.log_error(message=f"Offcut stock entry created for {item_code} with length {remaining_length}.", title="FG Offcut Debug")
+        get_tracer("fg_selector").info("Offcut stock entry created for %s with length %s.", item_code, remaining_length)
         return se.name
     except Exception as e:
-        frappe.log_error(message=f"Error creating offcut stock entry: {str(e)}", title="FG Raw Material Error")
+        get_tracer("fg_selector").error("Error creating offcut stock entry: %s", e, title="FG Raw Material Error")
         raise
 
 from frappe import _
 from collections import defaultdict
 
 @frappe.whitelist()
-def get_offcut_report(fg_selector_name):
+def get_offcut_report(fg_selector_name, method=None):
+    tracer = get_tracer("fg_selector")
     try:
         doc = frappe.get_doc("FG Raw Material Selector", fg_selector_name)
-        
-        # Group raw materials by item_code and collect all required cut lengths
-        rm_groups = defaultdict(list)
-        for row in doc.raw_materials:
-            if row.dimension and row.quantity > 0:
-                dims = [flt(v.strip()) for v in row.dimension.split(',') if v.strip()]
-                for _ in range(int(row.quantity)):
-                    rm_groups[row.item_code].extend(dims)
-        
-        report_data = []
-        standard_length = 4820.0  # Standard stock length
-        
-        for item_code, cuts in rm_groups.items():
-            if not cuts:
-                continue
-            
-            # Process cuts sequentially
-            current_piece_remaining = standard_length
-            piece_count = 0
-            last_remaining_per_piece = []
-            
-            for cut in sorted(cuts, reverse=True):  # Sort cuts in descending order
-                if cut > standard_length:
-                    frappe.log_error(
-                        message=f"Cut length {cut} for {item_code} exceeds standard length {standard_length}",
-                        title="FG Offcut Report Error"
-                    )
-                    continue
-                
-                # If cut doesn't fit in current piece, start a new piece
-                if cut > current_piece_remaining:
-                    if current_piece_remaining < standard_length:
-                        last_remaining_per_piece.append({
-                            "rm": item_code,
-                            "remaining_length": current_piece_remaining,
-                            "quantity": 1
-                        })
-                    current_piece_remaining = standard_length
-                    piece_count += 1
-                
-                # Apply the cut
-                current_piece_remaining -= cut
-            
-            # Add the last piece's remaining length if it's not fully used
-            if current_piece_remaining < standard_length and piece_count > 0:
-                last_remaining_per_piece.append({
-                    "rm": item_code,
-                    "remaining_length": current_piece_remaining,
-                    "quantity": 1
-                })
-            
-            # Aggregate quantities for identical remaining lengths
-            from collections import Counter
-            length_counts = Counter()
-            for entry in last_remaining_per_piece:
-                length_counts[entry['remaining_length']] += entry['quantity']
-            
-            # Add to report data
-            for length, qty in length_counts.items():
-                report_data.append({
-                    "rm": item_code,
-                    "remaining_length": length,
-                    "quantity": qty
-                })
-        
+        tracer = doc.tracer
+
+        plans = plan_cutting(doc.raw_materials, method)
+        for item_code, plan in plans.items():
+            for cut in plan.oversize:
+                tracer.warning("Cut length %s for %s exceeds the longest stock length %s", cut, item_code, plan.stock_lengths[-1])
+
+        report_data = summarize_offcuts(plans)
         if not report_data:
             frappe.msgprint("No offcuts calculated based on current raw materials.")
             return []
-        
-        # Sort report by rm and then by remaining_length descending
-        report_data.sort(key=lambda x: (x['rm'], -x['remaining_length']))
-        
+
         return report_data
-    
+
     except Exception as e:
-        frappe.log_error(message=f"Error generating offcut report: {str(e)}", title="FG Offcut Report Error")
+        tracer.error("Error generating offcut report: %s", e, title="FG Offcut Report Error")
         frappe.throw(f"Failed to generate offcut report: {str(e)}")
 
 
 @frappe.whitelist()
-def reserve_stock(fg_selector_name):
-    try:
-        frappe.log_error(message=f"Reserving stock for FG Selector: {fg_selector_name}", title="FG Stock Debug")
-        warehouses_to_check = ["Off-Cut - VD", "Raw Material - VD"]
-        doc = frappe.get_doc("FG Raw Material Selector", fg_selector_name)
+def get_cutting_plan(fg_selector_name, method=None, item_code=None):
+    """Return the bar count, cut pattern and waste per bar for each raw material of the selector."""
+    doc = frappe.get_doc("FG Raw Material Selector", fg_selector_name)
+    rows = [row for row in doc.raw_materials if not item_code or row.item_code == item_code]
+    return plan_cutting(rows, method)
 
-        # Group rows by item_code
-        groups = defaultdict(list)
-        for row in doc.raw_materials:
-            groups[row.item_code].append(row)
 
-        for item_code, group_rows in groups.items():
-            total_length = 0.0
-            total_piece_qty = 0.0
-            uom = group_rows[0].uom if group_rows[0].uom else "Nos"
+@frappe.whitelist()
+def get_offcut_reservation_plan(fg_selector_name, method=None):
+    """Plan the selector's cuts on offcut stock first and list the pieces to reserve.
+
+    Returns one entry per item with the offcut pieces to pull (each with its
+    Stock Ledger Entry and the cuts taken from it) and the new bars still needed.
+    """
+    doc = frappe.get_doc("FG Raw Material Selector", fg_selector_name)
+    plans = plan_cutting(doc.raw_materials, method, use_offcuts=True)
+
+    reservation = []
+    for item_code, plan in plans.items():
+        offcuts = [
+            dict(bar["offcut"], cuts=bar["cuts"], waste=bar["waste"])
+            for bar in plan.bars
+            if bar["source"] == "Offcut"
+        ]
+        reservation.append({
+            "item_code": item_code,
+            "offcuts": offcuts,
+            "new_bars": plan.bar_count,
+            "stock_lengths": [bar["stock_length"] for bar in plan.bars if bar["source"] == "Stock"]
+        })
+        doc.tracer.info("%s: %s offcuts and %s new bars", item_code, len(offcuts), plan.bar_count)
+    return reservation
 
-            # Consolidated length sum for the same item_code
-            for row in group_rows:
-                dims = []
-                # If dimension is a comma-separated string
-                if row.dimension:
-                    dims += [flt(v.strip()) for v in row.dimension.split(',') if v.strip()]
-                # Multiply length sum by row quantity
-                if dims:
-                    total_length += sum(dims) * flt(row.quantity)
-                else:
-                    total_piece_qty += flt(row.quantity)
 
-            # Decide required qty based on length or pieces
-            if total_length > 0:
-                required = math.ceil(total_length / 4820)
-                is_length_based = True
-            else:
-                required = math.ceil(total_piece_qty)
-                is_length_based = False
-
-            # Find warehouse with enough stock
-            selected_wh = ""
-            available = 0
-            for wh in warehouses_to_check:
-                qty = get_actual_qty(item_code, wh, uom)
-                if qty >= required:
-                    selected_wh = wh
-                    available = qty
-                    break
-            if not selected_wh:
-                available = sum(get_actual_qty(item_code, wh, uom) for wh in warehouses_to_check)
-
-            if selected_wh:
-                status = "IS"
-                reserve_tag = 1
-                warehouse = selected_wh
-            else:
-                status = "NIS"
-                reserve_tag = 0
-                warehouse = ""
+@frappe.whitelist()
+def reserve_stock(fg_selector_name):
+    tracer = get_tracer("fg_selector")
+    try:
+        tracer.info("Reserving stock for FG Selector: %s", fg_selector_name)
+        doc = frappe.get_doc("FG Raw Material Selector", fg_selector_name)
+        tracer = doc.tracer
 
-            # Update all rows for this item_code
-            for row in group_rows:
-                row.db_set("status", status)
-                row.db_set("reserve_tag", reserve_tag)
-                row.db_set("warehouse", warehouse)
-                row.db_set("available_quantity", available)
+        reserve_selectors([doc])
 
-        frappe.log_error(message="Stock reservation completed.", title="FG Stock Debug")
+        tracer.info("Stock reservation completed.")
         return {
             "status": "success",
             "message": "Stock reserved and warehouse recorded.",
@@ -1171,5 +886,129 @@ def reserve_stock(fg_selector_name):
             ]
         }
     except Exception as e:
-        frappe.log_error(message=f"Error reserving stock: {str(e)}", title="FG Raw Material Error")
+        tracer.error("Error reserving stock: %s", e, title="FG Raw Material Error")
+        raise
+
+
+@frappe.whitelist()
+def reserve_stock_bulk(fg_selector_names):
+    """Reserve stock for several selectors against one Bin snapshot.
+
+    Demands are served by row `priority` (1 first), then in the order the
+    selectors were given, then by item code, and each allocation is taken
+    out of the snapshot before the next one is decided. All row updates go
+    out as a few grouped UPDATEs in the request's transaction.
+    """
+    if isinstance(fg_selector_names, str):
+        fg_selector_names = json.loads(fg_selector_names)
+
+    tracer = get_tracer("fg_selector")
+    try:
+        docs = [frappe.get_doc("FG Raw Material Selector", name) for name in fg_selector_names]
+        allocations = reserve_selectors(docs)
+        tracer.info("Reserved stock for %s selectors, %s item demands", len(docs), len(allocations))
+        return {
+            "status": "success",
+            "message": f"Stock reserved for {len(docs)} selectors.",
+            "data": allocations
+        }
+    except Exception as e:
+        tracer.error("Error reserving stock for %s: %s", fg_selector_names, e, title="FG Raw Material Error")
         raise
+
+
+def get_reservation_demands(doc, settings):
+    """One demand per item of a selector: its rows, UOM, priority and the bars or pieces required."""
+    groups = defaultdict(list)
+    for row in doc.raw_materials:
+        groups[row.item_code].append(row)
+
+    # Bars per item as the saw will cut them: stock lengths, kerf and end trim from Cutting Settings
+    plans = plan_cutting(doc.raw_materials, settings=settings)
+
+    demands = []
+    for item_code, group_rows in groups.items():
+        total_length = 0.0
+        total_piece_qty = 0.0
+
+        # Consolidated length sum for the same item_code
+        for row in group_rows:
+            dims = []
+            # If dimension is a comma-separated string
+            if row.dimension:
+                dims += [flt(v.strip()) for v in row.dimension.split(',') if v.strip()]
+            # Multiply length sum by row quantity
+            if dims:
+                total_length += sum(dims) * flt(row.quantity)
+            else:
+                total_piece_qty += flt(row.quantity)
+
+        # Decide required qty based on length or pieces
+        if total_length > 0:
+            required = get_required_bars(item_code, plans, total_length, settings)
+        else:
+            required = math.ceil(total_piece_qty)
+
+        priorities = [cint(row.priority) for row in group_rows if cint(row.priority)]
+        demands.append(frappe._dict(
+            selector=doc.name,
+            item_code=item_code,
+            uom=group_rows[0].uom or "Nos",
+            required=required,
+            length=total_length,
+            priority=min(priorities) if priorities else LOWEST_RESERVATION_PRIORITY,
+            rows=group_rows
+        ))
+    return demands
+
+
+def allocate_reservations(demands, snapshot):
+    """Decide the warehouse of every demand, taking each allocation out of `snapshot`.
+
+    `demands` must already be in the order they are to be served. A length
+    demand also needs its total cut length in the warehouse's Length Bin.
+    """
+    allocations = []
+    for demand in demands:
+        # Find warehouse with enough stock
+        warehouse, available = snapshot.find_warehouse(
+            demand.item_code, demand.required, demand.uom, length=demand.length
+        )
+        if warehouse:
+            snapshot.consume(demand.item_code, warehouse, demand.required, demand.uom, demand.length)
+
+        allocations.append(frappe._dict(
+            selector=demand.selector,
+            item_code=demand.item_code,
+            required=demand.required,
+            priority=demand.priority,
+            status="IS" if warehouse else "NIS",
+            reserve_tag=1 if warehouse else 0,
+            warehouse=warehouse,
+            available_quantity=available
+        ))
+    return allocations
+
+
+def reserve_selectors(docs):
+    """Allocate and write the reservation of `docs`; returns one allocation per selector item."""
+    settings = get_cutting_settings()
+    position = {doc.name: i for i, doc in enumerate(docs)}
+    demands = [demand for doc in docs for demand in get_reservation_demands(doc, settings)]
+    demands.sort(key=lambda demand: (demand.priority, position[demand.selector], demand.item_code))
+
+    # Bins, Length Bins, stock UOMs and conversion factors of every item in one go
+    snapshot = get_stock_snapshot(
+        {demand.item_code for demand in demands}, RESERVATION_WAREHOUSES, position, with_lengths=True
+    )
+    allocations = allocate_reservations(demands, snapshot)
+
+    updates = {}
+    for demand, allocation in zip(demands, allocations):
+        values = {field: allocation[field] for field in RESERVATION_FIELDS}
+        for row in demand.rows:
+            row.update(values)
+            updates[row.name] = values
+
+    update_rows("FG Raw Material Item", updates)
+    return allocations
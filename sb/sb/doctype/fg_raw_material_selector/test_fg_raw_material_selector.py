@@ -1,9 +1,211 @@
 # Copyright (c) 2025, ptpratul2@gmail.com and Contributors
 # See license.txt
 
-# import frappe
+import hashlib
+import json
+import os
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import frappe
 from frappe.tests.utils import FrappeTestCase
 
+from sb.sb.cutting import make_cutting_settings
+from sb.sb.doctype.fg_raw_material_selector.fg_raw_material_selector import (
+	FGRawMaterialSelector,
+	get_run_key,
+	merge_fg_code_chunks,
+	process_fg_code_chunk,
+	reserve_selectors,
+)
+from sb.sb.fg_expansion_cache import ExpansionCache
+from sb.sb.fg_rules import VALID_FG_CODES, expand_fg_code, parse_fg_code
+from sb.sb.stock_availability import StockSnapshot
+from sb.sb.tracing import get_recent_records, get_tracer
+
+# Per-family digests of the expansions produced by the original
+# process_single_fg_code over the grid walked in expansion_digest().
+GOLDEN_FILE = os.path.join(os.path.dirname(__file__), "fg_rules_golden.json")
+
+
+def expansion_digest(fg_code_part):
+	digest = hashlib.sha256()
+	for a in range(20, 621):
+		for b in (0, 50, 100, 125, 150):
+			for lengths in ("1200|", "1850|900"):
+				fg_code = f"{a}|{b}|{fg_code_part}|{lengths}"
+				for degree_cutting in (False, True):
+					raw_materials = expand_fg_code(*parse_fg_code(fg_code), degree_cutting)
+					digest.update(f"{fg_code}|{int(degree_cutting)}={json.dumps(raw_materials)}\n".encode())
+	return digest.hexdigest()
+
+
+SELECTOR_MODULE = "sb.sb.doctype.fg_raw_material_selector.fg_raw_material_selector"
+
 
 class TestFGRawMaterialSelector(FrappeTestCase):
-	pass
+	def test_rule_engine_matches_golden_file(self):
+		with open(GOLDEN_FILE) as f:
+			golden = json.load(f)
+
+		self.assertEqual(set(golden), set(VALID_FG_CODES))
+		for fg_code_part in VALID_FG_CODES:
+			with self.subTest(fg_code=fg_code_part):
+				self.assertEqual(expansion_digest(fg_code_part), golden[fg_code_part])
+
+	def test_parse_fg_code(self):
+		self.assertEqual(parse_fg_code("125|100|SL|1200|"), (125, 100, "SL", 1200, 0))
+		self.assertIsNone(parse_fg_code("125|100|SL|1200"))
+		self.assertEqual(expand_fg_code(125, 100, "XYZ", 1200, 0), [])
+
+	def test_expansion_cache(self):
+		cache = ExpansionCache(maxsize=2)
+		first = cache.get(125, 100, "SL", 1200, 0)
+		second = cache.get(125, 100, "SL", 1200, 0)
+		self.assertEqual((cache.hits, cache.misses), (1, 1))
+		self.assertEqual(first, expand_fg_code(125, 100, "SL", 1200, 0))
+		self.assertEqual(first, second)
+		self.assertIsNot(first[0], second[0])
+
+		cache.get(125, 100, "SL", 1200, 0, degree_cutting=True)
+		cache.get(150, 100, "IC", 1200, 0)
+		self.assertEqual(cache.stats(), {"hits": 1, "misses": 3, "size": 2})
+
+	def test_trace_levels(self):
+		doc = frappe._dict(trace_level="Warning")
+		tracer = get_tracer("fg_selector_test", doc)
+		with patch("frappe.log_error") as log_error:
+			tracer.debug("dropped %s", object())
+			tracer.info("dropped too")
+			tracer.warning("kept %s", "warning")
+			tracer.error("failed %s", "here", title="FG Raw Material Error")
+
+		log_error.assert_called_once_with(message="failed here", title="FG Raw Material Error")
+		messages = [r["message"] for r in get_recent_records(tracer="fg_selector_test")]
+		self.assertEqual(messages, ["kept warning", "failed here"])
+
+	def test_failed_chunk_keeps_raw_materials(self):
+		doc = SimpleNamespace(name="SEL-1", tracer=get_tracer("fg_selector"), trace_level="Off")
+		doc.save_raw_materials = lambda codes, plan: list(codes)
+		doc.iter_raw_materials = lambda components: iter([{"item_code": components[0]}])
+		cache = frappe.cache()
+
+		def run(fail_chunk=None):
+			cache.set_value(get_run_key("SEL-1"), "RUN", expires_in_sec=60)
+			cache.set_value("sb_fg_chunk_plan:RUN", SimpleNamespace(full=True, clear_all=True), expires_in_sec=60)
+			for chunk_index in range(2):
+				if chunk_index == fail_chunk:
+					with patch.object(doc, "iter_raw_materials", side_effect=ValueError("bad FG code")):
+						process_fg_code_chunk("SEL-1", "RUN", chunk_index, 2, [f"RM-{chunk_index}"])
+				else:
+					process_fg_code_chunk("SEL-1", "RUN", chunk_index, 2, [f"RM-{chunk_index}"])
+
+		with (
+			patch("frappe.db.get_value", return_value={"name": "SEL-1", "trace_level": "Off"}),
+			patch("frappe.get_doc", return_value=doc),
+			patch("frappe.enqueue") as enqueue,
+			patch("frappe.publish_realtime") as publish,
+			patch.object(doc, "save_raw_materials", wraps=doc.save_raw_materials) as save,
+		):
+			run()
+			self.assertEqual(enqueue.call_args.args[0].rsplit(".", 1)[1], "merge_fg_code_chunks")
+			merge_fg_code_chunks("SEL-1", "RUN", 2)
+			self.assertEqual(save.call_count, 1)
+
+			# A failed chunk aborts the merge before the table is touched
+			run(fail_chunk=1)
+			merge_fg_code_chunks("SEL-1", "RUN", 2)
+			self.assertEqual(save.call_count, 1)
+			self.assertIn("chunk 2 of 2 failed: bad FG code", publish.call_args.kwargs["message"])
+
+			# So does a result that expired before the merge
+			run()
+			cache.delete_value("sb_fg_chunk:RUN:0")
+			cache.delete_value("sb_fg_chunk_status:RUN:0")
+			merge_fg_code_chunks("SEL-1", "RUN", 2)
+			self.assertEqual(save.call_count, 1)
+			self.assertIn("result of chunk 1 of 2 expired", publish.call_args.kwargs["message"])
+			self.assertIsNone(cache.get_value(get_run_key("SEL-1")))
+
+	def test_inline_run_supersedes_chunked_run(self):
+		doc = SimpleNamespace(name="SEL-1")
+		doc.get_expansion_plan = lambda: SimpleNamespace(expand=None, full=True, clear_all=False)
+		doc.collect_fg_components = lambda expand: ["FG-1"]
+		frappe.cache().set_value(get_run_key("SEL-1"), "OLD", expires_in_sec=60)
+		with patch.object(doc, "process_fg_codes", create=True) as process:
+			FGRawMaterialSelector.enqueue_fg_code_chunks(doc)
+		process.assert_called_once()
+		self.assertIsNone(frappe.cache().get_value(get_run_key("SEL-1")))
+
+		# The older run's merge now counts as superseded
+		doc = SimpleNamespace(tracer=get_tracer("fg_selector"), save_raw_materials=None)
+		with (
+			patch("frappe.get_doc", return_value=doc),
+			patch.object(doc, "save_raw_materials") as save,
+		):
+			merge_fg_code_chunks("SEL-1", "OLD", 2)
+		self.assertFalse(save.called)
+
+	def test_bulk_reservation(self):
+		def selector(name, priority):
+			return frappe._dict(name=name, raw_materials=[
+				frappe._dict(name=f"{name}-1", item_code="RM-1", dimension="4000", quantity=3, priority=priority),
+				frappe._dict(name=f"{name}-2", item_code="RM-2", quantity=2, priority=""),
+			])
+
+		docs = [selector("SEL-1", "3"), selector("SEL-2", "1")]
+		snapshot = StockSnapshot({"RM-1": {"Off-Cut - VD": 2, "Raw Material - VD": 4}, "RM-2": {"Raw Material - VD": 3}}, {})
+		with (
+			patch(f"{SELECTOR_MODULE}.get_cutting_settings", return_value=make_cutting_settings()),
+			patch(f"{SELECTOR_MODULE}.get_stock_snapshot", return_value=snapshot),
+			patch(f"{SELECTOR_MODULE}.update_rows") as update_rows,
+		):
+			allocations = reserve_selectors(docs)
+
+		# SEL-2's priority wins RM-1; RM-2 has no priority and goes in selector order
+		self.assertEqual(
+			[(a.selector, a.item_code, a.status, a.warehouse) for a in allocations],
+			[
+				("SEL-2", "RM-1", "IS", "Raw Material - VD"),
+				("SEL-1", "RM-1", "NIS", ""),
+				("SEL-1", "RM-2", "IS", "Raw Material - VD"),
+				("SEL-2", "RM-2", "NIS", ""),
+			]
+		)
+		self.assertEqual(allocations[1].available_quantity, 3)
+		update_rows.assert_called_once()
+		self.assertEqual(len(update_rows.call_args.args[1]), 4)
+		self.assertEqual(docs[0].raw_materials[1].warehouse, "Raw Material - VD")
+
+	def test_length_checked_reservation(self):
+		doc = frappe._dict(name="SEL-1", raw_materials=[
+			frappe._dict(name="SEL-1-1", item_code="RM-1", dimension="4000", quantity=3, priority=""),
+		])
+		tables = {
+			"Bin": [
+				frappe._dict(item_code="RM-1", warehouse="Off-Cut - VD", actual_qty=5),
+				frappe._dict(item_code="RM-1", warehouse="Raw Material - VD", actual_qty=5),
+			],
+			"Soft Reservation": [],
+			"Length Bin": [
+				# Enough offcut pieces, but they are too short for 12 m of cuts
+				frappe._dict(item_code="RM-1", warehouse="Off-Cut - VD", total_length=5000, piece_count=5, length_histogram='{"1000": 5}'),
+				frappe._dict(item_code="RM-1", warehouse="Raw Material - VD", total_length=30000, piece_count=5, length_histogram='{"6000": 5}'),
+			],
+		}
+		with (
+			patch(f"{SELECTOR_MODULE}.get_cutting_settings", return_value=make_cutting_settings()),
+			patch("frappe.get_all", side_effect=lambda doctype, **kwargs: tables[doctype]) as get_all,
+			patch("sb.sb.stock_availability.get_uom_info", return_value={}),
+			patch(f"{SELECTOR_MODULE}.update_rows"),
+		):
+			allocations = reserve_selectors([doc])
+		self.assertIn("Length Bin", [call.args[0] for call in get_all.call_args_list])
+		self.assertEqual((allocations[0].status, allocations[0].warehouse), ("IS", "Raw Material - VD"))
+
+		# The allocated length is taken out for the next demand; items without a Length Bin only check qty
+		snapshot = StockSnapshot({"RM-1": {"Raw Material - VD": 10}, "RM-2": {"Raw Material - VD": 1}}, {}, {"RM-1": {"Raw Material - VD": 20000}})
+		snapshot.consume("RM-1", "Raw Material - VD", 3, length=12000)
+		self.assertEqual(snapshot.find_warehouse("RM-1", 3, length=12000), ("", 7))
+		self.assertEqual(snapshot.find_warehouse("RM-1", 1, length=8000), ("Raw Material - VD", 7))
+		self.assertEqual(snapshot.find_warehouse("RM-2", 1, length=5000), ("Raw Material - VD", 1))
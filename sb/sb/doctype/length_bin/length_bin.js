@@ -0,0 +1,8 @@
+// Copyright (c) 2025, ptpratul2@gmail.com and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Length Bin", {
+// 	refresh(frm) {
+
+// 	},
+// });
@@ -0,0 +1,13 @@
+# Copyright (c) 2025, ptpratul2@gmail.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class LengthBin(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_unique("Length Bin", ["item_code", "warehouse"], constraint_name="unique_item_warehouse")
@@ -0,0 +1,159 @@
+# Copyright (c) 2025, ptpratul2@gmail.com and Contributors
+# See license.txt
+
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from sb.sb.length_bins import (
+	apply_length_moves,
+	get_length_balance,
+	get_voucher_moves,
+	rebuild_length_bins,
+	update_length_bins,
+)
+
+
+class LengthBinTable:
+	"""Length Bins kept in memory behind `frappe.get_all`, `set_value` and `get_doc`."""
+
+	def __init__(self, rows=()):
+		self.rows = {row.name: row for row in rows}
+		self.parallel_inserts = []
+
+	def get_all(self, doctype, filters=None, **kwargs):
+		filters = filters or {}
+		return [
+			frappe._dict(row) for row in self.rows.values()
+			if all(
+				row[field] in value[1] if isinstance(value, list) else row[field] == value
+				for field, value in filters.items()
+			)
+		]
+
+	def set_value(self, doctype, name, values):
+		self.rows[name].update(values)
+
+	def get_doc(self, values):
+		doc = MagicMock()
+		doc.insert.side_effect = lambda **kwargs: self.insert(values)
+		return doc
+
+	def insert(self, values):
+		if self.parallel_inserts:
+			# Another submit committed the same pair first; the unique key rejects this one
+			self.insert(self.parallel_inserts.pop())
+		if any((row.item_code, row.warehouse) == (values["item_code"], values["warehouse"]) for row in self.rows.values()):
+			raise frappe.UniqueValidationError
+		name = f"LB-{len(self.rows) + 1}"
+		self.rows[name] = frappe._dict(values, name=name)
+
+	def delete(self, doctype, filters=None):
+		self.rows.clear()
+
+	def patch(self):
+		return (
+			patch("frappe.get_all", side_effect=self.get_all),
+			patch("sb.sb.length_bins.frappe.db.set_value", create=True, side_effect=self.set_value),
+			patch("sb.sb.length_bins.frappe.db.delete", create=True, side_effect=self.delete),
+			patch("sb.sb.length_bins.frappe.get_doc", create=True, side_effect=self.get_doc),
+			patch("frappe.db.savepoint", create=True),
+			patch("frappe.db.rollback", create=True),
+		)
+
+	def histogram(self, item_code, warehouse):
+		for row in self.rows.values():
+			if (row.item_code, row.warehouse) == (item_code, warehouse):
+				return json.loads(row.length_histogram), row.total_length, row.piece_count
+
+
+def stock_entry():
+	return SimpleNamespace(doctype="Stock Entry", items=[
+		frappe._dict(item_code="RM-1", custom_length=1200, transfer_qty=3, s_warehouse="Raw Material - VD", t_warehouse="Off-Cut - VD"),
+		frappe._dict(item_code="RM-1", custom_length=800, transfer_qty=2, s_warehouse=None, t_warehouse="Off-Cut - VD"),
+		frappe._dict(item_code="RM-2", custom_length=0, transfer_qty=5, s_warehouse=None, t_warehouse="Off-Cut - VD"),
+	])
+
+
+class TestLengthBin(FrappeTestCase):
+	def test_voucher_moves(self):
+		entry = stock_entry()
+		moves = get_voucher_moves(entry)
+		self.assertEqual(moves[("RM-1", "Off-Cut - VD")], {1200: 3, 800: 2})
+		self.assertEqual(moves[("RM-1", "Raw Material - VD")], {1200: -3})
+		self.assertNotIn(("RM-2", "Off-Cut - VD"), moves)
+		self.assertEqual(get_voucher_moves(entry, sign=-1)[("RM-1", "Off-Cut - VD")], {1200: -3, 800: -2})
+
+		receipt = SimpleNamespace(doctype="Purchase Receipt", items=[
+			frappe._dict(item_code="RM-1", custom_length=6000, stock_qty=4, qty=2, warehouse="Raw Material - VD"),
+		])
+		self.assertEqual(get_voucher_moves(receipt)[("RM-1", "Raw Material - VD")], {6000: 4})
+
+	def test_apply_length_moves(self):
+		moves = get_voucher_moves(stock_entry())
+		existing = frappe._dict(name="LB-1", item_code="RM-1", warehouse="Off-Cut - VD", length_histogram='{"800": 1, "2500.5": 1}')
+		with (
+			patch("frappe.get_all", return_value=[existing]),
+			patch("sb.sb.length_bins.frappe.db.set_value", create=True) as set_value,
+			patch("sb.sb.length_bins.frappe.get_doc", create=True) as get_doc,
+		):
+			apply_length_moves({("RM-1", "Off-Cut - VD"): moves[("RM-1", "Off-Cut - VD")], ("RM-1", "Raw Material - VD"): {1200: 4}})
+		self.assertEqual(set_value.call_args.args[2], {
+			"total_length": 8500.5,
+			"piece_count": 7,
+			"length_histogram": '{"800": 3.0, "1200": 3.0, "2500.5": 1.0}'
+		})
+		self.assertEqual(get_doc.call_args.args[0]["total_length"], 4800)
+
+	def test_cancel_reverses_submit(self):
+		table = LengthBinTable([
+			frappe._dict(name="LB-1", item_code="RM-1", warehouse="Raw Material - VD", total_length=24000, piece_count=20, length_histogram='{"1200": 20}'),
+		])
+		get_all, set_value, delete, get_doc, savepoint, rollback = table.patch()
+		with get_all, set_value, delete, get_doc, savepoint, rollback:
+			update_length_bins(stock_entry())
+			self.assertEqual(table.histogram("RM-1", "Off-Cut - VD"), ({"800": 2.0, "1200": 3.0}, 5200, 5))
+			self.assertEqual(table.histogram("RM-1", "Raw Material - VD"), ({"1200": 17.0}, 20400, 17))
+
+			update_length_bins(stock_entry(), sign=-1)
+			self.assertEqual(table.histogram("RM-1", "Off-Cut - VD"), ({}, 0, 0))
+			self.assertEqual(table.histogram("RM-1", "Raw Material - VD"), ({"1200": 20.0}, 24000, 20))
+			self.assertEqual(get_length_balance("RM-1", "Off-Cut - VD").total_length, 0)
+			self.assertEqual(get_length_balance("RM-1", "Raw Material - VD").histogram, {1200: 20})
+
+	def test_parallel_first_submits(self):
+		table = LengthBinTable()
+		table.parallel_inserts.append({
+			"doctype": "Length Bin", "item_code": "RM-1", "warehouse": "Off-Cut - VD",
+			"total_length": 2400, "piece_count": 2, "length_histogram": '{"1200": 2}'
+		})
+		get_all, set_value, delete, get_doc, savepoint, rollback = table.patch()
+		with get_all, set_value, delete, get_doc, savepoint, rollback as rollback_to:
+			apply_length_moves({("RM-1", "Off-Cut - VD"): {1200: 3, 800: 2}})
+		rollback_to.assert_called_once_with(save_point="sb_length_bin")
+
+		# One row per pair, holding both submits
+		self.assertEqual(len(table.rows), 1)
+		self.assertEqual(table.histogram("RM-1", "Off-Cut - VD"), ({"800": 2.0, "1200": 5.0}, 7600, 7))
+
+	def test_rebuild_length_bins(self):
+		table = LengthBinTable([
+			frappe._dict(name="LB-1", item_code="RM-9", warehouse="Off-Cut - VD", total_length=1, piece_count=1, length_histogram='{"1": 1}'),
+		])
+		ledger = [
+			frappe._dict(item_code="RM-1", warehouse="Off-Cut - VD", custom_length=1200, qty=3),
+			frappe._dict(item_code="RM-1", warehouse="Off-Cut - VD", custom_length=800.0004, qty=2),
+			frappe._dict(item_code="RM-1", warehouse="Raw Material - VD", custom_length=6000, qty=4),
+		]
+		get_all, set_value, delete, get_doc, savepoint, rollback = table.patch()
+		with get_all, set_value, delete, get_doc, savepoint, rollback, patch.object(frappe.qb, "from_", create=True) as from_:
+			from_.return_value.select.return_value.where.return_value.groupby.return_value.run.return_value = ledger
+			self.assertEqual(rebuild_length_bins(), 2)
+
+		# Bins of items no longer on the ledger are dropped
+		self.assertIsNone(table.histogram("RM-9", "Off-Cut - VD"))
+		self.assertEqual(table.histogram("RM-1", "Off-Cut - VD"), ({"800": 2.0, "1200": 3.0}, 5200, 5))
+		self.assertEqual(table.histogram("RM-1", "Raw Material - VD"), ({"6000": 4.0}, 24000, 4))
@@ -4,64 +4,105 @@
 
 import frappe
 from frappe.model.document import Document
-from frappe.utils import flt
+from frappe.query_builder.functions import Count, Sum
+from frappe.utils import flt, now_datetime
+
+from sb.sb.bulk_write import delete_child_rows, touch_parent
+
+UPLOAD_ITEM_DOCTYPE = "Project Design Upload Item"
+
+# FG Components field <- Project Design Upload Item column, copied as-is
+CONSOLIDATED_FIELDS = {
+    "project_design_upload": "parent",
+    "project_design_upload_item": "name",
+    "fg_code": "fg_code",
+    "quantity": "ifnull(quantity, 0)",
+    "ipo_name": "ipo_name",
+    "a": "a",
+    "b": "b",
+    "code": "code",
+    "l1": "l1",
+    "l2": "l2",
+    "dwg_no": "dwg_no",
+    "u_area": "u_area",
+}
 
 
 class PlanningBOM(Document):
     pass
 
 
+def get_selected_uploads(doc):
+    """Selected Project Design Uploads in selection order, without repeats."""
+    return list(dict.fromkeys(row.project_design for row in doc.project_design_upload if row.project_design))
+
+
+def get_upload_items_query(uploads):
+    item = frappe.qb.DocType(UPLOAD_ITEM_DOCTYPE)
+    return frappe.qb.from_(item).where(
+        (item.parenttype == "Project Design Upload")
+        & (item.parentfield == "items")
+        & item.parent.isin(uploads)
+    )
+
+
 @frappe.whitelist()
 def consolidate_project_design_uploads(docname):
     """
     Append all items from selected Project Design Upload documents
     into Planning BOM without consolidation (as-is).
+
+    The rows are copied with one INSERT ... SELECT, in selection order,
+    instead of loading every upload.
     """
     doc = frappe.get_doc("Planning BOM", docname)
-    
+    doc.check_permission("write")
+
     if not doc.project_design_upload:
         frappe.throw("Please select at least one Project Design Upload document")
-    
+
+    uploads = get_selected_uploads(doc)
+
     # Clear existing items
-    doc.set("items", [])
-    
-    item_count = 0
-    
-    # Process each selected Project Design Upload
-    for row in doc.project_design_upload:
-        design_upload_name = row.project_design
-        design_upload_doc = frappe.get_doc("Project Design Upload", design_upload_name)
-        
-        # Directly append each item without consolidation
-        for item in design_upload_doc.items:
-            doc.append("items", {
-                'project_design_upload': item.get('parent'),
-                'project_design_upload_item': item.get('name'),
-                'fg_code': item.get('fg_code'),
-                'item_code': item.get('item_code'),
-                'dimension': item.get('dimension'),
-                'quantity': flt(item.get('quantity', 0)),
-                'remark': item.get('remark'),
-                'project': item.get('project'),
-                'ipo_name': item.get('ipo_name'),
-                'a': item.get('a'),
-                'b': item.get('b'),
-                'code': item.get('code'),
-                'l1': item.get('l1'),
-                'l2': item.get('l2'),
-                'dwg_no': item.get('dwg_no'),
-                'u_area': item.get('u_area'),
-                'source_document': design_upload_name
-            })
-            item_count += 1
-    
-    # Save the document
-    doc.save()
-    
+    delete_child_rows(doc, "items")
+
+    # field() needs the names as separate arguments to order by selection
+    upload_params = {f"upload_{i}": upload for i, upload in enumerate(uploads)}
+    upload_order = ", ".join(f"%({key})s" for key in upload_params)
+
+    now = now_datetime()
+    frappe.db.sql(
+        f"""
+        insert into `tabFG Components` (
+            name, parent, parenttype, parentfield, idx, docstatus,
+            owner, modified_by, creation, modified, {", ".join(CONSOLIDATED_FIELDS)}
+        )
+        select
+            substr(md5(concat(name, %(parent)s, uuid())), 1, 10), %(parent)s, %(parenttype)s, 'items',
+            row_number() over (order by field(parent, {upload_order}), idx), %(docstatus)s,
+            %(user)s, %(user)s, %(now)s, %(now)s, {", ".join(CONSOLIDATED_FIELDS.values())}
+        from `tab{UPLOAD_ITEM_DOCTYPE}`
+        where parenttype = 'Project Design Upload' and parentfield = 'items' and parent in %(uploads)s
+        """,
+        {
+            "parent": doc.name,
+            "parenttype": doc.doctype,
+            "docstatus": doc.docstatus or 0,
+            "user": frappe.session.user,
+            "now": now,
+            "uploads": tuple(uploads),
+            **upload_params,
+        },
+    )
+    item_count = frappe.db.count("FG Components", {"parent": doc.name, "parenttype": doc.doctype, "parentfield": "items"})
+    touch_parent(doc)
+
     return {
         "status": "success",
         "message": f"Successfully appended {item_count} items from {len(doc.project_design_upload)} Project Design Upload documents without consolidation"
     }
+
+
 @frappe.whitelist()
 def get_consolidation_preview(docname):
     """
@@ -69,67 +110,93 @@ def get_consolidation_preview(docname):
     without consolidation (as-is).
     """
     doc = frappe.get_doc("Planning BOM", docname)
-    
+
     if not doc.project_design_upload:
         return {"preview": []}
-    
-    preview = []
-    total_qty = 0
-    total_unit_area = 0
 
-    for row in doc.project_design_upload:
-        design_upload_doc = frappe.get_doc("Project Design Upload", row.project_design)
-        
-        for item in design_upload_doc.items:
-            quantity = flt(item.get('quantity', 0))
-            u_area = flt(item.get('u_area', 0))
-
-            preview.append({
-                'fg_code': item.get('fg_code'),
-                'item_code': item.get('item_code'),
-                'dimension': item.get('dimension'),
-                'quantity': quantity,
-                'u_area': u_area,  # ✅ include u_area in each row
-                'project': item.get('project'),
-                'source_document': row.project_design
-            })
-
-            total_qty += quantity
-            total_unit_area += u_area  # ✅ accumulate while iterating
-    
+    uploads = get_selected_uploads(doc)
+    item = frappe.qb.DocType(UPLOAD_ITEM_DOCTYPE)
+
+    totals = (
+        get_upload_items_query(uploads)
+        .select(
+            Count(item.name).as_("total_items"),
+            Sum(item.quantity).as_("total_quantity"),
+            Sum(item.u_area).as_("total_unit_area"),
+        )
+    ).run(as_dict=True)[0]
+
+    position = {upload: i for i, upload in enumerate(uploads)}
+    rows = (
+        get_upload_items_query(uploads)
+        .select(item.parent, item.idx, item.fg_code, item.quantity, item.u_area)
+    ).run(as_dict=True)
+    rows.sort(key=lambda row: (position[row.parent], row.idx))
+
+    preview = [
+        {
+            'fg_code': row.fg_code,
+            'item_code': None,
+            'dimension': None,
+            'quantity': flt(row.quantity),
+            'u_area': flt(row.u_area),
+            'project': None,
+            'source_document': row.parent
+        }
+        for row in rows
+    ]
+
     return {
         "preview": preview,
-        "total_items": len(preview),
-        "total_quantity": total_qty,
-        "total_unit_area": total_unit_area
+        "total_items": totals.total_items or 0,
+        "total_quantity": flt(totals.total_quantity),
+        "total_unit_area": flt(totals.total_unit_area)
     }
 
+
 @frappe.whitelist()
 def get_project_design_upload_summary(docname):
     """
     Get summary of selected Project Design Upload documents
     """
     doc = frappe.get_doc("Planning BOM", docname)
-    
+
     if not doc.project_design_upload:
         return {"summary": []}
-    
+
+    uploads = get_selected_uploads(doc)
+    item = frappe.qb.DocType(UPLOAD_ITEM_DOCTYPE)
+    item_counts = dict(
+        (
+            get_upload_items_query(uploads)
+            .select(item.parent, Count(item.name))
+            .groupby(item.parent)
+        ).run()
+    )
+    details = {
+        row.name: row
+        for row in frappe.get_all(
+            "Project Design Upload",
+            filters={"name": ["in", uploads]},
+            fields=["name", "project", "upload_date", "processed_status"]
+        )
+    }
+
     summary = []
     total_items = 0
-    
     for row in doc.project_design_upload:
-        design_upload_doc = frappe.get_doc("Project Design Upload", row.project_design)
-        item_count = len(design_upload_doc.items)
+        upload = details.get(row.project_design) or frappe._dict()
+        item_count = item_counts.get(row.project_design, 0)
         total_items += item_count
-        
+
         summary.append({
             "name": row.project_design,
-            "project": design_upload_doc.project,
-            "upload_date": design_upload_doc.upload_date,
+            "project": upload.project,
+            "upload_date": upload.upload_date,
             "item_count": item_count,
-            "processed_status": design_upload_doc.processed_status
+            "processed_status": upload.processed_status
         })
-    
+
     return {
         "summary": summary,
         "total_documents": len(doc.project_design_upload),
@@ -9,6 +9,40 @@
 
 
 frappe.ui.form.on("Project Design Upload", {
+    onload(frm) {
+        frappe.realtime.off("design_upload_progress");
+        frappe.realtime.on("design_upload_progress", (data) => {
+            if (data.docname !== frm.doc.name) return;
+
+            if (data.failed) {
+                frappe.hide_progress();
+                frappe.msgprint(__("The import failed. Please check the Error Log."));
+            } else if (data.finished) {
+                frappe.hide_progress();
+                if (data.rejected) {
+                    frappe.msgprint({
+                        title: __("Imported {0} rows, rejected {1}", [data.done, data.rejected]),
+                        message: `<pre>${frappe.utils.escape_html(data.summary || "")}</pre>`,
+                        indicator: "orange",
+                    });
+                } else {
+                    const changes = data.changes || {};
+                    frappe.show_alert({
+                        message: __("Imported {0} rows: {1} new, {2} changed, {3} removed", [
+                            data.done,
+                            changes.inserted || 0,
+                            changes.updated || 0,
+                            changes.deleted || 0,
+                        ]),
+                        indicator: "green",
+                    });
+                }
+                frm.reload_doc();
+            } else if (data.total) {
+                frappe.show_progress(__("Importing"), data.done, data.total, __("{0} of {1} rows", [data.done, data.total]));
+            }
+        });
+    },
     refresh(frm) {
         if (!frm.is_new()) {
             frm.add_custom_button("Submit", function () {
@@ -17,7 +51,6 @@ frappe.ui.form.on("Project Design Upload", {
                     args: { docname: frm.doc.name },
                     callback(r) {
                         if (!r.exc) {
-                            frappe.msgprint(`Imported ${r.message.rows} rows from Excel.`);
                             frm.reload_doc();
                         }
                     }
@@ -8,13 +8,38 @@ class ProjectDesignUpload(Document):
 	pass
 
 
+import csv
+import hashlib
+import json
+from collections import Counter
+from contextlib import contextmanager
+
 import frappe
 import pandas as pd
+from frappe.model import no_value_fields
 from frappe.utils.file_manager import get_file_path
 
+from sb.sb.bulk_write import get_child_doctype, insert_child_rows, touch_parent, update_rows
+from sb.sb.fg_rules import parse_fg_code
+
+CHILD_TABLE_FIELDNAME = "items"
+NUMERIC_FIELDTYPES = ("Float", "Currency", "Percent", "Int")
+DESIGN_FILE_EXTENSIONS = (".xls", ".xlsx", ".csv")
+IMPORT_CHUNK_SIZE = 2000
+# Only this many rejected rows are listed in the summary; all are counted
+MAX_LISTED_REJECTIONS = 1000
+# A sheet row is matched to a stored row on these
+ROW_KEY_FIELDS = ("fg_code", "ipo_name", "dwg_no")
+IMPORT_STATE_FIELDS = (
+    "processed_status", "rows_imported", "rows_rejected", "last_imported_row", "import_summary", "file_hash"
+)
+
+
 @frappe.whitelist()
 def import_from_excel_on_submit(docname):
+    """Queue the import of the attached sheet, unless it is the one already imported."""
     doc = frappe.get_doc("Project Design Upload", docname)
+    doc.check_permission("write")
 
     # Step 1: Locate attached Excel file
     file_path = None
@@ -23,56 +48,316 @@ def import_from_excel_on_submit(docname):
         "attached_to_name": doc.name
     }, fields=["file_url"]):
         path = get_file_path(file.file_url)
-        if path.endswith((".xls", ".xlsx")):
+        if path.lower().endswith(DESIGN_FILE_EXTENSIONS):
             file_path = path
             break
 
     if not file_path:
-        frappe.throw("No Excel file (.xls or .xlsx) is attached to this Project BOM.")
-
-    # Step 2: Read Excel with header normalization
-    df = pd.read_excel(file_path)
-    
-    # Normalize column names (remove spaces/special chars, make lowercase)
-    df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
-    df = df.where(pd.notnull(df), None)
-    
-    # Debug: Show what columns were found
-    frappe.logger().debug(f"Excel columns after normalization: {list(df.columns)}")
-
-    # Step 3: Get valid fields
-    child_table_fieldname = "items"
-    child_doctype = "FG Components"
-    valid_fields = [f.fieldname for f in frappe.get_meta(child_doctype).fields]
-    
-    # Debug: Show field mapping
-    frappe.logger().debug(f"Valid fields in {child_doctype}: {valid_fields}")
-
-    # Step 4: Clear existing items
-    doc.set(child_table_fieldname, [])
-
-    # Step 5: Append rows with case-insensitive matching
-    for _, row in df.iterrows():
-        row_data = {}
-        for col in row.index:
-            # Case-insensitive match to fieldnames
-            matched_field = next((f for f in valid_fields if f.lower() == col.lower()), None)
-            if matched_field:
-                row_data[matched_field] = row[col]
-            else:
-                frappe.logger().debug(f"Ignoring column '{col}' - no matching field in {child_doctype}")
-        
-        if row_data:  # Only append if we found matching fields
-            frappe.logger().debug(f"Adding row with data: {row_data}")
-            doc.append(child_table_fieldname, row_data)
-        else:
-            frappe.logger().debug(f"Skipping empty row: {dict(row)}")
-
-    # Step 6: Save
+        frappe.throw("No Excel (.xls or .xlsx) or CSV file is attached to this Project BOM.")
+
+    file_hash = get_file_hash(file_path)
+    if doc.processed_status == "Completed" and doc.file_hash == file_hash:
+        frappe.msgprint("This file has already been imported. Nothing has changed.")
+        return {"status": "unchanged"}
+
+    if doc.processed_status != "In Progress":
+        doc.db_set("processed_status", "Pending")
+
+    job_id = f"project_design_upload::{doc.name}"
+    # enqueue returns the rq Job, or None when deduplicate drops the call
+    job = frappe.enqueue(
+        "sb.sb.doctype.project_design_upload.project_design_upload.import_design_upload",
+        queue="long",
+        timeout=7200,
+        job_id=job_id,
+        deduplicate=True,
+        docname=doc.name,
+        file_path=file_path,
+        file_hash=file_hash
+    )
+    if job is None:
+        frappe.msgprint(f"An import of this upload is already queued (Job ID: {job_id}).")
+        return {"status": "already_queued", "job_id": job_id}
+
+    frappe.msgprint(f"The import has been queued (Job ID: {job_id}).")
+    return {"status": "queued", "job_id": job_id}
+
+
+def import_design_upload(docname, file_path, file_hash=None):
+    """Background job: import the sheet chunk by chunk and publish a summary at the end."""
+    doc = frappe.get_doc("Project Design Upload", docname)
+    try:
+        import_design_rows(doc, file_path, file_hash=file_hash)
+    except Exception:
+        frappe.db.rollback()
+        frappe.log_error(title=f"Project Design Upload import failed: {docname}")
+        frappe.publish_realtime(
+            "design_upload_progress",
+            {"docname": docname, "failed": True},
+            doctype="Project Design Upload",
+            docname=docname
+        )
+        return
+
+    frappe.publish_realtime(
+        "design_upload_progress",
+        {
+            "docname": docname,
+            "finished": True,
+            "done": doc.rows_imported,
+            "rejected": doc.rows_rejected,
+            "summary": doc.import_summary,
+            "changes": doc.flags.import_changes
+        },
+        doctype="Project Design Upload",
+        docname=docname
+    )
+
+
+def import_design_rows(doc, file_path, chunk_size=IMPORT_CHUNK_SIZE, file_hash=None):
+    """Bring the child table of `doc` in line with the sheet at `file_path` and return the accepted row count.
+
+    Sheet rows are matched to stored rows on fg_code, ipo_name and dwg_no
+    (and their order among equal keys) and compared by `row_hash`. Only new,
+    changed and vanished rows are written, so unchanged rows keep their
+    names for the Planning BOMs that point at them. `idx` follows the
+    sheet: rows that only moved get their new `idx` and nothing else.
+
+    Each chunk of `chunk_size` rows is committed together with the sheet
+    row it reached. An interrupted import is simply run again; the chunks
+    it already applied are no-ops the second time. Rejected rows are
+    counted and listed in `import_summary`.
+    """
+    child_doctype = get_child_doctype(doc, CHILD_TABLE_FIELDNAME)
+    meta = frappe.get_meta(child_doctype)
+    total = get_sheet_row_count(file_path)
+    existing = get_stored_rows(doc, child_doctype)
+
+    doc.update({
+        "processed_status": "In Progress",
+        "rows_imported": 0,
+        "rows_rejected": 0,
+        "last_imported_row": 0,
+        "import_summary": ""
+    })
+    save_import_state(doc)
+
+    rejections = []
+    occurrences = Counter()
+    changes = Counter()
+    for chunk in iter_design_chunks(file_path, child_doctype, chunk_size):
+        inserts, updates, moved = [], {}, 0
+        for row_no, row in chunk:
+            errors = validate_design_row(row, meta)
+            if errors:
+                doc.rows_rejected += 1
+                if len(rejections) < MAX_LISTED_REJECTIONS:
+                    rejections.append(f"Row {row_no}: {'; '.join(errors)}")
+                continue
+
+            doc.rows_imported += 1
+            row["row_hash"] = get_row_hash(row)
+            stored = existing.pop(get_row_key(row, occurrences), None)
+            # Accepted rows are numbered in sheet order; rows later in the sheet may
+            # share an idx with this one until their own chunk renumbers them
+            row["idx"] = doc.rows_imported
+            if not stored:
+                inserts.append(row)
+            elif stored.row_hash != row["row_hash"]:
+                updates[stored.name] = row
+            elif stored.idx != row["idx"]:
+                updates[stored.name] = {"idx": row["idx"]}
+                moved += 1
+
+        if inserts:
+            insert_child_rows(doc, CHILD_TABLE_FIELDNAME, inserts, chunk_size=chunk_size)
+        if updates:
+            update_rows(child_doctype, updates, chunk_size=chunk_size)
+        changes.update(inserted=len(inserts), updated=len(updates) - moved, moved=moved)
+
+        doc.last_imported_row = chunk[-1][0]
+        doc.import_summary = "\n".join(rejections)
+        save_import_state(doc)
+
+        frappe.publish_realtime(
+            "design_upload_progress",
+            {"docname": doc.name, "done": doc.last_imported_row - 1, "total": total},
+            doctype=doc.doctype,
+            docname=doc.name
+        )
+
+    # Whatever was not matched is no longer in the sheet
+    removed = [row.name for row in existing.values()]
+    for start in range(0, len(removed), chunk_size):
+        frappe.db.delete(child_doctype, {"name": ["in", removed[start:start + chunk_size]]})
+    changes["deleted"] = len(removed)
+
+    doc.processed_status = "Completed"
+    doc.file_hash = file_hash or get_file_hash(file_path)
+    save_import_state(doc)
+    doc.flags.import_changes = dict(changes)
+    return doc.rows_imported
+
+
+def get_stored_rows(doc, child_doctype):
+    """Return the stored child rows keyed like `get_row_key()`, in `idx` order."""
+    occurrences = Counter()
+    return {
+        get_row_key(row, occurrences): row
+        for row in frappe.get_all(
+            child_doctype,
+            filters={"parent": doc.name, "parenttype": doc.doctype, "parentfield": CHILD_TABLE_FIELDNAME},
+            fields=["name", "idx", "row_hash", *ROW_KEY_FIELDS],
+            order_by="idx asc"
+        )
+    }
+
+
+def get_row_key(row, occurrences):
+    """`(fg_code, ipo_name, dwg_no, n)` for the n-th row with those values."""
+    key = tuple("" if row.get(field) is None else str(row.get(field)) for field in ROW_KEY_FIELDS)
+    occurrences[key] += 1
+    return (*key, occurrences[key])
+
+
+def get_row_hash(row):
+    values = {fieldname: value for fieldname, value in row.items() if fieldname != "row_hash"}
+    return hashlib.sha1(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def get_file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def save_import_state(doc):
+    """Store the import counters on the parent and commit them with the rows written so far."""
+    touch_parent(doc, {
+        field: doc.get(field)
+        for field in IMPORT_STATE_FIELDS
+    })
+    frappe.db.commit()
+
+
+def validate_design_row(row, meta):
+    """Coerce the numeric fields of `row` in place and return why it is rejected, if it is."""
+    errors = []
+    fg_code = row.get("fg_code")
+    if fg_code in (None, ""):
+        errors.append("FG Code is missing")
+    elif not parse_fg_code(str(fg_code)):
+        errors.append(f"FG Code '{fg_code}' is not in A|B|CODE|L1|L2 form")
+
+    for fieldname, value in row.items():
+        field = meta.get_field(fieldname)
+        if field.fieldtype not in NUMERIC_FIELDTYPES:
+            continue
+        if value is None:
+            row[fieldname] = 0
+            continue
+        try:
+            row[fieldname] = float(value)
+        except (TypeError, ValueError):
+            errors.append(f"{field.label or fieldname} '{value}' is not a number")
+
+    return errors
+
+
+def iter_design_chunks(file_path, child_doctype, chunk_size=IMPORT_CHUNK_SIZE):
+    """Yield lists of up to `chunk_size` `(sheet row number, row dict)` pairs; blank rows are skipped."""
+    chunk = []
+    for row_no, row in iter_design_rows(file_path, frappe.get_meta(child_doctype)):
+        chunk.append((row_no, row))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def iter_design_rows(file_path, meta):
+    """Yield `(sheet row number, {fieldname: value})` for the non-blank rows of a design sheet.
+
+    `.xlsx` is read with openpyxl in read-only mode and `.csv` with the csv
+    module, one row at a time; only legacy `.xls` goes through pandas. The
+    header is row 1.
+    """
+    if file_path.lower().endswith(".xls"):
+        df = pd.read_excel(file_path)
+        column_map = get_column_map(df.columns, meta)
+        df = df[list(column_map)].rename(columns=column_map)
+        df = df.astype(object).where(pd.notnull(df), None)
+        for row_no, row in enumerate(df.to_dict("records"), start=2):
+            if any(value not in (None, "") for value in row.values()):
+                yield row_no, row
+        return
+
+    with open_sheet_rows(file_path) as rows:
+        header = next(rows, None)
+        if header is None:
+            return
+
+        column_map = get_column_map(header, meta)
+        positions = [(i, column_map[col]) for i, col in enumerate(header) if col in column_map]
+        if not positions:
+            return
+
+        for row_no, values in enumerate(rows, start=2):
+            row = {}
+            for i, fieldname in positions:
+                value = values[i] if i < len(values) else None
+                row[fieldname] = None if value == "" else value
+
+            if any(value is not None for value in row.values()):
+                yield row_no, row
+
+
+@contextmanager
+def open_sheet_rows(file_path):
+    """Yield an iterator of row value tuples, header first, for a `.csv` or `.xlsx` file."""
+    if file_path.lower().endswith(".csv"):
+        with open(file_path, newline="", encoding="utf-8-sig") as f:
+            yield csv.reader(f)
+        return
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
     try:
-        doc.save()
-        frappe.msgprint(f"Successfully imported {len(df)} rows to {child_table_fieldname}")
-        return {"status": "success", "rows": len(df)}
-    except Exception as e:
-        frappe.log_error(f"Error importing Excel data: {str(e)}")
-        frappe.throw("Failed to import data. Please check error logs.")
\ No newline at end of file
+        yield workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def get_sheet_row_count(file_path):
+    """Data rows in an `.xlsx` sheet from its stored dimensions; None when unknown."""
+    if not file_path.lower().endswith(".xlsx"):
+        return None
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True)
+    try:
+        max_row = workbook.active.max_row
+    finally:
+        workbook.close()
+    return max_row - 1 if max_row else None
+
+
+def get_column_map(columns, meta):
+    """Return `{sheet column: fieldname}` for the columns that match a field of `meta`."""
+    fieldnames = {
+        field.fieldname.lower(): field.fieldname
+        for field in meta.fields
+        if field.fieldtype not in no_value_fields
+    }
+    column_map = {}
+    for col in columns:
+        key = str(col).strip().lower().replace(" ", "_")
+        if key in fieldnames and fieldnames[key] not in column_map.values():
+            column_map[col] = fieldnames[key]
+    return column_map
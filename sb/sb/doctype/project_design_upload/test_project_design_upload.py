@@ -1,9 +1,130 @@
 # Copyright (c) 2025, ptpratul2@gmail.com and Contributors
 # See license.txt
 
-# import frappe
+import csv
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import frappe
 from frappe.tests.utils import FrappeTestCase
+from openpyxl import Workbook
+
+from sb.sb.doctype.project_design_upload.project_design_upload import (
+	get_file_hash,
+	get_row_hash,
+	import_design_rows,
+	import_from_excel_on_submit,
+	iter_design_chunks,
+	validate_design_row,
+)
+
+FIELDS = [
+	SimpleNamespace(fieldname="fg_code", fieldtype="Data", label="FG Code"),
+	SimpleNamespace(fieldname="quantity", fieldtype="Float", label="Quantity"),
+	SimpleNamespace(fieldname="column_break_xbqy", fieldtype="Column Break", label=None),
+]
+META = SimpleNamespace(fields=FIELDS, get_field=lambda fieldname: next(f for f in FIELDS if f.fieldname == fieldname))
 
 
 class TestProjectDesignUpload(FrappeTestCase):
-	pass
+	def test_validate_design_row(self):
+		row = {"fg_code": "150|0|B|2400|", "quantity": "2"}
+		self.assertEqual(validate_design_row(row, META), [])
+		self.assertEqual(row["quantity"], 2.0)
+
+		row = {"fg_code": None, "quantity": None}
+		self.assertEqual(validate_design_row(row, META), ["FG Code is missing"])
+		self.assertEqual(row["quantity"], 0)
+
+		self.assertEqual(validate_design_row({"fg_code": "150-B", "quantity": "two"}, META), [
+			"FG Code '150-B' is not in A|B|CODE|L1|L2 form",
+			"Quantity 'two' is not a number",
+		])
+
+	def test_design_chunks(self):
+		sheet = [
+			[" FG Code", "QUANTITY", "Remarks", "Column Break XBQY"],
+			*([code, 2, "x", 1] for code in ("A", "B", "C")),
+			[None, None, "note", None],
+			["D", 1, None, None],
+		]
+
+		with tempfile.TemporaryDirectory() as folder:
+			workbook = Workbook()
+			for row in sheet:
+				workbook.active.append(row)
+			workbook.save(os.path.join(folder, "design.xlsx"))
+			with open(os.path.join(folder, "design.csv"), "w", newline="") as f:
+				csv.writer(f).writerows(sheet)
+
+			with patch("frappe.get_meta", return_value=META, create=True):
+				for name, two in (("design.xlsx", 2), ("design.csv", "2")):
+					path = os.path.join(folder, name)
+					chunks = list(iter_design_chunks(path, "Project Design Upload Item", chunk_size=2))
+					self.assertEqual([[row_no for row_no, _row in chunk] for chunk in chunks], [[2, 3], [4, 6]])
+					self.assertEqual(chunks[0][0][1], {"fg_code": "A", "quantity": two})
+
+	def test_design_row_diff(self):
+		sheet = [["FG Code", "Quantity"], ["150|0|B|2400|", 2], ["150|0|B|2400|", 3], ["125|100|SL|1200|", 1]]
+		first = {"fg_code": "150|0|B|2400|", "quantity": 2.0}
+		stored = [
+			# row-3 used to head the table, so row-1 moves up without changing
+			frappe._dict(name="row-1", idx=2, fg_code="150|0|B|2400|", ipo_name=None, dwg_no=None, row_hash=get_row_hash(first)),
+			frappe._dict(name="row-2", idx=3, fg_code="150|0|B|2400|", ipo_name=None, dwg_no=None, row_hash="stale"),
+			frappe._dict(name="row-3", idx=1, fg_code="300|0|TSE|1800|", ipo_name=None, dwg_no=None, row_hash="gone"),
+		]
+		doc = frappe._dict(doctype="Project Design Upload", name="PDU-1", flags=frappe._dict())
+		module = "sb.sb.doctype.project_design_upload.project_design_upload"
+
+		with tempfile.TemporaryDirectory() as folder:
+			path = os.path.join(folder, "design.csv")
+			with open(path, "w", newline="") as f:
+				csv.writer(f).writerows(sheet)
+
+			with (
+				patch("frappe.get_meta", return_value=META, create=True),
+				patch("frappe.get_all", return_value=stored),
+				patch(f"{module}.get_child_doctype", return_value="Project Design Upload Item"),
+				patch(f"{module}.insert_child_rows", side_effect=lambda doc, field, rows, **kwargs: len(rows)) as insert_child_rows,
+				patch(f"{module}.update_rows") as update_rows,
+				patch(f"{module}.touch_parent"),
+				patch("frappe.db.delete", create=True) as delete,
+				patch("frappe.db.commit", create=True),
+				patch("frappe.publish_realtime", create=True),
+			):
+				self.assertEqual(import_design_rows(doc, path), 3)
+
+			self.assertEqual(doc.file_hash, get_file_hash(path))
+
+		# idx follows the sheet
+		self.assertEqual([(row["fg_code"], row["idx"]) for row in insert_child_rows.call_args.args[2]], [("125|100|SL|1200|", 3)])
+		updates = update_rows.call_args.args[1]
+		self.assertEqual(updates["row-1"], {"idx": 1})
+		self.assertEqual((updates["row-2"]["quantity"], updates["row-2"]["idx"]), (3.0, 2))
+		self.assertEqual(delete.call_args.args[1], {"name": ["in", ["row-3"]]})
+		self.assertEqual(doc.flags.import_changes, {"inserted": 1, "updated": 1, "moved": 1, "deleted": 1})
+
+	def test_queue_import(self):
+		doc = MagicMock(processed_status="Completed", file_hash="old")
+		doc.name = "PDU-1"
+		module = "sb.sb.doctype.project_design_upload.project_design_upload"
+		with (
+			patch("frappe.get_doc", return_value=doc),
+			patch("frappe.get_all", return_value=[frappe._dict(file_url="/private/files/design.xlsx")]),
+			patch(f"{module}.get_file_path", return_value="/tmp/design.xlsx"),
+			patch(f"{module}.get_file_hash", return_value="new"),
+			patch("frappe.msgprint") as msgprint,
+			patch("frappe.enqueue", return_value=object()) as enqueue,
+		):
+			result = import_from_excel_on_submit("PDU-1")
+			# The rq Job is not returned; the response must go through frappe's JSON encoder
+			self.assertEqual(json.loads(json.dumps(result)), {"status": "queued", "job_id": "project_design_upload::PDU-1"})
+			self.assertEqual(enqueue.call_args.kwargs["job_id"], "project_design_upload::PDU-1")
+
+			# deduplicate drops the call while the same import is still queued
+			enqueue.return_value = None
+			self.assertEqual(import_from_excel_on_submit("PDU-1")["status"], "already_queued")
+			self.assertIn("already queued", msgprint.call_args.args[0])
@@ -0,0 +1,14 @@
+# Copyright (c) 2025, ptpratul2@gmail.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class SoftReservation(Document):
+	pass
+
+
+def on_doctype_update():
+	# Availability sums open reservations per item and warehouse
+	frappe.db.add_index("Soft Reservation", ["item_code", "warehouse", "status"])
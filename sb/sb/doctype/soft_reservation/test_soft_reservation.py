@@ -0,0 +1,126 @@
+# Copyright (c) 2025, ptpratul2@gmail.com and Contributors
+# See license.txt
+
+from unittest.mock import MagicMock, patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from sb.sb.stock_reserve import issue_soft_reservations, release_soft_reservations, soft_reserve_stock
+from sb.sb.tests.query_builder import Table
+
+STOCK_RESERVE = "sb.sb.stock_reserve"
+
+
+class SoftReservationLedger(Table):
+	"""Soft Reservations kept in memory behind `bulk_insert`, `get_all`, `count` and `qb.update`."""
+
+	def matches(self, row, filters):
+		return all(row[field] == value for field, value in filters.items())
+
+	def bulk_insert(self, doctype, fields, values):
+		self.rows.extend(frappe._dict(zip(fields, row)) for row in values)
+
+	def get_all(self, doctype, filters=None, fields=None, **kwargs):
+		if doctype != "Soft Reservation":
+			return []
+		if isinstance(filters.get("item_code"), list):
+			# get_soft_reserved_qtys: open quantity of other selectors per item and warehouse
+			item_codes = filters["item_code"][1]
+			excluded = filters.get("fg_raw_material_selector", ["not in", []])[1]
+			totals = {}
+			for row in self.rows:
+				if row.status == "Reserved" and row.item_code in item_codes and row.fg_raw_material_selector not in excluded:
+					key = (row.item_code, row.warehouse)
+					totals[key] = totals.get(key, 0) + row.qty
+			return [frappe._dict(item_code=key[0], warehouse=key[1], qty=qty) for key, qty in totals.items()]
+		return [frappe._dict(row) for row in self.rows if self.matches(row, filters)]
+
+	def count(self, doctype, filters):
+		return len([row for row in self.rows if self.matches(row, filters)])
+
+	def statuses(self, selector):
+		return sorted((row.item_code, row.status) for row in self.rows if row.fg_raw_material_selector == selector)
+
+
+def selector(name, rows):
+	return frappe._dict(name=name, raw_materials=[
+		frappe._dict(name=f"{name}-{i}", item_code=item_code, warehouse=warehouse, quantity=qty, uom="Nos",
+			reserve_tag=1, status="IS", project="PRJ-1")
+		for i, (item_code, warehouse, qty) in enumerate(rows, 1)
+	])
+
+
+class TestSoftReservation(FrappeTestCase):
+	def setUp(self):
+		self.ledger = SoftReservationLedger()
+		self.docs = {
+			"SEL-1": selector("SEL-1", [("RM-1", "Raw Material - VD", 4), ("RM-2", "Off-Cut - VD", 1)]),
+			"SEL-2": selector("SEL-2", [("RM-1", "Raw Material - VD", 2)]),
+		}
+		self.entry = MagicMock()
+		self.entry.name = "MAT-STE-0001"
+		self.entry.items = []
+		self.entry.append.side_effect = lambda table, row: self.entry.items.append(frappe._dict(row))
+		self.addCleanup(patch.stopall)
+		for target in (
+			patch("frappe.get_doc", side_effect=lambda doctype, name: self.docs[name]),
+			patch("frappe.get_all", side_effect=self.ledger.get_all),
+			patch("frappe.db.bulk_insert", create=True, side_effect=self.ledger.bulk_insert),
+			patch("frappe.db.count", create=True, side_effect=self.ledger.count),
+			patch.object(frappe.qb, "DocType", create=True, return_value=self.ledger),
+			patch.object(frappe.qb, "update", create=True, side_effect=self.ledger.update),
+			patch("frappe.new_doc", create=True, return_value=self.entry),
+			patch(f"{STOCK_RESERVE}.get_conversion_factor", return_value=1),
+			patch(f"{STOCK_RESERVE}.get_uom_info", return_value={"RM-1": {"stock_uom": "Nos"}}),
+		):
+			target.start()
+		self.lock_available = patch(f"{STOCK_RESERVE}.lock_available").start()
+
+	def test_reserve_and_release(self):
+		self.assertEqual(soft_reserve_stock("SEL-1")["status"], "success")
+		soft_reserve_stock("SEL-2")
+		self.assertEqual(self.ledger.statuses("SEL-1"), [("RM-1", "Reserved"), ("RM-2", "Reserved")])
+
+		# Each selector is checked against what the other selectors hold
+		requirements, reserved = self.lock_available.call_args.args
+		self.assertEqual(requirements, {("RM-1", "Raw Material - VD"): 2})
+		self.assertEqual(reserved, {("RM-1", "Raw Material - VD"): 4})
+
+		# Reserving again replaces the selector's earlier reservations
+		soft_reserve_stock("SEL-1")
+		self.assertEqual(
+			self.ledger.statuses("SEL-1"),
+			[("RM-1", "Released"), ("RM-1", "Reserved"), ("RM-2", "Released"), ("RM-2", "Reserved")]
+		)
+
+		self.assertEqual(release_soft_reservations("SEL-1")["message"], "2 reservations released.")
+		self.assertEqual([status for _item, status in self.ledger.statuses("SEL-1")], ["Released"] * 4)
+		self.assertEqual(self.ledger.statuses("SEL-2"), [("RM-1", "Reserved")])
+
+	def test_issue(self):
+		self.assertEqual(issue_soft_reservations("SEL-1", "Work In Progress - VD")["status"], "fail")
+
+		soft_reserve_stock("SEL-1")
+		soft_reserve_stock("SEL-2")
+		result = issue_soft_reservations("SEL-1", "Work In Progress - VD")
+		self.assertEqual(result["stock_entry"], "MAT-STE-0001")
+		self.entry.submit.assert_called_once()
+		self.assertEqual(
+			[(row.item_code, row.qty, row.s_warehouse, row.t_warehouse) for row in self.entry.items],
+			[("RM-1", 4, "Raw Material - VD", "Work In Progress - VD"), ("RM-2", 1, "Off-Cut - VD", "Work In Progress - VD")]
+		)
+
+		issued = [row for row in self.ledger.rows if row.fg_raw_material_selector == "SEL-1"]
+		self.assertEqual({(row.status, row.stock_entry) for row in issued}, {("Issued", "MAT-STE-0001")})
+		self.assertEqual(self.ledger.statuses("SEL-2"), [("RM-1", "Reserved")])
+
+		# Issued reservations are closed and cannot be released or issued again
+		self.assertEqual(release_soft_reservations("SEL-1")["message"], "0 reservations released.")
+		self.assertEqual(issue_soft_reservations("SEL-1", "Work In Progress - VD")["status"], "fail")
+		self.assertEqual({row.status for row in issued}, {"Issued"})
+
+	def test_nothing_to_reserve(self):
+		self.docs["SEL-3"] = selector("SEL-3", [("RM-1", "Reserved Stock - VD", 1)])
+		self.assertEqual(soft_reserve_stock("SEL-3")["status"], "fail")
+		self.assertEqual(self.ledger.rows, [])
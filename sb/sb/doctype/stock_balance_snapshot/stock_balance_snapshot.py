@@ -0,0 +1,14 @@
+# Copyright (c) 2025, ptpratul2@gmail.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class StockBalanceSnapshot(Document):
+	pass
+
+
+def on_doctype_update():
+	# Openings look up one period for a set of items and warehouses
+	frappe.db.add_index("Stock Balance Snapshot", ["period_end", "item_code", "warehouse"])
@@ -0,0 +1,224 @@
+# Copyright (c) 2025, ptpratul2@gmail.com and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import getdate
+
+from sb.sb.report.stock_balance_with_length import stock_balance_with_length as report
+from sb.sb.stock_snapshots import create_snapshot, get_opening_balance, invalidate_snapshots
+
+SNAPSHOTS = "sb.sb.stock_snapshots"
+
+
+def snapshot_row(company, item_code, warehouse, qty, stock_value, total_length):
+	return frappe._dict(
+		company=company, item_code=item_code, warehouse=warehouse, batch_no="",
+		qty=qty, stock_value=stock_value, total_length=total_length
+	)
+
+
+def sle(posting_datetime, warehouse, actual_qty, qty_after_transaction, stock_value, custom_length, item_code="RM-1"):
+	return frappe._dict(
+		company="VD", item_code=item_code, warehouse=warehouse, posting_datetime=posting_datetime,
+		creation=posting_datetime, is_cancelled=0, actual_qty=actual_qty,
+		qty_after_transaction=qty_after_transaction, stock_value=stock_value, custom_length=custom_length
+	)
+
+
+class StockLedger:
+	"""Stock Ledger Entries in memory behind `get_latest_sles` and `get_length_movements`."""
+
+	def __init__(self, entries):
+		self.entries = entries
+
+	def window(self, start, end, item_codes=None, warehouses=None):
+		return [
+			entry for entry in sorted(self.entries, key=lambda entry: (entry.posting_datetime, entry.creation))
+			if not entry.is_cancelled and (not start or entry.posting_datetime > start) and entry.posting_datetime <= end
+			and (not item_codes or entry.item_code in item_codes) and (not warehouses or entry.warehouse in warehouses)
+		]
+
+	def get_latest_sles(self, start, end, item_codes=None, warehouses=None):
+		return list({(entry.item_code, entry.warehouse): entry for entry in self.window(start, end, item_codes, warehouses)}.values())
+
+	def get_length_movements(self, start, end, item_codes=None, warehouses=None):
+		totals = {}
+		for entry in self.window(start, end, item_codes, warehouses):
+			if entry.custom_length > 0:
+				key = (entry.company, entry.item_code, entry.warehouse)
+				totals[key] = totals.get(key, 0) + entry.custom_length * entry.actual_qty
+		return [
+			frappe._dict(company=company, item_code=item_code, warehouse=warehouse, total_length=total_length)
+			for (company, item_code, warehouse), total_length in totals.items()
+		]
+
+	def patch(self):
+		return patch.multiple(
+			SNAPSHOTS, get_latest_sles=self.get_latest_sles, get_length_movements=self.get_length_movements
+		)
+
+
+class TestStockBalanceSnapshot(FrappeTestCase):
+	def test_create_snapshot(self):
+		previous = {
+			("RM-1", "Raw Material - VD", ""): frappe._dict(company="VD", item_code="RM-1", warehouse="Raw Material - VD", batch_no="", qty=10, stock_value=100, total_length=60000),
+			("RM-2", "Raw Material - VD", ""): frappe._dict(company="VD", item_code="RM-2", warehouse="Raw Material - VD", batch_no="", qty=4, stock_value=40, total_length=0),
+			("RM-3", "Off-Cut - VD", ""): frappe._dict(company="VD", item_code="RM-3", warehouse="Off-Cut - VD", batch_no="", qty=1, stock_value=5, total_length=900),
+		}
+		latest = [
+			frappe._dict(company="VD", item_code="RM-1", warehouse="Raw Material - VD", qty_after_transaction=7, stock_value=70),
+			frappe._dict(company="VD", item_code="RM-3", warehouse="Off-Cut - VD", qty_after_transaction=0, stock_value=0),
+		]
+		lengths = [
+			frappe._dict(company="VD", item_code="RM-1", warehouse="Raw Material - VD", total_length=-18000),
+			frappe._dict(company="VD", item_code="RM-3", warehouse="Off-Cut - VD", total_length=-900),
+		]
+		batches = [frappe._dict(company="VD", item_code="RM-2", warehouse="Raw Material - VD", batch_no="B-1", qty=2, stock_value=20, total_length=0)]
+		with (
+			patch(f"{SNAPSHOTS}.get_latest_snapshot_date", return_value=getdate("2026-08-31")),
+			patch(f"{SNAPSHOTS}.get_snapshot_rows", return_value=previous),
+			patch(f"{SNAPSHOTS}.get_latest_sles", return_value=latest) as get_latest_sles,
+			patch(f"{SNAPSHOTS}.get_length_movements", return_value=lengths),
+			patch(f"{SNAPSHOTS}.get_batch_movements", return_value=batches),
+			patch("frappe.db.delete", create=True),
+			patch("frappe.db.bulk_insert", create=True) as bulk_insert,
+		):
+			self.assertEqual(create_snapshot("2026-09-30"), 3)
+
+		# Only the month after the previous snapshot is read
+		self.assertEqual(get_latest_sles.call_args.args, ("2026-08-31 23:59:59.999999", "2026-09-30 23:59:59.999999"))
+		fields = bulk_insert.call_args.args[1]
+		rows = {(row[fields.index("item_code")], row[fields.index("batch_no")]): row for row in bulk_insert.call_args.args[2]}
+		self.assertEqual(set(rows), {("RM-1", ""), ("RM-2", ""), ("RM-2", "B-1")})
+		self.assertEqual([rows[("RM-1", "")][fields.index(field)] for field in ("qty", "stock_value", "total_length")], [7, 70, 42000])
+		self.assertEqual(rows[("RM-2", "")][fields.index("qty")], 4)
+		self.assertEqual(rows[("RM-2", "B-1")][fields.index("stock_value")], 20)
+
+	def patch_opening(self, snapshot_rows, latest, lengths):
+		return (
+			patch(f"{SNAPSHOTS}.get_latest_snapshot_date", return_value=getdate("2026-08-31")),
+			patch(f"{SNAPSHOTS}.get_snapshot_rows", return_value=snapshot_rows),
+			patch(f"{SNAPSHOTS}.get_latest_sles", return_value=latest),
+			patch(f"{SNAPSHOTS}.get_length_movements", return_value=lengths),
+		)
+
+	def test_opening_balance_replays_entries_after_snapshot(self):
+		snapshot_rows = {
+			("RM-1", "Raw Material - VD", ""): snapshot_row("VD", "RM-1", "Raw Material - VD", 10, 100, 60000),
+			("RM-1", "Off-Cut - VD", ""): snapshot_row("VD", "RM-1", "Off-Cut - VD", 2, 10, 1800),
+		}
+		# Raw Material moved after the snapshot; Off-Cut did not and keeps its snapshot balance
+		latest = [frappe._dict(company="VD", item_code="RM-1", warehouse="Raw Material - VD", qty_after_transaction=7, stock_value=77)]
+		lengths = [frappe._dict(company="VD", item_code="RM-1", warehouse="Raw Material - VD", total_length=-18000)]
+		date, rows, get_latest_sles, get_length_movements = self.patch_opening(snapshot_rows, latest, lengths)
+		with date as get_latest_snapshot_date, rows as get_snapshot_rows, get_latest_sles as latest_sles, get_length_movements:
+			opening = get_opening_balance(["RM-1"], ["Raw Material - VD", "Off-Cut - VD"], "2026-09-15")
+
+		get_latest_snapshot_date.assert_called_once_with("2026-09-15")
+		self.assertEqual(get_snapshot_rows.call_args.kwargs, {"batch_no": ""})
+		# Only the entries between the snapshot and the day before from_date are replayed
+		self.assertEqual(latest_sles.call_args.args[:2], ("2026-08-31 23:59:59.999999", "2026-09-14 23:59:59.999999"))
+		self.assertEqual(
+			(opening.qty_after_transaction, opening.stock_value, opening.total_length, opening.valuation_rate),
+			(9, 87, 43800, 87 / 9)
+		)
+		self.assertEqual(opening.period_end, getdate("2026-08-31"))
+
+	def test_opening_balance_company_filter(self):
+		snapshot_rows = {
+			("RM-1", "Raw Material - VD", ""): snapshot_row("VD", "RM-1", "Raw Material - VD", 10, 100, 60000),
+			("RM-1", "Stores - OT", ""): snapshot_row("OT", "RM-1", "Stores - OT", 50, 500, 0),
+		}
+		latest = [
+			frappe._dict(company="VD", item_code="RM-1", warehouse="Raw Material - VD", qty_after_transaction=8, stock_value=80),
+			frappe._dict(company="OT", item_code="RM-1", warehouse="Stores - OT", qty_after_transaction=40, stock_value=400),
+		]
+		lengths = [
+			frappe._dict(company="VD", item_code="RM-1", warehouse="Raw Material - VD", total_length=-12000),
+			frappe._dict(company="OT", item_code="RM-1", warehouse="Stores - OT", total_length=6000),
+		]
+		date, rows, get_latest_sles, get_length_movements = self.patch_opening(snapshot_rows, latest, lengths)
+		with date, rows, get_latest_sles, get_length_movements:
+			opening = get_opening_balance(["RM-1"], ["Raw Material - VD", "Stores - OT"], "2026-09-15", "VD")
+			every_company = get_opening_balance(["RM-1"], ["Raw Material - VD", "Stores - OT"], "2026-09-15")
+
+		self.assertEqual((opening.qty_after_transaction, opening.stock_value, opening.total_length), (8, 80, 48000))
+		self.assertEqual((every_company.qty_after_transaction, every_company.total_length), (48, 54000))
+
+	def test_opening_balance_without_snapshot(self):
+		ledger = StockLedger([
+			sle("2026-08-05 10:00:00", "Raw Material - VD", 4, 4, 40, 6000),
+			sle("2026-08-20 09:00:00", "Off-Cut - VD", 3, 3, 15, 1500),
+			sle("2026-08-25 12:00:00", "Raw Material - VD", -1, 3, 30, 6000),
+			sle("2026-09-03 08:00:00", "Raw Material - VD", 2, 5, 52, 6000),
+			sle("2026-09-10 16:00:00", "Off-Cut - VD", -2, 1, 5, 1500),
+			# Posted on from_date itself, so not part of the opening
+			sle("2026-09-15 08:00:00", "Raw Material - VD", 9, 14, 142, 6000),
+		])
+		leaves = ["Raw Material - VD", "Off-Cut - VD"]
+		with ledger.patch(), patch(f"{SNAPSHOTS}.get_latest_snapshot_date", return_value=None):
+			without_snapshot = get_opening_balance(["RM-1"], leaves, "2026-09-15", "VD")
+
+			with (
+				patch(f"{SNAPSHOTS}.get_batch_movements", return_value=[]),
+				patch("frappe.db.delete", create=True),
+				patch("frappe.db.bulk_insert", create=True) as bulk_insert,
+			):
+				create_snapshot("2026-08-31")
+		fields = bulk_insert.call_args.args[1]
+		snapshot_rows = {}
+		for values in bulk_insert.call_args.args[2]:
+			row = frappe._dict(zip(fields, values))
+			snapshot_rows[(row.item_code, row.warehouse, row.batch_no)] = row
+
+		with (
+			ledger.patch(),
+			patch(f"{SNAPSHOTS}.get_latest_snapshot_date", return_value=getdate("2026-08-31")),
+			patch(f"{SNAPSHOTS}.get_snapshot_rows", return_value=snapshot_rows),
+		):
+			with_snapshot = get_opening_balance(["RM-1"], leaves, "2026-09-15", "VD")
+
+		# Every leaf warehouse counts, with the length of every piece still in stock
+		self.assertEqual(
+			(without_snapshot.qty_after_transaction, without_snapshot.stock_value, without_snapshot.total_length),
+			(6, 57, 31500)
+		)
+		self.assertIsNone(without_snapshot.period_end)
+		self.assertEqual(
+			{key: with_snapshot[key] for key in ("qty_after_transaction", "stock_value", "total_length")},
+			{key: without_snapshot[key] for key in ("qty_after_transaction", "stock_value", "total_length")}
+		)
+
+		# The report's opening row for the group warehouse is that same aggregate
+		filters = frappe._dict(item_code="RM-1", warehouse="Stores - VD", from_date="2026-09-15", company="VD")
+		with (
+			ledger.patch(),
+			patch(f"{SNAPSHOTS}.get_latest_snapshot_date", return_value=None),
+			patch.object(report, "get_leaf_warehouses", return_value=leaves),
+		):
+			row = report.get_opening_balance(filters, [], [])
+		self.assertEqual((row["qty_after_transaction"], row["stock_value"], row["total_length"]), (6, 57, 31500))
+
+	def test_backdated_entry_invalidates_snapshots(self):
+		frappe.flags.pop("sb_latest_snapshot_date", None)
+		self.addCleanup(frappe.flags.pop, "sb_latest_snapshot_date", None)
+		dates = [getdate("2026-08-31"), getdate("2026-06-30")]
+		with (
+			patch(f"{SNAPSHOTS}.get_latest_snapshot_date", side_effect=dates) as get_latest_snapshot_date,
+			patch("frappe.db.delete", create=True) as delete,
+		):
+			# Entries after the latest snapshot leave it alone, with one lookup per request
+			invalidate_snapshots(frappe._dict(doctype="Stock Ledger Entry", posting_date="2026-09-02"))
+			invalidate_snapshots(frappe._dict(doctype="Stock Ledger Entry", posting_date="2026-09-03"))
+			delete.assert_not_called()
+
+			# A backdated entry with no later SLE gets no repost, but still drops the months it changes
+			invalidate_snapshots(frappe._dict(doctype="Stock Ledger Entry", posting_date="2026-07-10"))
+			delete.assert_called_once_with("Stock Balance Snapshot", {"period_end": [">=", getdate("2026-07-10")]})
+			self.assertEqual(get_latest_snapshot_date.call_count, 2)
+
+			invalidate_snapshots(frappe._dict(doctype="Stock Ledger Entry", posting_date="2026-07-11"))
+			self.assertEqual(delete.call_count, 1)
@@ -0,0 +1,91 @@
+# fg_expansion_cache.py
+# Copyright (c) 2025, ptpratul2@gmail.com and contributors
+# For license information, please see license.txt
+
+"""
+Memoized FG code expansion.
+
+Planning BOMs repeat the same `A|B|CODE|L1|L2` string many times, so the
+expanded raw material list is cached on the parsed tuple plus the
+degree_cutting flag. Entries live in a bounded in-process LRU and, when the
+site config key `sb_fg_expansion_redis_cache` is set, in Redis so that
+every worker shares them. Keys carry `RULES_VERSION`, so bumping it retires
+all earlier expansions.
+"""
+
+from collections import OrderedDict
+
+import frappe
+
+from sb.sb.fg_rules import RULES_VERSION, expand_fg_code
+
+DEFAULT_CACHE_SIZE = 8192
+REDIS_EXPIRY = 24 * 60 * 60
+
+
+class ExpansionCache:
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.version = RULES_VERSION
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.version = RULES_VERSION
+        self.entries.clear()
+
+    def get(self, a, b, fg_code_part, l1, l2, degree_cutting=False):
+        """Return a fresh copy of the raw material rows for a parsed FG code."""
+        if self.version != RULES_VERSION:
+            self.clear()
+
+        key = (a, b, fg_code_part, l1, l2, bool(degree_cutting))
+        raw_materials = self.entries.get(key)
+        if raw_materials is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        else:
+            raw_materials = self._get_shared(key)
+            if raw_materials is None:
+                self.misses += 1
+                raw_materials = expand_fg_code(*key)
+                self._set_shared(key, raw_materials)
+            else:
+                self.hits += 1
+
+            self.entries[key] = raw_materials
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+        return [dict(rm) for rm in raw_materials]
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
+
+    def _get_shared(self, key):
+        if not use_redis():
+            return None
+        return frappe.cache().get_value(get_redis_key(key))
+
+    def _set_shared(self, key, raw_materials):
+        if use_redis():
+            frappe.cache().set_value(get_redis_key(key), raw_materials, expires_in_sec=REDIS_EXPIRY)
+
+
+def use_redis():
+    return bool(frappe.conf.get("sb_fg_expansion_redis_cache"))
+
+
+def get_redis_key(key):
+    return "sb_fg_expansion:{}:{}".format(RULES_VERSION, "|".join(str(part) for part in key))
+
+
+_cache = None
+
+
+def get_expansion_cache():
+    global _cache
+    if _cache is None:
+        _cache = ExpansionCache(frappe.conf.get("sb_fg_expansion_cache_size") or DEFAULT_CACHE_SIZE)
+    return _cache
@@ -0,0 +1,498 @@
+# fg_rules.py
+# Copyright (c) 2025, ptpratul2@gmail.com and contributors
+# For license information, please see license.txt
+
+"""
+FG code rule engine.
+
+The section tables used to expand an `A|B|CODE|L1|L2` FG code into raw
+materials are compiled once at import time. Range tables become sorted,
+non-overlapping interval arrays that are searched with `bisect`, so a
+lookup no longer walks every rule of the table.
+"""
+
+import math
+from bisect import bisect_right
+
+# Bump whenever a section table or expansion rule below changes; cached
+# expansions from an older version are then ignored.
+RULES_VERSION = 1
+
+
+class IntervalTable:
+    """Integer interval lookup compiled from an ordered list of `(low, high, value)` rules.
+
+    Rules may overlap; as with the dict scans this replaces, the rule listed
+    first wins.
+    """
+
+    __slots__ = ("_starts", "_ends", "_values")
+
+    def __init__(self, rules):
+        rules = list(rules)
+        points = sorted({low for low, _high, _value in rules} | {high + 1 for _low, high, _value in rules})
+
+        starts, ends, values = [], [], []
+        for start, stop in zip(points, points[1:]):
+            for low, high, value in rules:
+                if low <= start and stop - 1 <= high:
+                    if ends and ends[-1] == start - 1 and values[-1] is value:
+                        ends[-1] = stop - 1
+                    else:
+                        starts.append(start)
+                        ends.append(stop - 1)
+                        values.append(value)
+                    break
+
+        self._starts = starts
+        self._ends = ends
+        self._values = values
+
+    def get(self, key, default=None):
+        i = bisect_right(self._starts, key) - 1
+        if i >= 0 and key <= self._ends[i]:
+            return self._values[i]
+        return default
+
+
+# ---------------------------------------------------------------------------
+# FG families
+# ---------------------------------------------------------------------------
+
+CH_STRAIGHT = frozenset(["B", "CP", "CPP", "CPPP", "D", "K", "PC", "PH", "PLB", "SB", "T", "TS", "W", "WR", "WRS", "WRB", "WS", "WX", "WXS"])
+CH_CORNER = frozenset(["BC", "BCE", "BCY", "KC", "KCE", "BCZ", "KCY", "KCZ"])
+IC_STRAIGHT = frozenset(["CC", "CCL", "CCR", "IC", "ICB", "ICT", "ICX", "ICXB", "LSK", "LS", "LSL", "LSR", "LSW", "SL", "SLR"])
+IC_CORNER = frozenset(["SC", "SCE", "SCY", "SCZ", "LSC", "LSCE", "LSCK", "LSCEK", "LSCY", "LSCZ"])
+J_STRAIGHT = frozenset(["JL", "JLB", "JLT", "JLX", "JR", "JRB", "JRT", "JRX", "SX", "LSX", "LSXK"])
+J_CORNER = frozenset(["SXC", "SXCE", "SXCY", "SXCZ", "LSXC", "LSXCE", "LSXCK", "LSXCEK"])
+T_STRAIGHT = frozenset(["PCE", "SBE", "TSE", "WRBSE", "WRSE", "WSE", "WXSE"])
+MISC_STRAIGHT = frozenset(["DP", "EB", "MB", "EC", "ECH", "ECT", "ECX", "ECK", "ECB", "RK"])
+
+# Order matches the list Planning BOM validation has always used.
+VALID_FG_CODES = (
+    "B", "CP", "CPP", "CPPP", "D", "K", "PC", "PH", "PLB", "SB",
+    "T", "TS", "W", "WR", "WRB", "WRS", "WS", "WX", "WXS",
+    "BC", "BCE", "KC", "KCE", "BCY", "KCY", "BCZ", "KCZ",
+    "CC", "CCL", "CCR", "IC", "ICB", "ICXB", "ICT", "ICX",
+    "LS", "LSK", "LSL", "LSR", "LSW", "SL", "SLR",
+    "SC", "SCE", "SCY", "SCZ", "LSC", "LSCE", "LSCK", "LSCEK", "LSCY", "LSCZ",
+    "JL", "JLB", "JLT", "JLX", "JR", "JRB", "JRT", "JRX",
+    "SX", "LSX", "LSXK",
+    "SXC", "SXCE", "SXCY", "SXCZ", "LSXC", "LSXCE", "LSXCK", "LSXCEK",
+    "PCE", "SBE", "TSE", "WRBSE", "WRSE", "WSE", "WXSE",
+    "DP", "EB", "MB", "EC", "ECH", "ECT", "ECX", "ECB",
+    "ECK", "RK",
+)
+
+FG_SECTION_MAP = {}
+for _codes, _section in (
+    (CH_STRAIGHT, "CH SECTION"),
+    (CH_CORNER, "CH SECTION CORNER"),
+    (IC_STRAIGHT, "IC SECTION"),
+    (IC_CORNER, "IC SECTION CORNER"),
+    (J_STRAIGHT, "J SECTION"),
+    (J_CORNER, "J SECTION CORNER"),
+    (T_STRAIGHT, "T SECTION"),
+    (MISC_STRAIGHT, "MISC SECTION"),
+):
+    for _code in _codes:
+        FG_SECTION_MAP[_code] = _section
+
+
+# ---------------------------------------------------------------------------
+# Section tables
+# ---------------------------------------------------------------------------
+
+# Channel sections, exact match on A
+CH_SECTIONS = {
+    50: "50 CH", 75: "75 CH", 100: "100 CH", 125: "125 CH",
+    150: "150 CH", 175: "175 CH", 200: "200 CH", 250: "250 CH",
+    300: "300 CH", 350: "350 CH", 400: "400 CH", 600: "600 CH"
+}
+
+# L-sections for CH straight and corner, on A
+CH_L_SECTIONS = IntervalTable([
+    (51, 125, ("130 L", "MAIN FRAME")),
+    (126, 149, ("155 L", "MAIN FRAME")),
+    (151, 174, ("180 L", "MAIN FRAME")),
+    (176, 199, ("205 L", "MAIN FRAME")),
+    (201, 225, ("230 L", "MAIN FRAME")),
+    (226, 249, ("255 L", "MAIN FRAME")),
+    (251, 275, ("280 L", "MAIN FRAME")),
+    (276, 300, ("305 L", "MAIN FRAME")),
+    (301, 325, ("180 L", "155 L")),
+    (326, 350, ("180 L", "180 L")),
+    (351, 375, ("205 L", "180 L")),
+    (376, 400, ("205 L", "205 L")),
+    (401, 425, ("230 L", "205 L")),
+    (426, 450, ("230 L", "230 L")),
+    (451, 475, ("255 L", "230 L")),
+    (476, 500, ("255 L", "255 L")),
+    (501, 525, ("280 L", "255 L")),
+    (526, 550, ("280 L", "280 L")),
+    (551, 575, ("305 L", "280 L")),
+    (576, 600, ("305 L", "305 L")),
+])
+
+
+def _compile_pair_table(rules):
+    """Key `(A, B[, CODE])` rules on the sorted A/B pair so either orientation matches."""
+    table = {}
+    for key, value in rules:
+        pair = tuple(sorted(key[:2]))
+        table.setdefault(pair + key[2:], value)
+    return table
+
+
+# IC sections, exact match on A/B (and optionally the FG code)
+IC_SECTIONS = _compile_pair_table([
+    ((100, 100), ("100 IC", "-")),
+    ((125, 100, "SL"), ("125 SL", "-")),
+    ((100, 125, "SL"), ("125 SL", "-")),
+    ((125, 100, "CC"), ("125 SL", "-")),
+    ((100, 125, "CC"), ("125 SL", "-")),
+    ((125, 100, "CCR"), ("125 SL", "-")),
+    ((125, 100, "CCL"), ("125 SL", "-")),
+    ((125, 100), ("125 IC", "-")),
+    ((150, 100), ("150 IC", "-")),
+    ((100, 150), ("150 IC", "-")),
+])
+
+# L-sections for IC straight and corner (also used by RK), on A
+IC_L_SECTIONS = IntervalTable([
+    (50, 125, ("130 L", "130 L")),
+    (126, 150, ("155 L", "155 L")),
+    (151, 175, ("180 L", "180 L")),
+    (176, 200, ("205 L", "205 L")),
+    (201, 225, ("230 L", "230 L")),
+    (226, 250, ("255 L", "255 L")),
+    (251, 275, ("280 L", "280 L")),
+    (276, 300, ("305 L", "305 L")),
+    (301, 600, ("AL SHEET", "155 L")),
+])
+
+# J sections, on A
+J_SECTIONS = IntervalTable([
+    (25, 50, ("J SEC", "-")),
+    (25, 115, ("115 T", "-")),
+    (116, 250, ("AL SHEET", "-")),
+])
+
+# J L-sections, on B
+J_L_SECTIONS = IntervalTable([
+    (50, 125, "130 L"),
+    (126, 150, "155 L"),
+    (151, 175, "180 L"),
+    (176, 200, "205 L"),
+    (201, 225, "230 L"),
+    (226, 250, "255 L"),
+    (251, 275, "280 L"),
+    (276, 300, "305 L"),
+])
+
+
+def _t_rule(key, rm1, rm2, rm3):
+    # Exact-A rules double an EC in either slot; range rules only in the third.
+    low, high = key[0], key[-1]
+    rm2_qty = 2 if rm2 == "EC" and len(key) == 1 else 1
+    rm3_qty = 2 if rm3 == "EC" else 1
+    return (low, high, (rm1, rm2, rm3, rm2_qty, rm3_qty))
+
+
+# T sections, on A
+T_SECTIONS = IntervalTable([
+    _t_rule((230,), "100 T", "-", "-"),
+    _t_rule((231, 360), "115 T", "115 T", "-"),
+    _t_rule((380,), "250 CH", "EC", "-"),
+    _t_rule((430,), "300 CH", "EC", "-"),
+    _t_rule((361, 380), "255 L", "MAIN FRAME", "EC"),
+    _t_rule((381, 405), "280 L", "MAIN FRAME", "EC"),
+    _t_rule((406, 430), "305 L", "MAIN FRAME", "EC"),
+    _t_rule((431, 455), "180 L", "155 L", "EC"),
+    _t_rule((456, 480), "180 L", "180 L", "EC"),
+])
+
+# Misc sections, exact match on A (and the FG code for EB/MB/DP/RK)
+MISC_SECTIONS = {
+    (100, "EB"): ("EB MB 100", "-"),
+    (150, "EB"): ("EB MB 150", "-"),
+    (100, "MB"): ("EB MB 100", "-"),
+    (150, "MB"): ("EB MB 150", "-"),
+    (100, "DP"): ("DP 100", "-"),
+    (150, "DP"): ("DP 150", "-"),
+    (130,): ("EXTERNAL CORNER", "-"),
+    (50, "RK"): ("RK-50", "-")
+}
+MISC_KEYED_BY_CODE = frozenset(["EB", "MB", "DP", "RK"])
+
+
+# ---------------------------------------------------------------------------
+# Expansion
+# ---------------------------------------------------------------------------
+
+def safe_int(val, default=0):
+    try:
+        return int(val)
+    except (ValueError, TypeError):
+        return default
+
+
+def parse_fg_code(fg_code):
+    """Split an `A|B|CODE|L1|L2` FG code into `(a, b, code, l1, l2)`, or None if malformed."""
+    parts = fg_code.split('|')
+    if len(parts) != 5:
+        return None
+    a = safe_int(parts[0])
+    b = safe_int(parts[1]) if parts[1] else 0
+    l1 = safe_int(parts[3])
+    l2 = safe_int(parts[4]) if parts[4] else 0
+    return a, b, parts[2], l1, l2
+
+
+def expand_fg_code(a, b, fg_code_part, l1, l2, degree_cutting=False):
+    """Return the raw material rows for one parsed FG code, or [] for an unknown code."""
+    handler = _HANDLERS.get(fg_code_part)
+    if not handler:
+        return []
+    return handler(a, b, fg_code_part, l1 or 0, l2 or 0, degree_cutting)
+
+
+def _expand_ch(a, b, fg_code_part, l1, l2, degree_cutting):
+    raw_materials = []
+    remark = FG_SECTION_MAP[fg_code_part]
+    is_corner = fg_code_part in CH_CORNER
+
+    cut_dim1, cut_dim2 = str(l1), str(l2) if l2 else "-"
+    if fg_code_part in ("WR", "WRS"):
+        cut_dim1, cut_dim2 = f"{l1-50+5}", f"{l2-50+5}" if l2 else "-"
+    if is_corner:
+        if fg_code_part in ("BCE", "KCE"):
+            cut_dim1, cut_dim2 = f"{l1+65+10+5}", f"{l2+65+10+5}" if l2 else "-"
+        elif fg_code_part in ("BCY", "KCY"):
+            cut_dim1, cut_dim2 = f"{l1+65+10+5}", f"{l2+10+5}" if l2 else "-"
+        elif fg_code_part in ("BC", "KC", "BCZ", "KCZ"):
+            cut_dim1, cut_dim2 = f"{l1+10+5}", f"{l2+10+5}" if l2 else "-"
+    cut_dim = f"{cut_dim1},{cut_dim2}" if is_corner else cut_dim1
+
+    rm_code = CH_SECTIONS.get(a)
+    if rm_code:
+        raw_materials.append({"code": rm_code, "dimension": cut_dim, "remark": remark, "quantity": 1})
+    else:
+        l_section = CH_L_SECTIONS.get(a)
+        if l_section:
+            rm1, rm2 = l_section
+            raw_materials.append({"code": rm1, "dimension": cut_dim, "remark": remark, "quantity": 1})
+            raw_materials.append({"code": rm2, "dimension": cut_dim, "remark": remark, "quantity": 1})
+
+    if fg_code_part != "PLB":
+        side_rail_qty = 1 if degree_cutting and fg_code_part in ("WR", "WRB", "WRS") else 2
+        raw_materials.append({"code": "SIDE RAIL", "dimension": f"{a-16+5}", "remark": "CHILD PART", "quantity": side_rail_qty})
+
+    if fg_code_part == "K" and l1 >= 1800:
+        raw_materials.append({"code": "STIFF PLATE", "dimension": f"{a-4}X{l1-12+5}X4", "remark": "CHILD PART", "quantity": 5})
+
+    return raw_materials
+
+
+def _expand_ic(a, b, fg_code_part, l1, l2, degree_cutting):
+    raw_materials = []
+    remark = FG_SECTION_MAP[fg_code_part]
+    is_corner = fg_code_part in IC_CORNER
+
+    cut_dim1, cut_dim2 = str(l1), str(l2) if l2 else "-"
+    length1, length2 = l1, l2 if l2 else 0
+    if fg_code_part in ("ICXB", "ICB"):
+        cut_dim1 = f"{l1-8+5}"
+        length1 = l1 - 8 + 5
+    elif fg_code_part in ("ICT", "ICX"):
+        cut_dim1 = f"{l1-4+5}"
+        length1 = l1 - 4 + 5
+    elif fg_code_part in ("SCE", "LSCE", "LSCEK"):
+        cut_dim1, cut_dim2 = f"{l1+b+10+5}", f"{l2+b+10+5}" if l2 else "-"
+        length1, length2 = l1 + b + 10 + 5, l2 + b + 10 + 5 if l2 else 0
+    elif fg_code_part in ("SCY", "LSCY"):
+        cut_dim1, cut_dim2 = f"{l1+65+10+5}", f"{l2+10+5}" if l2 else "-"
+        length1, length2 = l1 + 65 + 10 + 5, l2 + 10 + 5 if l2 else 0
+    elif fg_code_part in ("SCZ", "LSCZ"):
+        cut_dim1, cut_dim2 = f"{l1+10+5}", f"{l2+65+10+5}" if l2 else "-"
+        length1, length2 = l1 + 10 + 5, l2 + 65 + 10 + 5 if l2 else 0
+    elif is_corner:
+        cut_dim1, cut_dim2 = f"{l1+10+5}", f"{l2+10+5}" if l2 else "-"
+        length1, length2 = l1 + 10 + 5, l2 + 10 + 5 if l2 else 0
+
+    cut_dim = f"{cut_dim1},{cut_dim2}" if is_corner else cut_dim1
+    length = cut_dim1 if not is_corner else f"{length1},{length2}"
+
+    pair = (a, b) if a <= b else (b, a)
+    section = IC_SECTIONS.get(pair + (fg_code_part,)) or IC_SECTIONS.get(pair)
+    if section:
+        rm1, rm2 = section
+        raw_materials.append({"code": rm1, "dimension": cut_dim, "remark": remark, "quantity": 1, "length": length})
+        if rm2 != "-":
+            raw_materials.append({"code": rm2, "dimension": cut_dim, "remark": remark, "quantity": 1, "length": length})
+    else:
+        l_section = IC_L_SECTIONS.get(a)
+        if l_section:
+            rm1, rm2 = l_section
+            l_remark = "L SECTION" if rm1.endswith("L") or rm2.endswith("L") else remark
+            raw_materials.append({"code": rm1, "dimension": cut_dim, "remark": l_remark, "quantity": 1, "length": length})
+            if rm2 != "-":
+                raw_materials.append({"code": rm2, "dimension": cut_dim, "remark": l_remark, "quantity": 1, "length": length})
+
+    if fg_code_part in ("IC", "ICT", "ICX", "ICB", "ICXB"):
+        raw_materials.append({"code": "SIDE RAIL", "dimension": f"{a-16+5}", "remark": "CHILD PART", "quantity": 2, "length": f"{a-16+5}"})
+
+    if fg_code_part in ("SC", "SCE", "LSC", "LSCE", "LSCK", "LSCEK"):
+        outer_cap_dim = f"{a+65+5}X{l1}X4,{a+65+5}X{l2}X4" if is_corner else f"{a+65+5}X{l1}X4"
+        raw_materials.append({"code": "OUTER CAP", "dimension": outer_cap_dim, "remark": "CHILD PART", "quantity": 1, "length": outer_cap_dim})
+    elif fg_code_part in ("SCY", "SCZ"):
+        outer_cap_dim = f"{b/math.sin(math.radians(45))+5}X{a}X4"
+        raw_materials.append({"code": "OUTER CAP", "dimension": outer_cap_dim, "remark": "CHILD PART", "quantity": 1, "length": outer_cap_dim})
+
+    return raw_materials
+
+
+def _expand_j(a, b, fg_code_part, l1, l2, degree_cutting):
+    raw_materials = []
+    remark = FG_SECTION_MAP[fg_code_part]
+    is_corner = fg_code_part in J_CORNER
+
+    cut_dim1, cut_dim2 = str(l1), str(l2) if l2 else "-"
+    length1, length2 = l1, l2 if l2 else 0
+    if fg_code_part in ("JLT", "JRT", "JLX", "JRX"):
+        cut_dim1 = f"{l1-8+5}"
+        length1 = l1 - 8 + 5
+    elif fg_code_part == "LSX":
+        cut_dim1 = f"{l1+5}"
+        length1 = l1 + 5
+    elif fg_code_part in ("JL", "JLB", "JR", "JRB"):
+        cut_dim1 = f"{l1-4+5}"
+        length1 = l1 - 4 + 5
+    elif fg_code_part in ("SXC", "SXCZ", "LSXCK"):
+        cut_dim1 = f"{l1+10+5}"
+        cut_dim2 = f"{l2+10+5}"
+        length1 = l1 + 10 + 5
+        length2 = l2 + 10 + 5
+    elif fg_code_part in ("SXCE", "LSXC", "LSXCE", "LSXCEK"):
+        cut_dim1 = f"{l1+b+10+5}"
+        cut_dim2 = f"{l2+b+10+5}" if l2 else "-"
+        length1 = l1 + b + 10 + 5
+        length2 = l2 + b + 10 + 5 if l2 else 0
+    elif fg_code_part == "SXCY":
+        cut_dim1 = f"{l1+10+5}"
+        cut_dim2 = f"{l2+10+5}" if l2 else "-"
+        length1, length2 = l1 + 10 + 5, l2 + 10 + 5 if l2 else 0
+
+    cut_dim = f"{cut_dim1},{cut_dim2}" if is_corner else cut_dim1
+    length = f"{length1},{length2}" if is_corner else cut_dim1
+
+    if (a <= 50 and b == 100) or (b <= 50 and a == 100):
+        raw_materials.append({"code": "J SEC", "dimension": cut_dim, "remark": remark, "quantity": 1, "length": length})
+    else:
+        section = J_SECTIONS.get(a)
+        if section:
+            rm1, rm2 = section
+            if rm1 == "AL SHEET":
+                rm_dim = f"{a+65+5}X{l1}X4,{a+65+5}X{l2}X4" if is_corner else f"{a+65+5}X{l1}X4"
+                length = rm_dim
+            else:
+                rm_dim = cut_dim
+            raw_materials.append({"code": rm1, "dimension": rm_dim, "remark": remark, "quantity": 1, "length": length})
+            if rm2 != "-" and not ((25 <= a <= 50 and b == 100) or (25 <= b <= 50 and a == 100)):
+                l_section = J_L_SECTIONS.get(b)
+                if l_section:
+                    raw_materials.append({"code": l_section, "dimension": cut_dim, "remark": "J SECTION", "quantity": 1, "length": length})
+
+    if fg_code_part in ("SX", "SXC", "SXCE", "LSX", "LSXC", "SXCZ", "SXCY", "LSXCK", "LSXCE", "LSXCEK"):
+        side_rail_dim = f"{b-16+5}" if any(rm["code"] == "J SEC" for rm in raw_materials) else f"{b-12+5}"
+        stiff_qty = 5 if fg_code_part == "SX" else 2
+        raw_materials.append({"code": "SIDE RAIL", "dimension": side_rail_dim, "remark": "CHILD PART", "quantity": 2, "length": side_rail_dim})
+        stiff_dim = f"{a-4}X{b-12+5}X4"
+        raw_materials.append({"code": "STIFF PLATE", "dimension": stiff_dim, "remark": "CHILD PART", "quantity": stiff_qty, "length": stiff_dim})
+
+    return raw_materials
+
+
+def _expand_t(a, b, fg_code_part, l1, l2, degree_cutting):
+    raw_materials = []
+    remark = FG_SECTION_MAP[fg_code_part]
+
+    cut_dim = str(l1)
+    if fg_code_part in ("WRBSE", "WRSE") and not degree_cutting:
+        cut_dim = f"{l1-50+5}"
+    length = cut_dim
+
+    section = T_SECTIONS.get(a)
+    if section:
+        rm1, rm2, rm3, rm2_qty, rm3_qty = section
+        raw_materials.append({"code": rm1, "dimension": cut_dim, "remark": remark, "quantity": 1, "length": length})
+        if rm2 != "-":
+            raw_materials.append({"code": rm2, "dimension": cut_dim, "remark": remark, "quantity": rm2_qty, "length": length})
+        if rm3 != "-":
+            raw_materials.append({"code": rm3, "dimension": cut_dim, "remark": remark, "quantity": rm3_qty, "length": length})
+
+    side_rail_qty = 1 if degree_cutting and fg_code_part in ("WRBSE", "WRSE") else 2
+    if fg_code_part in ("TSE", "WRBSE", "WRSE"):
+        side_rail_dim = f"{a-146+5}"
+    else:
+        side_rail_dim = f"{a-131+5}" if any(rm["code"].endswith("T") for rm in raw_materials) else f"{a-146+5}"
+
+    raw_materials.append({"code": "SIDE RAIL", "dimension": side_rail_dim, "remark": "CHILD PART", "quantity": side_rail_qty, "length": side_rail_dim})
+
+    if fg_code_part in ("WRBSE", "WRSE") and not degree_cutting:
+        raw_materials.append({"code": "RK-50", "dimension": f"{a-130+5}", "remark": "CHILD PART", "quantity": 1, "length": f"{a-130+5}"})
+
+    if fg_code_part in ("TSE", "WRBSE", "WRSE", "WSE", "WXSE"):
+        u_stiff_qty = 5 if fg_code_part == "TSE" else 8
+        raw_materials.append({"code": "U STIFFNER", "dimension": side_rail_dim, "remark": "CHILD PART", "quantity": u_stiff_qty, "length": side_rail_dim})
+
+    if fg_code_part in ("WRBSE", "WRSE", "WSE", "WXSE"):
+        raw_materials.append({"code": "H STIFFNER", "dimension": side_rail_dim, "remark": "CHILD PART", "quantity": 2, "length": side_rail_dim})
+
+    if fg_code_part in ("PCE", "SBE"):
+        raw_materials.append({"code": "I STIFFNER", "dimension": side_rail_dim, "remark": "CHILD PART", "quantity": 8, "length": side_rail_dim})
+
+    return raw_materials
+
+
+def _expand_misc(a, b, fg_code_part, l1, l2, degree_cutting):
+    raw_materials = []
+    remark = FG_SECTION_MAP[fg_code_part]
+
+    cut_dim = str(l1 + 150 + 5) if fg_code_part == "MB" and a == 150 else str(l1 + 100 + 5) if fg_code_part == "MB" and a == 100 else str(l1)
+    length = cut_dim
+
+    key = (a, fg_code_part) if fg_code_part in MISC_KEYED_BY_CODE else (a,)
+    section = MISC_SECTIONS.get(key)
+    if section:
+        rm1, rm2 = section
+        raw_materials.append({"code": rm1, "dimension": cut_dim, "remark": remark, "quantity": 1, "length": length})
+        if rm2 != "-":
+            raw_materials.append({"code": rm2, "dimension": cut_dim, "remark": remark, "quantity": 1, "length": length})
+    elif fg_code_part == "RK" and a != 50:
+        l_section = IC_L_SECTIONS.get(a)
+        if l_section:
+            raw_materials.append({"code": l_section[0], "dimension": cut_dim, "remark": "MISC SECTION", "quantity": 1, "length": length})
+
+    if fg_code_part == "DP":
+        raw_materials.append({"code": "ROUND PIPE", "dimension": "196", "remark": "CHILD PART", "quantity": 1, "length": "196"})
+
+    if a == 150:
+        raw_materials.append({"code": "SQUARE PLATE", "dimension": "150X150X4", "remark": "CHILD PART", "quantity": 1, "length": "150X150X4"})
+
+    if fg_code_part in ("EB", "MB") and a == 150:
+        raw_materials.append({"code": "SUPPORT PIPE", "dimension": "105", "remark": "CHILD PART", "quantity": 1, "length": "105"})
+
+    return raw_materials
+
+
+_HANDLERS = {}
+for _codes, _handler in (
+    (CH_STRAIGHT | CH_CORNER, _expand_ch),
+    (IC_STRAIGHT | IC_CORNER, _expand_ic),
+    (J_STRAIGHT | J_CORNER, _expand_j),
+    (T_STRAIGHT, _expand_t),
+    (MISC_STRAIGHT, _expand_misc),
+):
+    for _code in _codes:
+        _HANDLERS[_code] = _handler
@@ -0,0 +1,169 @@
+# length_bins.py
+# Copyright (c) 2025, ptpratul2@gmail.com and contributors
+# For license information, please see license.txt
+
+"""
+Running length balances per item and warehouse.
+
+A Length Bin holds the total length, the piece count and a histogram of
+pieces per length for one item in one warehouse. The stock length hooks
+apply every submitted or cancelled voucher to it, so a length check is a
+single indexed read instead of a scan of the Stock Ledger Entries.
+`rebuild_length_bins()` recomputes them from the ledger.
+"""
+
+import json
+from collections import Counter, defaultdict
+
+import frappe
+from frappe.query_builder.functions import Sum
+from frappe.utils import flt
+
+LENGTH_BIN_FIELDS = ["name", "item_code", "warehouse", "total_length", "piece_count", "length_histogram"]
+
+
+def get_voucher_moves(doc, sign=1):
+    """Pieces each item row of a Stock Entry or Purchase Receipt adds to or takes from a warehouse.
+
+    Returns `{(item_code, warehouse): Counter({length: pieces})}`; `sign` -1
+    reverses a cancelled voucher.
+    """
+    moves = defaultdict(Counter)
+    for item in doc.items:
+        length = flt(item.custom_length, 3)
+        if not length:
+            continue
+
+        qty = flt(item.get("transfer_qty") or item.get("stock_qty") or item.qty) * sign
+        if doc.doctype == "Stock Entry":
+            if item.s_warehouse:
+                moves[(item.item_code, item.s_warehouse)][length] -= qty
+            if item.t_warehouse:
+                moves[(item.item_code, item.t_warehouse)][length] += qty
+        elif item.warehouse:
+            moves[(item.item_code, item.warehouse)][length] += qty
+    return moves
+
+
+def apply_length_moves(moves):
+    """Add `moves` to the Length Bins, locking the rows they touch.
+
+    Rows that do not exist yet cannot be locked; `insert_length_bin` lets the
+    unique `(item_code, warehouse)` key decide between parallel first submits.
+    """
+    if not moves:
+        return
+
+    item_codes = sorted({item_code for item_code, _warehouse in moves})
+    warehouses = sorted({warehouse for _item_code, warehouse in moves})
+    existing = {
+        (row.item_code, row.warehouse): row
+        for row in frappe.get_all(
+            "Length Bin",
+            filters={"item_code": ["in", item_codes], "warehouse": ["in", warehouses]},
+            fields=LENGTH_BIN_FIELDS,
+            order_by="name asc",
+            for_update=True
+        )
+    }
+
+    for (item_code, warehouse), pieces in sorted(moves.items()):
+        row = existing.get((item_code, warehouse))
+        if row:
+            add_to_length_bin(row, pieces)
+        else:
+            insert_length_bin(item_code, warehouse, pieces)
+
+
+def add_to_length_bin(row, pieces):
+    histogram = Counter(load_histogram(row.length_histogram))
+    for length, qty in pieces.items():
+        histogram[length] += qty
+    save_length_bin(row.item_code, row.warehouse, histogram, row.name)
+
+
+def insert_length_bin(item_code, warehouse, pieces):
+    """Create the Length Bin of a pair; if a parallel submit created it first, add to that row."""
+    frappe.db.savepoint("sb_length_bin")
+    try:
+        save_length_bin(item_code, warehouse, Counter(pieces))
+    except (frappe.DuplicateEntryError, frappe.UniqueValidationError):
+        frappe.db.rollback(save_point="sb_length_bin")
+        row = frappe.get_all(
+            "Length Bin",
+            filters={"item_code": item_code, "warehouse": warehouse},
+            fields=LENGTH_BIN_FIELDS,
+            for_update=True
+        )[0]
+        add_to_length_bin(row, pieces)
+
+
+def save_length_bin(item_code, warehouse, histogram, name=None):
+    histogram = {length: flt(qty) for length, qty in sorted(histogram.items()) if abs(flt(qty)) > 1e-9}
+    values = {
+        "total_length": flt(sum(length * qty for length, qty in histogram.items()), 3),
+        "piece_count": flt(sum(histogram.values())),
+        "length_histogram": json.dumps({f"{length:.3f}".rstrip("0").rstrip("."): qty for length, qty in histogram.items()}),
+    }
+    if name:
+        frappe.db.set_value("Length Bin", name, values)
+    else:
+        frappe.get_doc({"doctype": "Length Bin", "item_code": item_code, "warehouse": warehouse, **values}).insert(
+            ignore_permissions=True
+        )
+
+
+def load_histogram(value):
+    if not value:
+        return {}
+    if isinstance(value, str):
+        value = json.loads(value)
+    return {flt(length, 3): flt(qty) for length, qty in value.items()}
+
+
+def update_length_bins(doc, sign=1):
+    apply_length_moves(get_voucher_moves(doc, sign))
+
+
+def get_length_balances(item_codes, warehouses=None):
+    """Return `{(item_code, warehouse): {total_length, piece_count, histogram}}` in one query."""
+    filters = {"item_code": ["in", list(item_codes)]}
+    if warehouses is not None:
+        filters["warehouse"] = ["in", list(warehouses)]
+
+    return {
+        (row.item_code, row.warehouse): frappe._dict(
+            total_length=flt(row.total_length),
+            piece_count=flt(row.piece_count),
+            histogram=load_histogram(row.length_histogram)
+        )
+        for row in frappe.get_all("Length Bin", filters=filters, fields=LENGTH_BIN_FIELDS)
+    }
+
+
+@frappe.whitelist()
+def get_length_balance(item_code, warehouse):
+    """Total length, piece count and pieces per length of an item in a warehouse."""
+    return get_length_balances([item_code], [warehouse]).get(
+        (item_code, warehouse), frappe._dict(total_length=0, piece_count=0, histogram={})
+    )
+
+
+def rebuild_length_bins():
+    """Recompute every Length Bin from the Stock Ledger Entries that carry a length."""
+    sle = frappe.qb.DocType("Stock Ledger Entry")
+    rows = (
+        frappe.qb.from_(sle)
+        .select(sle.item_code, sle.warehouse, sle.custom_length, Sum(sle.actual_qty).as_("qty"))
+        .where((sle.is_cancelled == 0) & (sle.custom_length > 0))
+        .groupby(sle.item_code, sle.warehouse, sle.custom_length)
+    ).run(as_dict=True)
+
+    balances = defaultdict(Counter)
+    for row in rows:
+        balances[(row.item_code, row.warehouse)][flt(row.custom_length, 3)] += flt(row.qty)
+
+    frappe.db.delete("Length Bin")
+    for (item_code, warehouse), histogram in balances.items():
+        save_length_bin(item_code, warehouse, histogram)
+    return len(balances)
@@ -0,0 +1,149 @@
+# offcut_index.py
+# Copyright (c) 2025, ptpratul2@gmail.com and contributors
+# For license information, please see license.txt
+
+"""
+Length index of the offcut pieces in stock.
+
+Each item's pieces are loaded once from the Stock Ledger Entries
+(`get_offcut_pieces()`) and kept as a sorted list of lengths, so a
+ceiling or best-fit lookup is a bisect. The stock hooks bump a per-item
+generation in Redis once a voucher with lengths is submitted or cancelled
+and committed; a worker reloads an item only when its generation moved.
+Generations are read once per request, so a nesting run can ask thousands
+of times without another round trip.
+"""
+
+from bisect import bisect_left
+
+import frappe
+from frappe.utils import cint, flt
+
+from sb.sb.cutting import get_cutting_settings, get_offcut_pieces
+
+
+class OffcutIndex:
+    def __init__(self):
+        self.entries = {}
+
+    def clear(self):
+        self.entries.clear()
+
+    def get_pieces(self, item_code, warehouse=None):
+        """Return the pieces of an item, shortest first."""
+        lengths, pieces = self._get_entry(item_code, warehouse)
+        return [dict(piece) for length in lengths for piece in pieces[length]]
+
+    def ceiling(self, item_code, length, warehouse=None):
+        """Return the shortest stocked length of at least `length`, or None."""
+        lengths, _pieces = self._get_entry(item_code, warehouse)
+        pos = bisect_left(lengths, flt(length, 3))
+        return lengths[pos] if pos < len(lengths) else None
+
+    def best_fit(self, item_code, length, warehouse=None, max_waste=None, exclude=None):
+        """Return the piece that leaves the least waste after cutting `length`.
+
+        `exclude` holds Stock Ledger Entry names already claimed, so a caller
+        can take several pieces in turn. `max_waste` rejects pieces that are
+        too long to be worth cutting.
+        """
+        lengths, pieces = self._get_entry(item_code, warehouse)
+        length = flt(length, 3)
+        claimed = set(exclude or ())
+
+        for pos in range(bisect_left(lengths, length), len(lengths)):
+            if max_waste is not None and lengths[pos] - length > flt(max_waste):
+                return None
+            for piece in pieces[lengths[pos]]:
+                if piece["stock_ledger_entry"] not in claimed:
+                    return dict(piece)
+        return None
+
+    def _get_entry(self, item_code, warehouse):
+        warehouse = warehouse or get_cutting_settings().offcut_warehouse
+        key = (warehouse, item_code)
+        # Changed in this transaction: read it, but do not cache uncommitted pieces
+        if item_code in (frappe.flags.sb_offcut_dirty or ()):
+            self.entries.pop(key, None)
+            return self._load(item_code, warehouse)
+
+        generation = get_generation(item_code)
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != generation:
+            entry = (generation, *self._load(item_code, warehouse))
+            self.entries[key] = entry
+        return entry[1], entry[2]
+
+    def _load(self, item_code, warehouse):
+        pieces = {}
+        for piece in get_offcut_pieces([item_code], warehouse).get(item_code, []):
+            pieces.setdefault(piece["length"], []).append(piece)
+        return sorted(pieces), pieces
+
+
+def get_generation_key(item_code):
+    return frappe.cache().make_key(f"sb_offcut_index:{item_code}")
+
+
+def get_generation(item_code):
+    # frappe.flags is reset per request, so Redis is read once per item and request
+    if frappe.flags.sb_offcut_generations is None:
+        frappe.flags.sb_offcut_generations = {}
+    generations = frappe.flags.sb_offcut_generations
+    if item_code not in generations:
+        generations[item_code] = cint(frappe.cache().get(get_generation_key(item_code)))
+    return generations[item_code]
+
+
+def invalidate(item_codes):
+    """Mark the offcuts of `item_codes` as changed on every worker once the transaction commits.
+
+    Bumping before the commit would let another worker reload the old
+    pieces under the new generation and keep them. Until then this request
+    reads the items uncached, and a rolled-back voucher bumps nothing.
+    """
+    item_codes = set(item_codes)
+    if not item_codes:
+        return
+
+    if frappe.flags.sb_offcut_dirty is None:
+        frappe.flags.sb_offcut_dirty = set()
+    frappe.flags.sb_offcut_dirty.update(item_codes)
+    forget_generations(item_codes)
+
+    def bump_generations():
+        for item_code in item_codes:
+            frappe.cache().incr(get_generation_key(item_code))
+        forget_generations(item_codes)
+        (frappe.flags.sb_offcut_dirty or set()).difference_update(item_codes)
+
+    frappe.db.after_commit.add(bump_generations)
+
+
+def forget_generations(item_codes):
+    generations = frappe.flags.sb_offcut_generations or {}
+    for item_code in item_codes:
+        generations.pop(item_code, None)
+
+
+_index = None
+
+
+def get_offcut_index():
+    global _index
+    if _index is None:
+        _index = OffcutIndex()
+    return _index
+
+
+@frappe.whitelist()
+def find_offcut(item_code, length, mode="best_fit", warehouse=None, max_waste=None):
+    """Find an offcut of `item_code` for a cut of `length`.
+
+    `best_fit` returns the piece itself; `ceiling` returns only the shortest
+    stocked length that is long enough.
+    """
+    index = get_offcut_index()
+    if mode == "ceiling":
+        return index.ceiling(item_code, length, warehouse)
+    return index.best_fit(item_code, length, warehouse, None if max_waste in (None, "") else flt(max_waste))
@@ -6,6 +6,13 @@ frappe.query_reports["Offcut Report"] = {
             "fieldtype": "Link",
             "options": "FG Raw Material Selector",
             "reqd": 1
+        },
+        {
+            "fieldname": "method",
+            "label": __("Cutting Method"),
+            "fieldtype": "Select",
+            "options": "\nffd\nbfd\nbnb",
+            "description": __("Leave empty for the method in Cutting Settings. ffd: first-fit decreasing, bfd: best-fit decreasing, bnb: branch and bound within a time budget")
         }
     ],
     "onload": function(report) {
@@ -61,7 +68,8 @@ frappe.query_reports["Offcut Report"] = {
             frappe.call({
                 method: "sb.sb.report.offcut_report.offcut_report.create_offcut_stock_entries_from_report",
                 args: {
-                    fg_selector_name: fg_selector_name
+                    fg_selector_name: fg_selector_name,
+                    method: frappe.query_report.get_filter_value("method")
                 },
                 callback: function(r) {
                     frappe.msgprint(r.message);
@@ -5,6 +5,8 @@ from frappe.utils import flt
 import re
 import json
 
+from sb.sb.tracing import get_tracer
+
 def parse_dimension(dimension):
     if not dimension: 
         return "", ""
@@ -12,10 +14,7 @@ def parse_dimension(dimension):
     parts = dimension.split(",")
     l1 = parts[0].strip() if parts else ""
     l2 = parts[1].strip() if len(parts) > 1 else "-"
-    frappe.log_error(
-        message=f"Parsing dimension: {dimension} -> L1={l1}, L2={l2}",
-        title="Dimension Parse Debug"
-    )
+    get_tracer("raw_material_cutting_report").debug("Parsing dimension: %s -> L1=%s, L2=%s", dimension, l1, l2)
     return l1, l2
 
 def normalize_fieldname(name):
@@ -231,8 +230,8 @@ def execute(filters=None):
         return columns, data
 
     except Exception as e:
-        frappe.log_error(
-            message=f"Report execution error: {str(e)}\nTraceback: {frappe.get_traceback()}",
+        get_tracer("raw_material_cutting_report").error(
+            "Report execution error: %s\nTraceback: %s", e, frappe.get_traceback(),
             title="Report Execution Error"
         )
         frappe.throw(f"Error generating report: {str(e)}")
@@ -125,6 +125,38 @@ frappe.query_reports["Stock Balance with Length"] = {
 			default: 0,
 		},
 	],
+	onload: function (report) {
+		report.page.add_inner_button(__("Export in Background"), function () {
+			frappe.prompt(
+				{
+					fieldname: "file_format",
+					label: __("Format"),
+					fieldtype: "Select",
+					options: "CSV\nExcel",
+					default: "CSV",
+				},
+				(values) => {
+					frappe.call({
+						method: "sb.sb.report.stock_balance_with_length.stock_balance_with_length.export_report",
+						args: {
+							filters: report.get_filter_values(),
+							file_format: values.file_format,
+						},
+					});
+				},
+				__("Export Stock Balance with Length")
+			);
+		});
+
+		frappe.realtime.off("stock_balance_with_length_export");
+		frappe.realtime.on("stock_balance_with_length_export", (data) => {
+			frappe.msgprint({
+				title: __("Export Ready"),
+				message: __("Download {0}", [`<a href="${data.file_url}" target="_blank">${data.file_name}</a>`]),
+				indicator: "green",
+			});
+		});
+	},
 	formatter: function (value, row, column, data, default_formatter) {
 		value = default_formatter(value, row, column, data);
 		if (column.fieldname == "out_qty" && data && data.out_qty < 0) {
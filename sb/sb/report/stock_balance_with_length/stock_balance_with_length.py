@@ -3,12 +3,15 @@
 
 
 import copy
+import csv
+import itertools
 from collections import defaultdict
+from contextlib import contextmanager
 
 import frappe
 from frappe import _
 from frappe.query_builder.functions import CombineDatetime, Sum
-from frappe.utils import cint, flt, get_datetime
+from frappe.utils import add_days, cint, flt, get_datetime
 
 from erpnext.stock.doctype.inventory_dimension.inventory_dimension import get_inventory_dimensions
 from erpnext.stock.doctype.serial_no.serial_no import get_serial_nos
@@ -19,6 +22,13 @@ from erpnext.stock.utils import (
 	update_included_uom_in_report,
 )
 
+from sb.sb.stock_snapshots import get_batch_opening_balance
+from sb.sb.stock_snapshots import get_opening_balance as get_snapshot_opening_balance
+
+
+STREAM_CHUNK_SIZE = 5000
+EXPORT_FORMATS = ("CSV", "Excel")
+
 
 def execute(filters=None):
 	is_reposting_item_valuation_in_progress()
@@ -26,23 +36,37 @@ def execute(filters=None):
 	columns = get_columns(filters)
 	items = get_items(filters)
 	sl_entries = get_stock_ledger_entries(filters, items)
-	item_details = get_item_details(items, sl_entries, include_uom)
+	opening_row = get_opening_row(filters, columns, sl_entries)
+
+	data = []
+	conversion_factors = []
+	for row, conversion_factor in iter_report_rows(filters, items, [sl_entries], opening_row):
+		data.append(row)
+		conversion_factors.append(conversion_factor)
+
+	update_included_uom_in_report(columns, data, include_uom, conversion_factors)
+	return columns, data
+
+
+def get_opening_row(filters, columns, sl_entries):
 	if filters.get("batch_no"):
-		opening_row = get_opening_balance_from_batch(filters, columns, sl_entries)
-	else:
-		opening_row = get_opening_balance(filters, columns, sl_entries)
+		return get_opening_balance_from_batch(filters, columns, sl_entries)
 
-	precision = cint(frappe.db.get_single_value("System Settings", "float_precision"))
-	bundle_details = {}
+	return get_opening_balance(filters, columns, sl_entries)
 
-	if filters.get("segregate_serial_batch_bundle"):
-		bundle_details = get_serial_batch_bundle_details(sl_entries, filters)
 
-	data = []
-	conversion_factors = []
+def iter_report_rows(filters, items, sle_chunks, opening_row):
+	"""Yield `(row, conversion_factor)` for the opening row and every entry of `sle_chunks`.
+
+	Running balances, batch balances and serial numbers are carried from one
+	chunk to the next, so a streamed report matches the one built in memory.
+	"""
+	include_uom = filters.get("include_uom")
+	precision = cint(frappe.db.get_single_value("System Settings", "float_precision"))
+	item_details = get_item_details(items, [], include_uom) if items else {}
+
 	if opening_row:
-		data.append(opening_row)
-		conversion_factors.append(0)
+		yield opening_row, 0
 
 	actual_qty = stock_value = 0
 	if opening_row:
@@ -56,60 +80,159 @@ def execute(filters=None):
 	if actual_qty and filters.get("batch_no"):
 		batch_balance_dict[filters.batch_no] = [actual_qty, stock_value]
 
-	for sle in sl_entries:
-		item_detail = item_details[sle.item_code]
+	for sl_entries in sle_chunks:
+		if not items:
+			if missing_items := list({sle.item_code for sle in sl_entries} - set(item_details)):
+				item_details.update(get_item_details(missing_items, [], include_uom))
 
-		sle.update(item_detail)
-		if bundle_info := bundle_details.get(sle.serial_and_batch_bundle):
-			data.extend(get_segregated_bundle_entries(sle, bundle_info, batch_balance_dict, filters))
-			continue
+		bundle_details = {}
+		if filters.get("segregate_serial_batch_bundle"):
+			bundle_details = get_serial_batch_bundle_details(sl_entries, filters)
 
-		if filters.get("batch_no") or inventory_dimension_filters_applied:
-			actual_qty += flt(sle.actual_qty, precision)
-			stock_value += sle.stock_value_difference
-			if sle.batch_no:
-				if not batch_balance_dict.get(sle.batch_no):
-					batch_balance_dict[sle.batch_no] = [0, 0]
+		for sle in sl_entries:
+			item_detail = item_details[sle.item_code]
 
-				batch_balance_dict[sle.batch_no][0] += sle.actual_qty
-				batch_balance_dict[sle.batch_no][1] += stock_value
+			sle.update(item_detail)
+			if bundle_info := bundle_details.get(sle.serial_and_batch_bundle):
+				for row in get_segregated_bundle_entries(sle, bundle_info, batch_balance_dict, filters):
+					yield row, item_detail.get("conversion_factor")
+				continue
 
-			if filters.get("segregate_serial_batch_bundle"):
-				actual_qty = batch_balance_dict[sle.batch_no][0]
+			if filters.get("batch_no") or inventory_dimension_filters_applied:
+				actual_qty += flt(sle.actual_qty, precision)
+				stock_value += sle.stock_value_difference
+				if sle.batch_no:
+					if not batch_balance_dict.get(sle.batch_no):
+						batch_balance_dict[sle.batch_no] = [0, 0]
 
-			if sle.voucher_type == "Stock Reconciliation" and not sle.actual_qty:
-				actual_qty = sle.qty_after_transaction
-				stock_value = sle.stock_value
+					batch_balance_dict[sle.batch_no][0] += sle.actual_qty
+					batch_balance_dict[sle.batch_no][1] += stock_value
 
-			sle.update({"qty_after_transaction": actual_qty, "stock_value": stock_value})
+				if filters.get("segregate_serial_batch_bundle"):
+					actual_qty = batch_balance_dict[sle.batch_no][0]
 
-		sle.update({"in_qty": max(sle.actual_qty, 0), "out_qty": min(sle.actual_qty, 0)})
+				if sle.voucher_type == "Stock Reconciliation" and not sle.actual_qty:
+					actual_qty = sle.qty_after_transaction
+					stock_value = sle.stock_value
 
-		if sle.serial_no:
-			update_available_serial_nos(available_serial_nos, sle)
+				sle.update({"qty_after_transaction": actual_qty, "stock_value": stock_value})
 
-		if sle.actual_qty:
-			sle["in_out_rate"] = flt(sle.stock_value_difference / sle.actual_qty, precision)
+			sle.update({"in_qty": max(sle.actual_qty, 0), "out_qty": min(sle.actual_qty, 0)})
 
-		elif sle.voucher_type == "Stock Reconciliation":
-			sle["in_out_rate"] = sle.valuation_rate
+			if sle.serial_no:
+				update_available_serial_nos(available_serial_nos, sle)
 
-		data.append(sle)
+			if sle.actual_qty:
+				sle["in_out_rate"] = flt(sle.stock_value_difference / sle.actual_qty, precision)
 
-		if include_uom:
-			conversion_factors.append(item_detail.conversion_factor)
+			elif sle.voucher_type == "Stock Reconciliation":
+				sle["in_out_rate"] = sle.valuation_rate
 
-	update_included_uom_in_report(columns, data, include_uom, conversion_factors)
-	return columns, data
+			yield sle, item_detail.get("conversion_factor")
+
+
+@frappe.whitelist()
+def export_report(filters, file_format="CSV"):
+	"""Queue a streamed CSV or Excel export of the report for the current user."""
+	if file_format not in EXPORT_FORMATS:
+		frappe.throw(_("Export format must be one of {0}").format(", ".join(EXPORT_FORMATS)))
+
+	frappe.has_permission("Stock Ledger Entry", "read", throw=True)
+	job_id = frappe.enqueue(
+		"sb.sb.report.stock_balance_with_length.stock_balance_with_length.build_export",
+		queue="long",
+		timeout=7200,
+		filters=frappe.parse_json(filters),
+		file_format=file_format,
+		user=frappe.session.user,
+	)
+	frappe.msgprint(_("The export has been queued (Job ID: {0}). You will be notified when the file is ready.").format(job_id))
+
+
+def build_export(filters, file_format, user):
+	"""Stream the report into a private file, chunk by chunk, and notify `user`.
+
+	Ledger entries are read `STREAM_CHUNK_SIZE` at a time and rows are
+	written as they are produced, so memory stays flat however long the
+	date range is.
+	"""
+	filters = frappe._dict(filters)
+	include_uom = filters.get("include_uom")
+	columns = get_columns(filters)
+	items = get_items(filters)
+
+	chunks = iter_stock_ledger_entries(filters, items)
+	first_chunk = next(chunks, [])
+	opening_row = get_opening_row(filters, columns, first_chunk)
+	rows = iter_report_rows(filters, items, itertools.chain([first_chunk], chunks), opening_row)
+
+	extension = "csv" if file_format == "CSV" else "xlsx"
+	file_name = f"stock_balance_with_length_{frappe.generate_hash(length=8)}.{extension}"
+	path = frappe.get_site_path("private", "files", file_name)
+	with get_export_writer(path, file_format) as write_row:
+		header = None
+		for batch in iter_batches(rows, STREAM_CHUNK_SIZE):
+			data = [row for row, _conversion_factor in batch]
+			batch_columns = copy.deepcopy(columns)
+			update_included_uom_in_report(
+				batch_columns, data, include_uom, [conversion_factor for _row, conversion_factor in batch]
+			)
+			if header is None:
+				header = batch_columns
+				write_row([column.get("label") for column in header])
+			for row in data:
+				write_row([row.get(column.get("fieldname")) for column in header])
+
+		if header is None:
+			write_row([column.get("label") for column in columns])
+
+	file_doc = frappe.get_doc(
+		{
+			"doctype": "File",
+			"file_name": file_name,
+			"file_url": f"/private/files/{file_name}",
+			"is_private": 1,
+		}
+	).insert(ignore_permissions=True)
+	frappe.publish_realtime(
+		"stock_balance_with_length_export",
+		message={"file_url": file_doc.file_url, "file_name": file_name},
+		user=user,
+	)
+
+
+@contextmanager
+def get_export_writer(path, file_format):
+	"""Yield a function writing one row at a time to a CSV or write-only Excel file."""
+	if file_format == "CSV":
+		with open(path, "w", newline="", encoding="utf-8") as f:
+			writer = csv.writer(f)
+			yield writer.writerow
+		return
+
+	from openpyxl import Workbook
+
+	workbook = Workbook(write_only=True)
+	sheet = workbook.create_sheet("Stock Balance with Length")
+	yield sheet.append
+	workbook.save(path)
+
+
+def iter_batches(iterable, size):
+	iterator = iter(iterable)
+	while batch := list(itertools.islice(iterator, size)):
+		yield batch
 
 
 def get_segregated_bundle_entries(sle, bundle_details, batch_balance_dict, filters):
 	segregated_entries = []
 	qty_before_transaction = sle.qty_after_transaction - sle.actual_qty
 	stock_value_before_transaction = sle.stock_value - sle.stock_value_difference
+	track_batches = filters.get("batch_no")
 
 	for row in bundle_details:
-		new_sle = copy.deepcopy(sle)
+		# Every value on an SLE row is a scalar, so a shallow copy is enough
+		new_sle = frappe._dict(sle)
 		new_sle.update(row)
 		new_sle.update(
 			{
@@ -122,19 +245,13 @@ def get_segregated_bundle_entries(sle, bundle_details, batch_balance_dict, filte
 			}
 		)
 
-		if filters.get("batch_no") and row.batch_no:
-			if not batch_balance_dict.get(row.batch_no):
-				batch_balance_dict[row.batch_no] = [0, 0]
+		if track_batches and row.batch_no:
+			batch_balance = batch_balance_dict.setdefault(row.batch_no, [0, 0])
+			batch_balance[0] += row.qty
+			batch_balance[1] += row.stock_value_difference
 
-			batch_balance_dict[row.batch_no][0] += row.qty
-			batch_balance_dict[row.batch_no][1] += row.stock_value_difference
-
-			new_sle.update(
-				{
-					"qty_after_transaction": batch_balance_dict[row.batch_no][0],
-					"stock_value": batch_balance_dict[row.batch_no][1],
-				}
-			)
+			new_sle.qty_after_transaction = batch_balance[0]
+			new_sle.stock_value = batch_balance[1]
 
 		qty_before_transaction += row.qty
 		stock_value_before_transaction += new_sle.stock_value_difference
@@ -380,6 +497,50 @@ def get_columns(filters):
 
 
 def get_stock_ledger_entries(filters, items):
+	return get_stock_ledger_query(filters, items).run(as_dict=True)
+
+
+def iter_stock_ledger_entries(filters, items, chunk_size=STREAM_CHUNK_SIZE):
+	"""Yield the entries of `get_stock_ledger_entries` in chunks of `chunk_size`.
+
+	Each chunk is a keyset query resuming after the last `(posting_datetime,
+	creation, name)` seen, so no chunk costs more than the first and no
+	cursor is held open between them.
+	"""
+	sle = frappe.qb.DocType("Stock Ledger Entry")
+	query = (
+		get_stock_ledger_query(filters, items)
+		.select(sle.creation, sle.name)
+		.orderby(sle.name)
+		.limit(chunk_size)
+	)
+
+	last = None
+	while True:
+		chunk_query = query
+		if last:
+			posting_datetime, creation, name = last
+			chunk_query = query.where(
+				(sle.posting_datetime > posting_datetime)
+				| ((sle.posting_datetime == posting_datetime) & (sle.creation > creation))
+				| (
+					(sle.posting_datetime == posting_datetime)
+					& (sle.creation == creation)
+					& (sle.name > name)
+				)
+			)
+
+		chunk = chunk_query.run(as_dict=True)
+		if not chunk:
+			return
+
+		last = (chunk[-1].date, chunk[-1].creation, chunk[-1].name)
+		yield chunk
+		if len(chunk) < chunk_size:
+			return
+
+
+def get_stock_ledger_query(filters, items):
 	from_date = get_datetime(filters.from_date + " 00:00:00")
 	to_date = get_datetime(filters.to_date + " 23:59:59")
 
@@ -437,9 +598,7 @@ def get_stock_ledger_entries(filters, items):
 		else:
 			query = query.where(sle.batch_no == filters.batch_no)
 
-	query = apply_warehouse_filter(query, sle, filters)
-
-	return query.run(as_dict=True)
+	return apply_warehouse_filter(query, sle, filters)
 
 
 def get_serial_and_batch_bundles(filters):
@@ -546,6 +705,15 @@ def get_sle_conditions(filters):
 
 
 def get_opening_balance_from_batch(filters, columns, sl_entries):
+	# Start from the month-end snapshot and only sum the entries after it
+	period_end, snapshot_qty, snapshot_value, _snapshot_length = get_batch_opening_balance(
+		filters.batch_no,
+		filters.from_date,
+		filters.get("item_code"),
+		get_leaf_warehouses(filters.get("warehouse")),
+		filters.company,
+	)
+
 	query_filters = {
 		"batch_no": filters.batch_no,
 		"docstatus": 1,
@@ -553,6 +721,8 @@ def get_opening_balance_from_batch(filters, columns, sl_entries):
 		"posting_date": ("<", filters.from_date),
 		"company": filters.company,
 	}
+	if period_end:
+		query_filters["posting_date"] = ("between", [add_days(period_end, 1), add_days(filters.from_date, -1)])
 
 	for fields in ["item_code", "warehouse"]:
 		if value := filters.get(fields):
@@ -568,6 +738,9 @@ def get_opening_balance_from_batch(filters, columns, sl_entries):
 		if opening_data.get(field) is None:
 			opening_data[field] = 0.0
 
+	opening_data.qty_after_transaction += snapshot_qty
+	opening_data.stock_value += snapshot_value
+
 	table = frappe.qb.DocType("Stock Ledger Entry")
 	sabb_table = frappe.qb.DocType("Serial and Batch Entry")
 	query = (
@@ -586,6 +759,9 @@ def get_opening_balance_from_batch(filters, columns, sl_entries):
 		)
 	)
 
+	if period_end:
+		query = query.where(table.posting_date > period_end)
+
 	for field in ["item_code", "warehouse", "company"]:
 		value = filters.get(field)
 
@@ -603,10 +779,9 @@ def get_opening_balance_from_batch(filters, columns, sl_entries):
 	if bundle_data:
 		opening_data.qty_after_transaction += flt(bundle_data[0].qty)
 		opening_data.stock_value += flt(bundle_data[0].stock_value)
-		if opening_data.qty_after_transaction:
-			opening_data.valuation_rate = flt(opening_data.stock_value) / flt(
-				opening_data.qty_after_transaction
-			)
+
+	if opening_data.qty_after_transaction:
+		opening_data.valuation_rate = flt(opening_data.stock_value) / flt(opening_data.qty_after_transaction)
 
 	return {
 		"item_code": _("'Opening'"),
@@ -620,25 +795,38 @@ def get_opening_balance(filters, columns, sl_entries):
 	if not (filters.item_code and filters.warehouse and filters.from_date):
 		return
 
-	from erpnext.stock.stock_ledger import get_previous_sle
+	item_codes = filters.item_code if isinstance(filters.item_code, list | tuple) else [filters.item_code]
 
-	last_entry = get_previous_sle(
-		{
-			"item_code": filters.item_code,
-			"warehouse_condition": get_warehouse_condition(filters.warehouse),
-			"posting_date": filters.from_date,
-			"posting_time": "00:00:00",
-		}
+	# The nearest month-end snapshot plus the entries after it (or the whole
+	# ledger before from_date), summed over every item and leaf warehouse
+	last_entry = get_snapshot_opening_balance(
+		item_codes, get_leaf_warehouses(filters.warehouse), filters.from_date, filters.get("company")
 	)
+	total_length = flt(last_entry.get("total_length"))
 
 	# check if any SLEs are actually Opening Stock Reconciliation
+	reconciliations = {
+		sle.voucher_no
+		for sle in sl_entries
+		if sle.get("voucher_type") == "Stock Reconciliation" and sle.posting_date == filters.from_date
+	}
+	opening_reconciliations = set(
+		frappe.get_all(
+			"Stock Reconciliation",
+			filters={"name": ("in", list(reconciliations)), "purpose": "Opening Stock"},
+			pluck="name",
+		)
+		if reconciliations
+		else []
+	)
 	for sle in list(sl_entries):
 		if (
 			sle.get("voucher_type") == "Stock Reconciliation"
 			and sle.posting_date == filters.from_date
-			and frappe.db.get_value("Stock Reconciliation", sle.voucher_no, "purpose") == "Opening Stock"
+			and sle.voucher_no in opening_reconciliations
 		):
 			last_entry = sle
+			total_length += flt(sle.get("total_length"))
 			sl_entries.remove(sle)
 
 	row = {
@@ -646,11 +834,34 @@ def get_opening_balance(filters, columns, sl_entries):
 		"qty_after_transaction": last_entry.get("qty_after_transaction", 0),
 		"valuation_rate": last_entry.get("valuation_rate", 0),
 		"stock_value": last_entry.get("stock_value", 0),
+		"total_length": total_length,
 	}
 
 	return row
 
 
+def get_leaf_warehouses(warehouses):
+	if not warehouses:
+		return []
+
+	if isinstance(warehouses, str):
+		warehouses = [warehouses]
+
+	leaves = set()
+	for lft, rgt in frappe.get_all(
+		"Warehouse", filters={"name": ("in", warehouses)}, fields=["lft", "rgt"], as_list=True
+	):
+		leaves.update(
+			frappe.get_all(
+				"Warehouse",
+				filters={"lft": (">=", lft), "rgt": ("<=", rgt), "is_group": 0},
+				pluck="name",
+			)
+		)
+
+	return sorted(leaves)
+
+
 def get_warehouse_condition(warehouses):
 	if not warehouses:
 		return ""
@@ -0,0 +1,81 @@
+# Copyright (c) 2025, ptpratul2@gmail.com and Contributors
+# See license.txt
+
+import random
+from itertools import islice
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from sb.sb.report.stock_balance_with_length import stock_balance_with_length as report
+from sb.sb.tests.query_builder import Table
+
+
+class LedgerQuery:
+	"""Stock Ledger Entries in memory behind the report's query, honouring WHERE, ORDER BY and LIMIT."""
+
+	runs = []
+
+	def __init__(self, rows, criteria=(), order=("posting_datetime", "creation"), limit=None):
+		self.rows, self.criteria, self.order, self.limit_ = rows, criteria, order, limit
+
+	def select(self, *fields):
+		return self
+
+	def where(self, criterion):
+		return LedgerQuery(self.rows, (*self.criteria, criterion), self.order, self.limit_)
+
+	def orderby(self, field):
+		return LedgerQuery(self.rows, self.criteria, (*self.order, field.name), self.limit_)
+
+	def limit(self, limit):
+		return LedgerQuery(self.rows, self.criteria, self.order, limit)
+
+	def run(self, as_dict=False):
+		self.runs.append(self)
+		rows = [row for row in self.rows if all(criterion.test(row) for criterion in self.criteria)]
+		# Rows that tie on every ORDER BY column come back in storage order, as the database may
+		rows.sort(key=lambda row: tuple(row[field] for field in self.order))
+		return [frappe._dict(row, date=row["posting_datetime"]) for row in rows[:self.limit_]]
+
+
+class TestStockBalanceWithLength(FrappeTestCase):
+	def test_streamed_entries_match_query(self):
+		start = datetime(2026, 9, 1, 10, 0)
+		rows = []
+		for minute, run_length in enumerate((1, 7, 2, 5, 1, 9)):
+			posting_datetime = start + timedelta(minutes=minute)
+			# A run of entries posted and created at the same instant, longer than a chunk
+			creation = posting_datetime + timedelta(seconds=30)
+			for i in range(run_length):
+				rows.append({
+					"name": f"SLE-{minute:02d}-{i:02d}",
+					"posting_datetime": posting_datetime,
+					"creation": creation if i % 3 else creation - timedelta(seconds=1),
+					"item_code": "RM-1",
+				})
+		random.Random(7).shuffle(rows)
+
+		query = LedgerQuery(rows)
+		with (
+			patch.object(report, "get_stock_ledger_query", return_value=query),
+			patch.object(frappe.qb, "DocType", create=True, return_value=Table()),
+		):
+			expected = report.get_stock_ledger_entries(frappe._dict(), [])
+			for chunk_size in (1, 2, 3, 4, 25, 100):
+				with self.subTest(chunk_size=chunk_size):
+					LedgerQuery.runs = []
+					# A keyset that stops advancing would yield the same chunk forever
+					chunks = list(islice(report.iter_stock_ledger_entries(frappe._dict(), [], chunk_size=chunk_size), len(rows) + 2))
+					streamed = [row for chunk in chunks for row in chunk]
+
+					self.assertEqual(len(streamed), len(rows))
+					self.assertEqual(len({row.name for row in streamed}), len(rows))
+					self.assertEqual(
+						[(row.posting_datetime, row.creation) for row in streamed],
+						[(row.posting_datetime, row.creation) for row in expected]
+					)
+					self.assertTrue(all(len(chunk) <= chunk_size for chunk in chunks))
+					self.assertEqual(len(LedgerQuery.runs), len(rows) // chunk_size + 1)
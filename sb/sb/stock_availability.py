@@ -0,0 +1,128 @@
+# stock_availability.py
+# Copyright (c) 2025, ptpratul2@gmail.com and contributors
+# For license information, please see license.txt
+
+"""
+Batched stock availability.
+
+`get_stock_snapshot()` reads the Bin quantities of a whole item list in
+one query, no matter how many items and warehouses are asked for, and
+takes stock UOMs and conversion factors from `sb.sb.uom`. Open Soft
+Reservations are taken off the Bin quantities, so what the snapshot
+reports is free to reserve. It then answers per item, warehouse and UOM
+from memory. With `with_lengths` it also reads the Length Bins, so a
+length demand only goes to a warehouse that holds the millimetres too.
+"""
+
+from collections import defaultdict
+
+import frappe
+from frappe.utils import flt
+
+from sb.sb.length_bins import get_length_balances
+from sb.sb.uom import get_factor, get_uom_info
+
+RESERVED_WAREHOUSES = ("Reserved Stock - VD",)
+RESERVATION_WAREHOUSES = ("Off-Cut - VD", "Raw Material - VD")
+
+
+class StockSnapshot:
+    def __init__(self, bins, uom_info, lengths=None):
+        self.bins = bins
+        self.uom_info = uom_info
+        self.lengths = lengths or {}
+
+    def get_conversion_factor(self, item_code, uom):
+        """Stock units in one `uom` of the item."""
+        return get_factor(self.uom_info.get(item_code), uom)
+
+    def get_qty(self, item_code, warehouse, uom=None):
+        """Actual quantity of the item in `warehouse`, in `uom`."""
+        qty = self.bins.get(item_code, {}).get(warehouse)
+        if not qty:
+            return 0
+        return flt(qty) / self.get_conversion_factor(item_code, uom)
+
+    def get_total_qty(self, item_code, uom=None, warehouses=None, exclude_warehouses=()):
+        """Summed quantity over `warehouses` (all loaded ones by default)."""
+        bins = self.bins.get(item_code, {})
+        warehouses = bins if warehouses is None else warehouses
+        return sum(
+            self.get_qty(item_code, warehouse, uom)
+            for warehouse in warehouses
+            if warehouse not in exclude_warehouses
+        )
+
+    def has_length(self, item_code, warehouse, length):
+        """Whether `warehouse` holds `length` of the item; items without a Length Bin there always do."""
+        available = self.lengths.get(item_code, {}).get(warehouse)
+        return not length or available is None or available >= flt(length)
+
+    def consume(self, item_code, warehouse, qty, uom=None, length=0):
+        """Take `qty` (and `length`) out of the snapshot so later demands see what is left."""
+        bins = self.bins.setdefault(item_code, {})
+        bins[warehouse] = flt(bins.get(warehouse)) - flt(qty) * self.get_conversion_factor(item_code, uom)
+        lengths = self.lengths.get(item_code, {})
+        if length and warehouse in lengths:
+            lengths[warehouse] -= flt(length)
+
+    def find_warehouse(self, item_code, required, uom=None, warehouses=RESERVATION_WAREHOUSES, length=0):
+        """Return `(warehouse, qty)` of the first warehouse holding `required` (and `length`), else `("", total)`."""
+        for warehouse in warehouses:
+            qty = self.get_qty(item_code, warehouse, uom)
+            if qty >= required and self.has_length(item_code, warehouse, length):
+                return warehouse, qty
+        return "", self.get_total_qty(item_code, uom, warehouses)
+
+
+def get_stock_snapshot(item_codes, warehouses=None, exclude_selectors=None, with_lengths=False):
+    """Load the Bins of `item_codes` at once, with their UOM conversion factors.
+
+    `warehouses` limits the Bins read; by default every leaf warehouse is
+    included (Bins only exist on leaf warehouses). Soft Reservations of
+    `exclude_selectors` are not deducted, so a selector being reserved
+    again does not compete with itself. `with_lengths` adds the total
+    length per warehouse from the Length Bins, in one more query.
+    """
+    item_codes = list({item_code for item_code in item_codes if item_code})
+    if not item_codes:
+        return StockSnapshot({}, {})
+
+    filters = {"item_code": ["in", item_codes]}
+    if warehouses is not None:
+        filters["warehouse"] = ["in", list(warehouses)]
+
+    bins = defaultdict(dict)
+    for row in frappe.get_all("Bin", filters=filters, fields=["item_code", "warehouse", "actual_qty"]):
+        bins[row.item_code][row.warehouse] = flt(row.actual_qty)
+
+    for (item_code, warehouse), qty in get_soft_reserved_qtys(item_codes, warehouses, exclude_selectors).items():
+        bins[item_code][warehouse] = bins[item_code].get(warehouse, 0) - qty
+
+    lengths = defaultdict(dict)
+    if with_lengths:
+        for (item_code, warehouse), balance in get_length_balances(item_codes, warehouses).items():
+            lengths[item_code][warehouse] = balance.total_length
+
+    return StockSnapshot(dict(bins), get_uom_info(item_codes), dict(lengths))
+
+
+def get_soft_reserved_qtys(item_codes, warehouses=None, exclude_selectors=None):
+    """Open Soft Reservation quantity per `(item_code, warehouse)`, in stock UOM."""
+    item_codes = list(item_codes)
+    if not item_codes:
+        return {}
+
+    filters = {"item_code": ["in", item_codes], "status": "Reserved"}
+    if warehouses is not None:
+        filters["warehouse"] = ["in", list(warehouses)]
+    if exclude_selectors:
+        filters["fg_raw_material_selector"] = ["not in", list(exclude_selectors)]
+
+    rows = frappe.get_all(
+        "Soft Reservation",
+        filters=filters,
+        fields=["item_code", "warehouse", "sum(qty) as qty"],
+        group_by="item_code, warehouse"
+    )
+    return {(row.item_code, row.warehouse): flt(row.qty) for row in rows}
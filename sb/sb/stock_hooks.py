@@ -1,47 +1,74 @@
 import frappe
+from frappe.query_builder import Case
+from frappe.utils import now_datetime
+
+from sb.sb.length_bins import update_length_bins
+from sb.sb.offcut_index import invalidate as invalidate_offcuts
+from sb.sb.tracing import get_tracer
+
+SLE_UPDATE_CHUNK = 1000
 
 def update_length_in_sle(doc, method):
     """
     Copy custom_length and custom_total_length from items into Stock Ledger Entries
     after document is submitted.
+
+    All rows go out in one UPDATE per SLE_UPDATE_CHUNK rows, with a CASE on
+    voucher_detail_no, instead of a lookup and an update per row.
     """
+    tracer = get_tracer("stock_hooks")
+    lengths = {}
     for item in doc.items:
         if not item.custom_length and not item.custom_total_length:
             continue
-
-        sle_list = frappe.get_all(
-            "Stock Ledger Entry",
-            filters={"voucher_no": doc.name, "voucher_detail_no": item.name},
-            fields=["name"]
+        lengths[item.name] = (
+            item.custom_length,
+            item.custom_total_length or (
+                item.custom_length * item.qty if item.custom_length and item.qty else 0
+            )
         )
-        for sle in sle_list:
-            frappe.db.set_value(
-                "Stock Ledger Entry",
-                sle.name,
-                {
-                    "custom_length": item.custom_length,
-                    "custom_total_length": item.custom_total_length or (
-                        item.custom_length * item.qty if item.custom_length and item.qty else 0
-                    )
-                }
+
+    sle = frappe.qb.DocType("Stock Ledger Entry")
+    detail_names = list(lengths)
+    for start in range(0, len(detail_names), SLE_UPDATE_CHUNK):
+        chunk = detail_names[start:start + SLE_UPDATE_CHUNK]
+        length_case = Case()
+        total_case = Case()
+        for name in chunk:
+            length_case = length_case.when(sle.voucher_detail_no == name, lengths[name][0])
+            total_case = total_case.when(sle.voucher_detail_no == name, lengths[name][1])
+
+        (
+            frappe.qb.update(sle)
+            .set(sle.custom_length, length_case.else_(sle.custom_length))
+            .set(sle.custom_total_length, total_case.else_(sle.custom_total_length))
+            .set(sle.modified, now_datetime())
+            .set(sle.modified_by, frappe.session.user)
+            .where(
+                (sle.voucher_type == doc.doctype)
+                & (sle.voucher_no == doc.name)
+                & sle.voucher_detail_no.isin(chunk)
             )
+        ).run()
+
+    tracer.debug("%s %s: copied lengths of %s rows to their SLEs", doc.doctype, doc.name, len(lengths))
+    update_length_bins(doc)
+    invalidate_offcuts(item.item_code for item in doc.items if item.custom_length)
 
 def clear_length_in_sle(doc, method):
     """
     Reset custom_length and custom_total_length in Stock Ledger Entries
-    when document is cancelled.
+    when document is cancelled, in a single UPDATE by voucher.
     """
-    sle_list = frappe.get_all(
-        "Stock Ledger Entry",
-        filters={"voucher_no": doc.name},
-        fields=["name"]
-    )
-    for sle in sle_list:
-        frappe.db.set_value(
-            "Stock Ledger Entry",
-            sle.name,
-            {
-                "custom_length": 0,
-                "custom_total_length": 0
-            }
-        )
+    sle = frappe.qb.DocType("Stock Ledger Entry")
+    (
+        frappe.qb.update(sle)
+        .set(sle.custom_length, 0)
+        .set(sle.custom_total_length, 0)
+        .set(sle.modified, now_datetime())
+        .set(sle.modified_by, frappe.session.user)
+        .where((sle.voucher_type == doc.doctype) & (sle.voucher_no == doc.name))
+    ).run()
+    get_tracer("stock_hooks").debug("%s %s: cleared length on its SLEs", doc.doctype, doc.name)
+    update_length_bins(doc, sign=-1)
+    invalidate_offcuts(item.item_code for item in doc.items if item.custom_length)
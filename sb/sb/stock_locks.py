@@ -0,0 +1,140 @@
+# stock_locks.py
+# Copyright (c) 2025, ptpratul2@gmail.com and contributors
+# For license information, please see license.txt
+
+"""
+Row locks for stock reservation.
+
+A reservation reads availability and then submits a transfer. Without a
+lock two planners can both pass the check. `lock_available()` takes
+`SELECT ... FOR UPDATE` locks on the Bin rows involved, always in Bin name
+order so concurrent reservations queue up rather than deadlock, and
+throws if any of them would go negative. The locks are held until the
+request commits. A reservation that only saves a draft transfer moves no
+stock, so it also counts the open draft transfers out of those Bins.
+
+MariaDB can still pick a transaction as a deadlock victim. `retry_on_deadlock`
+rolls back and runs the whole reservation again, up to `DEADLOCK_RETRIES`
+times.
+"""
+
+import random
+import time
+from collections import defaultdict
+from functools import wraps
+
+import frappe
+from frappe import _
+from frappe.utils import flt
+
+DEADLOCK_RETRIES = 3
+RETRY_DELAY = 0.2
+
+
+def lock_bins(pairs):
+    """Lock the Bins of `(item_code, warehouse)` pairs and return their `actual_qty`."""
+    pairs = sorted(set(pairs))
+    if not pairs:
+        return {}
+
+    item_codes = sorted({item_code for item_code, _warehouse in pairs})
+    warehouses = sorted({warehouse for _item_code, warehouse in pairs})
+    bin = frappe.qb.DocType("Bin")
+    rows = (
+        frappe.qb.from_(bin)
+        .select(bin.item_code, bin.warehouse, bin.actual_qty)
+        .where(bin.item_code.isin(item_codes) & bin.warehouse.isin(warehouses))
+        .orderby(bin.name)
+        .for_update()
+    ).run(as_dict=True)
+
+    wanted = set(pairs)
+    return {
+        (row.item_code, row.warehouse): flt(row.actual_qty)
+        for row in rows
+        if (row.item_code, row.warehouse) in wanted
+    }
+
+
+def get_draft_transfer_qtys(pairs):
+    """Stock qty on draft Material Transfers out of each `(item_code, warehouse)` pair.
+
+    A locking read, so it sees drafts committed after this transaction's
+    snapshot was taken.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return {}
+
+    detail = frappe.qb.DocType("Stock Entry Detail")
+    entry = frappe.qb.DocType("Stock Entry")
+    rows = (
+        frappe.qb.from_(detail)
+        .inner_join(entry)
+        .on(detail.parent == entry.name)
+        .select(detail.item_code, detail.s_warehouse, detail.transfer_qty)
+        .where(
+            (entry.docstatus == 0)
+            & (entry.purpose == "Material Transfer")
+            & detail.item_code.isin(sorted({item_code for item_code, _warehouse in pairs}))
+            & detail.s_warehouse.isin(sorted({warehouse for _item_code, warehouse in pairs}))
+        )
+        .for_update()
+    ).run(as_dict=True)
+
+    qtys = defaultdict(float)
+    for row in rows:
+        if (row.item_code, row.s_warehouse) in pairs:
+            qtys[(row.item_code, row.s_warehouse)] += flt(row.transfer_qty)
+    return dict(qtys)
+
+
+def lock_available(requirements, reserved=None, include_drafts=False):
+    """Lock the Bins of `{(item_code, warehouse): stock_qty}` and throw if any is short.
+
+    `reserved` holds quantities already promised elsewhere (open Soft
+    Reservations); they are not available. With `include_drafts`, neither
+    is the qty on open draft transfers out of the same Bins, read once the
+    Bins are locked.
+    """
+    totals = defaultdict(float)
+    for key, qty in requirements.items():
+        totals[key] += flt(qty)
+
+    available = lock_bins(totals)
+    reserved = dict(reserved or {})
+    if include_drafts:
+        for key, qty in get_draft_transfer_qtys(totals).items():
+            reserved[key] = reserved.get(key, 0) + qty
+    for key, qty in reserved.items():
+        if key in available:
+            available[key] -= flt(qty)
+
+    shortages = [
+        _("{0} in {1}: need {2}, have {3}").format(item_code, warehouse, qty, available.get((item_code, warehouse), 0))
+        for (item_code, warehouse), qty in sorted(totals.items())
+        if qty > available.get((item_code, warehouse), 0) + 1e-9
+    ]
+    if shortages:
+        frappe.throw(
+            _("Not enough stock to reserve:") + "<br>" + "<br>".join(shortages),
+            title=_("Insufficient Stock")
+        )
+    return available
+
+
+def retry_on_deadlock(fn):
+    """Roll back and rerun `fn` when the database picks it as a deadlock victim."""
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        for attempt in range(DEADLOCK_RETRIES + 1):
+            try:
+                return fn(*args, **kwargs)
+            except frappe.QueryDeadlockError:
+                if attempt == DEADLOCK_RETRIES:
+                    raise
+                frappe.db.rollback()
+                time.sleep(RETRY_DELAY * (attempt + 1) * (1 + random.random()))
+
+    return wrapper
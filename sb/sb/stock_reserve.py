@@ -1,10 +1,21 @@
 import frappe
-from frappe.utils import flt
+from frappe.utils import flt, now_datetime
+
+from sb.sb.stock_availability import (
+    RESERVATION_WAREHOUSES,
+    RESERVED_WAREHOUSES,
+    get_soft_reserved_qtys,
+    get_stock_snapshot,
+)
+from sb.sb.stock_locks import lock_available, retry_on_deadlock
+from sb.sb.uom import get_conversion_factor, get_uom_info
 
 @frappe.whitelist()
+@retry_on_deadlock
 def reserve_stock_physically(fg_selector_name):
     doc = frappe.get_doc("FG Raw Material Selector", fg_selector_name)
     reserved_warehouse = "Reserved Stock - VD"
+    requirements = {}
 
     entry = frappe.new_doc("Stock Entry")
     entry.stock_entry_type = "Material Transfer"
@@ -22,12 +33,19 @@ def reserve_stock_physically(fg_selector_name):
                 "s_warehouse": row.warehouse,
                 "t_warehouse": reserved_warehouse
             })
+            key = (row.item_code, row.warehouse)
+            requirements[key] = requirements.get(key, 0) + flt(row.quantity) * get_conversion_factor(row.item_code, row.uom)
             row.warehouse = reserved_warehouse
             row.stock_entry = entry.name  # Store Stock Entry reference
 
     if not entry.items:
         return {"status": "fail", "message": "No eligible items to reserve."}
 
+    # Hold the source Bins until commit so a parallel reservation waits for this one
+    lock_available(requirements, get_soft_reserved_qtys(
+        {item_code for item_code, _wh in requirements}, exclude_selectors=[fg_selector_name]
+    ))
+
     entry.save()
     entry.submit()
     doc.save()  # ✅ Save the updated child table with warehouse + stock_entry fields
@@ -79,29 +97,141 @@ def return_unconsumed_reserved_stock(fg_selector_name):
 
 
 @frappe.whitelist()
-def get_available_qty(item_code, uom):
-    """Return quantity of item excluding reserved warehouses."""
-    warehouses_to_exclude = ["Reserved Stock - VD"]
-    warehouses = frappe.get_all("Warehouse", filters={"is_group": 0}, pluck="name")
+@retry_on_deadlock
+def soft_reserve_stock(fg_selector_name):
+    """Reserve the selector's IS rows in the Soft Reservation ledger instead of moving them.
+
+    The stock stays in its warehouse; every availability check deducts the
+    open reservations. Reserving again replaces the selector's earlier
+    reservations.
+    """
+    doc = frappe.get_doc("FG Raw Material Selector", fg_selector_name)
+    reservations = []
+    requirements = {}
+    for row in doc.raw_materials:
+        if row.reserve_tag and row.status == "IS" and row.warehouse and row.warehouse not in RESERVED_WAREHOUSES:
+            qty = flt(row.quantity) * get_conversion_factor(row.item_code, row.uom)
+            key = (row.item_code, row.warehouse)
+            requirements[key] = requirements.get(key, 0) + qty
+            reservations.append((row.item_code, row.warehouse, qty, row.name, row.project))
+
+    if not reservations:
+        return {"status": "fail", "message": "No eligible items to reserve."}
 
-    total = 0
-    for wh in warehouses:
-        if wh in warehouses_to_exclude:
-            continue
-        actual_qty = frappe.db.get_value("Bin", {"item_code": item_code, "warehouse": wh}, "actual_qty")
-        total += flt(actual_qty or 0)
+    lock_available(requirements, get_soft_reserved_qtys(
+        {item_code for item_code, _wh in requirements}, exclude_selectors=[fg_selector_name]
+    ))
+
+    set_soft_reservation_status(fg_selector_name, "Released")
+    uom_info = get_uom_info([item_code for item_code, _wh in requirements])
+    now = now_datetime()
+    user = frappe.session.user
+    frappe.db.bulk_insert(
+        "Soft Reservation",
+        [
+            "name", "owner", "modified_by", "creation", "modified", "docstatus", "status",
+            "item_code", "warehouse", "qty", "stock_uom", "fg_raw_material_selector", "fg_raw_material_item", "project"
+        ],
+        [
+            (
+                frappe.generate_hash(length=10), user, user, now, now, 0, "Reserved",
+                item_code, warehouse, qty, uom_info.get(item_code, {}).get("stock_uom"),
+                fg_selector_name, row_name, project
+            )
+            for item_code, warehouse, qty, row_name, project in reservations
+        ]
+    )
+
+    return {"status": "success", "message": f"{len(reservations)} rows soft reserved."}
 
-    return total
 
+@frappe.whitelist()
+def release_soft_reservations(fg_selector_name):
+    """Give the selector's open reservations back; no stock moves."""
+    released = set_soft_reservation_status(fg_selector_name, "Released")
+    return {"status": "success", "message": f"{released} reservations released."}
+
+
+@frappe.whitelist()
+@retry_on_deadlock
+def issue_soft_reservations(fg_selector_name, target_warehouse):
+    """Move the reserved stock to `target_warehouse` in one Material Transfer and close the reservations."""
+    reservations = frappe.get_all(
+        "Soft Reservation",
+        filters={"fg_raw_material_selector": fg_selector_name, "status": "Reserved"},
+        fields=["name", "item_code", "warehouse", "qty", "stock_uom", "project"],
+        order_by="creation asc"
+    )
+    if not reservations:
+        return {"status": "fail", "message": "No open reservations to issue."}
+
+    requirements = {}
+    for reservation in reservations:
+        key = (reservation.item_code, reservation.warehouse)
+        requirements[key] = requirements.get(key, 0) + flt(reservation.qty)
+    lock_available(requirements, get_soft_reserved_qtys(
+        {item_code for item_code, _wh in requirements}, exclude_selectors=[fg_selector_name]
+    ))
+
+    entry = frappe.new_doc("Stock Entry")
+    entry.stock_entry_type = "Material Transfer"
+    entry.purpose = "Material Transfer"
+    entry.set_posting_time = 1
+    entry.fg_raw_material_selector = fg_selector_name
+    for reservation in reservations:
+        entry.append("items", {
+            "item_code": reservation.item_code,
+            "qty": flt(reservation.qty),
+            "uom": reservation.stock_uom,
+            "stock_uom": reservation.stock_uom,
+            "conversion_factor": 1,
+            "s_warehouse": reservation.warehouse,
+            "t_warehouse": target_warehouse,
+            "project": reservation.project
+        })
+    entry.save()
+    entry.submit()
+
+    set_soft_reservation_status(fg_selector_name, "Issued", {"stock_entry": entry.name})
+    return {
+        "status": "success",
+        "message": f"Reserved stock issued via Stock Entry {entry.name}",
+        "stock_entry": entry.name
+    }
+
+
+def set_soft_reservation_status(fg_selector_name, status, values=None):
+    """Close the selector's open reservations in one UPDATE; returns how many there were."""
+    reservation = frappe.qb.DocType("Soft Reservation")
+    open_filter = (reservation.fg_raw_material_selector == fg_selector_name) & (reservation.status == "Reserved")
+    count = frappe.db.count("Soft Reservation", {"fg_raw_material_selector": fg_selector_name, "status": "Reserved"})
+
+    query = (
+        frappe.qb.update(reservation)
+        .set(reservation.status, status)
+        .set(reservation.modified, now_datetime())
+        .set(reservation.modified_by, frappe.session.user)
+    )
+    for field, value in (values or {}).items():
+        query = query.set(reservation[field], value)
+    query.where(open_filter).run()
+    return count
+
+
+@frappe.whitelist()
+def get_available_qty(item_code, uom):
+    """Return quantity of item excluding reserved warehouses."""
+    snapshot = get_stock_snapshot([item_code])
+    return snapshot.get_total_qty(item_code, exclude_warehouses=RESERVED_WAREHOUSES)
 
 
-from frappe.utils import flt
 @frappe.whitelist()
 def get_stock_for_items(items):
     import json
     items = json.loads(items)
 
-    warehouses_to_check = ["Off-Cut - VD", "Raw Material - VD"]  # Use your full warehouse names
+    # One snapshot for every item; the first warehouse with stock wins
+    snapshot = get_stock_snapshot([item.get("item_code") for item in items], RESERVATION_WAREHOUSES)
 
     for item in items:
         item_code = item.get("item_code")
@@ -109,8 +239,8 @@ def get_stock_for_items(items):
         item["available_quantity"] = 0
         item["warehouse"] = ""
 
-        for wh in warehouses_to_check:
-            qty = get_actual_qty(item_code, wh, uom)
+        for wh in RESERVATION_WAREHOUSES:
+            qty = snapshot.get_qty(item_code, wh, uom)
             if qty > 0:
                 item["available_quantity"] = qty
                 item["warehouse"] = wh
@@ -120,15 +250,4 @@ def get_stock_for_items(items):
 
 
 def get_actual_qty(item_code, warehouse, uom):
-    bin = frappe.db.get_value("Bin", {"item_code": item_code, "warehouse": warehouse}, ["actual_qty"], as_dict=True)
-    if not bin:
-        return 0
-    stock_uom = frappe.db.get_value("Item", item_code, "stock_uom")
-    conversion_factor = 1
-    if stock_uom != uom:
-        from erpnext.stock.doctype.item.item import get_uom_conv_factor as get_uom_conversion_factor
-        try:
-            conversion_factor = get_uom_conversion_factor(item_code, uom)
-        except:
-            conversion_factor = 0
-    return flt(bin.actual_qty) / flt(conversion_factor or 1)
\ No newline at end of file
+    return get_stock_snapshot([item_code], [warehouse]).get_qty(item_code, warehouse, uom)
@@ -0,0 +1,320 @@
+# stock_snapshots.py
+# Copyright (c) 2025, ptpratul2@gmail.com and contributors
+# For license information, please see license.txt
+
+"""
+Month-end closing balances for the stock reports.
+
+A Stock Balance Snapshot row holds the quantity, stock value and total
+length of one item in one warehouse at a month end (`batch_no` empty), or
+of one batch of it. Each month is built from the previous snapshot plus
+that month's Stock Ledger Entries, so building one never rescans history.
+The Stock Balance with Length report starts its opening balance from the
+latest snapshot before `from_date` and only replays the entries after it.
+
+A Repost Item Valuation rewrites balances from its posting date on, and
+ERPNext skips the repost for a backdated entry with nothing after it, so
+both a submitted repost and every Stock Ledger Entry posted on or before
+the latest snapshot drop the snapshots from their posting date.
+`build_snapshots()` runs daily and, once no repost is pending, fills in
+every month end that is missing again.
+"""
+
+import frappe
+from frappe.query_builder.functions import Max, Sum
+from frappe.utils import add_days, add_months, flt, get_last_day, getdate, now_datetime, today
+
+SNAPSHOT_FIELDS = ("company", "item_code", "warehouse", "batch_no", "qty", "stock_value", "total_length")
+
+
+def get_latest_snapshot_date(before=None):
+    """Latest period end with snapshots, strictly before `before` when given."""
+    snapshot = frappe.qb.DocType("Stock Balance Snapshot")
+    query = frappe.qb.from_(snapshot).select(Max(snapshot.period_end))
+    if before:
+        query = query.where(snapshot.period_end < getdate(before))
+    result = query.run()
+    return getdate(result[0][0]) if result and result[0][0] else None
+
+
+def get_snapshot_rows(period_end, item_codes=None, warehouses=None, batch_no=None):
+    """Snapshot rows of `period_end`, keyed `(item_code, warehouse, batch_no)`."""
+    filters = {"period_end": period_end}
+    if batch_no is not None:
+        filters["batch_no"] = batch_no or ["is", "not set"]
+    if item_codes:
+        filters["item_code"] = ["in", list(item_codes)]
+    if warehouses:
+        filters["warehouse"] = ["in", list(warehouses)]
+
+    return {
+        (row.item_code, row.warehouse, row.batch_no or ""): row
+        for row in frappe.get_all("Stock Balance Snapshot", filters=filters, fields=list(SNAPSHOT_FIELDS))
+    }
+
+
+def get_latest_sles(start, end, item_codes=None, warehouses=None):
+    """Last Stock Ledger Entry per item and warehouse posted in `(start, end]`."""
+    conditions = ["is_cancelled = 0", "posting_datetime <= %(end)s"]
+    if start:
+        conditions.append("posting_datetime > %(start)s")
+    if item_codes:
+        conditions.append("item_code in %(item_codes)s")
+    if warehouses:
+        conditions.append("warehouse in %(warehouses)s")
+
+    return frappe.db.sql(
+        f"""
+        select item_code, warehouse, company, qty_after_transaction, stock_value
+        from (
+            select item_code, warehouse, company, qty_after_transaction, stock_value,
+                row_number() over (
+                    partition by item_code, warehouse order by posting_datetime desc, creation desc
+                ) as row_no
+            from `tabStock Ledger Entry`
+            where {" and ".join(conditions)}
+        ) latest
+        where row_no = 1
+        """,
+        {
+            "start": start,
+            "end": end,
+            "item_codes": tuple(item_codes or ()),
+            "warehouses": tuple(warehouses or ()),
+        },
+        as_dict=True,
+    )
+
+
+def get_length_movements(start, end, item_codes=None, warehouses=None):
+    """Net length moved per item and warehouse in `(start, end]`."""
+    sle = frappe.qb.DocType("Stock Ledger Entry")
+    query = (
+        frappe.qb.from_(sle)
+        .select(
+            sle.company, sle.item_code, sle.warehouse,
+            Sum(sle.custom_length * sle.actual_qty).as_("total_length")
+        )
+        .where((sle.is_cancelled == 0) & (sle.custom_length > 0) & (sle.posting_datetime <= end))
+        .groupby(sle.company, sle.item_code, sle.warehouse)
+    )
+    if start:
+        query = query.where(sle.posting_datetime > start)
+    if item_codes:
+        query = query.where(sle.item_code.isin(list(item_codes)))
+    if warehouses:
+        query = query.where(sle.warehouse.isin(list(warehouses)))
+    return query.run(as_dict=True)
+
+
+def get_batch_movements(start, end):
+    """Net qty, value and length per item, warehouse and batch in `(start, end]`.
+
+    Batches are read both from `batch_no` on the entry and from Serial and
+    Batch Bundles.
+    """
+    sle = frappe.qb.DocType("Stock Ledger Entry")
+    bundle = frappe.qb.DocType("Serial and Batch Entry")
+
+    direct = (
+        frappe.qb.from_(sle)
+        .select(
+            sle.company, sle.item_code, sle.warehouse, sle.batch_no,
+            Sum(sle.actual_qty).as_("qty"),
+            Sum(sle.stock_value_difference).as_("stock_value"),
+            Sum(sle.custom_length * sle.actual_qty).as_("total_length"),
+        )
+        .where((sle.is_cancelled == 0) & (sle.batch_no != "") & (sle.posting_datetime <= end))
+        .groupby(sle.company, sle.item_code, sle.warehouse, sle.batch_no)
+    )
+    bundled = (
+        frappe.qb.from_(sle)
+        .inner_join(bundle)
+        .on(sle.serial_and_batch_bundle == bundle.parent)
+        .select(
+            sle.company, sle.item_code, sle.warehouse, bundle.batch_no,
+            Sum(bundle.qty).as_("qty"),
+            Sum(bundle.stock_value_difference).as_("stock_value"),
+            Sum(sle.custom_length * bundle.qty).as_("total_length"),
+        )
+        .where(
+            (sle.is_cancelled == 0) & (bundle.docstatus == 1) & (bundle.batch_no != "")
+            & (sle.posting_datetime <= end)
+        )
+        .groupby(sle.company, sle.item_code, sle.warehouse, bundle.batch_no)
+    )
+    if start:
+        direct = direct.where(sle.posting_datetime > start)
+        bundled = bundled.where(sle.posting_datetime > start)
+
+    return direct.run(as_dict=True) + bundled.run(as_dict=True)
+
+
+def create_snapshot(period_end):
+    """Write the snapshot of `period_end` from the previous one and the entries since."""
+    period_end = getdate(period_end)
+    previous = get_latest_snapshot_date(period_end)
+    start = f"{previous} 23:59:59.999999" if previous else None
+    end = f"{period_end} 23:59:59.999999"
+
+    balances = {}
+    for key, row in (get_snapshot_rows(previous) if previous else {}).items():
+        balances[key] = frappe._dict({field: row.get(field) for field in SNAPSHOT_FIELDS})
+
+    def get_balance(company, item_code, warehouse, batch_no=""):
+        key = (item_code, warehouse, batch_no or "")
+        if key not in balances:
+            balances[key] = frappe._dict(
+                company=company, item_code=item_code, warehouse=warehouse, batch_no=batch_no or "",
+                qty=0.0, stock_value=0.0, total_length=0.0
+            )
+        return balances[key]
+
+    # Item and warehouse totals: the ledger already carries the running balance
+    for row in get_latest_sles(start, end):
+        balance = get_balance(row.company, row.item_code, row.warehouse)
+        balance.qty = flt(row.qty_after_transaction)
+        balance.stock_value = flt(row.stock_value)
+    for row in get_length_movements(start, end):
+        balance = get_balance(row.company, row.item_code, row.warehouse)
+        balance.total_length = flt(balance.total_length) + flt(row.total_length)
+
+    for row in get_batch_movements(start, end):
+        balance = get_balance(row.company, row.item_code, row.warehouse, row.batch_no)
+        balance.qty = flt(balance.qty) + flt(row.qty)
+        balance.stock_value = flt(balance.stock_value) + flt(row.stock_value)
+        balance.total_length = flt(balance.total_length) + flt(row.total_length)
+
+    rows = [
+        balance for balance in balances.values()
+        if abs(flt(balance.qty)) > 1e-9 or abs(flt(balance.stock_value)) > 1e-9 or abs(flt(balance.total_length)) > 1e-9
+    ]
+
+    frappe.db.delete("Stock Balance Snapshot", {"period_end": period_end})
+    user = frappe.session.user
+    now = now_datetime()
+    frappe.db.bulk_insert(
+        "Stock Balance Snapshot",
+        ["name", "owner", "modified_by", "creation", "modified", "docstatus", "period_end", *SNAPSHOT_FIELDS],
+        [
+            (
+                frappe.generate_hash(length=10), user, user, now, now, 0, period_end,
+                *(row.get(field) for field in SNAPSHOT_FIELDS)
+            )
+            for row in rows
+        ],
+    )
+    frappe.flags.pop("sb_latest_snapshot_date", None)
+    return len(rows)
+
+
+def get_missing_period_ends(upto):
+    """Month ends up to `upto` after the latest snapshot (or the first entry)."""
+    latest = get_latest_snapshot_date()
+    if latest:
+        period_end = get_last_day(add_months(latest, 1))
+    else:
+        first = frappe.db.get_value(
+            "Stock Ledger Entry", {"is_cancelled": 0}, "posting_date", order_by="posting_date asc"
+        )
+        if not first:
+            return []
+        period_end = get_last_day(first)
+
+    period_ends = []
+    while period_end <= upto:
+        period_ends.append(period_end)
+        period_end = get_last_day(add_months(period_end, 1))
+    return period_ends
+
+
+def build_snapshots(upto=None):
+    """Create every missing month-end snapshot up to the last closed month.
+
+    Runs daily, so the months dropped by a repost are rebuilt the next night.
+    """
+    if frappe.db.exists("Repost Item Valuation", {"docstatus": 1, "status": ["in", ["Queued", "In Progress"]]}):
+        return []
+
+    upto = getdate(upto) if upto else get_last_day(add_months(today(), -1))
+    period_ends = get_missing_period_ends(upto)
+    for period_end in period_ends:
+        create_snapshot(period_end)
+        frappe.db.commit()
+    return period_ends
+
+
+def invalidate_snapshots(doc, method=None):
+    """Repost Item Valuation and Stock Ledger Entry hook: forget snapshots `doc` may change."""
+    if not doc.posting_date:
+        return
+
+    # One lookup per request, not per entry of a large voucher
+    if "sb_latest_snapshot_date" not in frappe.flags:
+        frappe.flags.sb_latest_snapshot_date = get_latest_snapshot_date()
+    latest = frappe.flags.sb_latest_snapshot_date
+    posting_date = getdate(doc.posting_date)
+    if not latest or posting_date > latest:
+        return
+
+    frappe.db.delete("Stock Balance Snapshot", {"period_end": [">=", posting_date]})
+    frappe.flags.sb_latest_snapshot_date = get_latest_snapshot_date()
+
+
+def get_opening_balance(item_codes, warehouses, from_date, company=None):
+    """Balance before `from_date` summed over the given items and leaf warehouses.
+
+    Starts from the latest snapshot before `from_date` and replays only the
+    entries posted after it. Without a snapshot the same sums are built
+    from the start of the ledger, so the result does not depend on whether
+    one exists.
+    """
+    period_end = get_latest_snapshot_date(from_date)
+    item_codes, warehouses = list(item_codes), list(warehouses)
+    balances = {
+        (item_code, warehouse): [flt(row.qty), flt(row.stock_value), flt(row.total_length)]
+        for (item_code, warehouse, _batch_no), row in (
+            get_snapshot_rows(period_end, item_codes, warehouses, batch_no="") if period_end else {}
+        ).items()
+        if not company or row.company == company
+    }
+
+    start = f"{period_end} 23:59:59.999999" if period_end else None
+    end = f"{add_days(getdate(from_date), -1)} 23:59:59.999999"
+    for row in get_latest_sles(start, end, item_codes, warehouses):
+        if company and row.company != company:
+            continue
+        balance = balances.setdefault((row.item_code, row.warehouse), [0.0, 0.0, 0.0])
+        balance[0], balance[1] = flt(row.qty_after_transaction), flt(row.stock_value)
+    for row in get_length_movements(start, end, item_codes, warehouses):
+        if company and row.company != company:
+            continue
+        balances.setdefault((row.item_code, row.warehouse), [0.0, 0.0, 0.0])[2] += flt(row.total_length)
+
+    qty = sum(balance[0] for balance in balances.values())
+    stock_value = sum(balance[1] for balance in balances.values())
+    return frappe._dict(
+        qty_after_transaction=qty,
+        stock_value=stock_value,
+        valuation_rate=stock_value / qty if qty else 0,
+        total_length=sum(balance[2] for balance in balances.values()),
+        period_end=period_end,
+    )
+
+
+def get_batch_opening_balance(batch_no, from_date, item_codes=None, warehouses=None, company=None):
+    """Snapshot part of a batch's opening: `(period_end, qty, stock_value, total_length)`."""
+    period_end = get_latest_snapshot_date(from_date)
+    if not period_end:
+        return None, 0.0, 0.0, 0.0
+
+    rows = [
+        row for row in get_snapshot_rows(period_end, item_codes, warehouses, batch_no=batch_no).values()
+        if not company or row.company == company
+    ]
+    return (
+        period_end,
+        sum(flt(row.qty) for row in rows),
+        sum(flt(row.stock_value) for row in rows),
+        sum(flt(row.total_length) for row in rows),
+    )
@@ -0,0 +1,92 @@
+# Copyright (c) 2025, ptpratul2@gmail.com and Contributors
+# See license.txt
+
+"""
+In-memory stand-ins for the parts of `frappe.qb` the app's queries use.
+
+Comparisons on a `Field` build a `Criterion` that is evaluated against plain
+dict rows, so tests check the WHERE clause a query actually sends instead of
+assuming which rows it meant.
+"""
+
+from unittest.mock import MagicMock
+
+
+class Field:
+	def __init__(self, name):
+		self.name = name
+
+	def __eq__(self, value):
+		return Criterion(lambda row: row[self.name] == value)
+
+	def __gt__(self, value):
+		return Criterion(lambda row: row[self.name] > value)
+
+	def isin(self, values):
+		values = set(values)
+		return Criterion(lambda row: row[self.name] in values)
+
+
+class Criterion:
+	def __init__(self, test):
+		self.test = test
+
+	def __and__(self, other):
+		return Criterion(lambda row: self.test(row) and other.test(row))
+
+	def __or__(self, other):
+		return Criterion(lambda row: self.test(row) or other.test(row))
+
+
+class Case:
+	def __init__(self):
+		self.whens = []
+		self.default = None
+
+	def when(self, criterion, value):
+		self.whens.append((criterion, value))
+		return self
+
+	def else_(self, default):
+		self.default = default
+		return self
+
+	def evaluate(self, row):
+		for criterion, value in self.whens:
+			if criterion.test(row):
+				return value
+		return row[self.default.name]
+
+
+class Table:
+	"""A table's rows in memory; its attributes are fields and `update` stands in for `frappe.qb.update`.
+
+	An UPDATE evaluates its SETs, CASEs included, on every row its WHERE matches.
+	"""
+
+	def __init__(self, rows=None):
+		self.rows = [] if rows is None else rows
+		self.updates = 0
+
+	def __getattr__(self, name):
+		if name.startswith("__"):
+			raise AttributeError(name)
+		return Field(name)
+
+	def __getitem__(self, name):
+		return Field(name)
+
+	def update(self, table):
+		values = []
+		query = MagicMock()
+		query.set.side_effect = lambda field, value: values.append((field.name, value)) or query
+		query.where.side_effect = lambda criterion: setattr(query, "criterion", criterion) or query
+		query.run.side_effect = lambda: self.run_update(values, query.criterion)
+		return query
+
+	def run_update(self, values, criterion):
+		self.updates += 1
+		for row in self.rows:
+			if criterion.test(row):
+				for field, value in values:
+					row[field] = value.evaluate(row) if isinstance(value, Case) else value
@@ -0,0 +1,61 @@
+# Copyright (c) 2025, ptpratul2@gmail.com and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from sb.sb.offcut_index import OffcutIndex, invalidate
+
+
+class TestOffcutIndex(FrappeTestCase):
+	def test_offcut_index(self):
+		def piece(name, length):
+			return {"item_code": "RM-1", "length": length, "stock_ledger_entry": name}
+
+		stock = {"RM-1": [piece("SLE-1", 1200), piece("SLE-2", 800), piece("SLE-3", 1200)]}
+		index = OffcutIndex()
+		with patch("sb.sb.offcut_index.get_offcut_pieces", side_effect=lambda items, wh: stock) as load:
+			self.assertEqual(index.ceiling("RM-1", 900, "OC"), 1200)
+			self.assertIsNone(index.ceiling("RM-1", 1300, "OC"))
+			self.assertEqual(index.best_fit("RM-1", 700, "OC")["stock_ledger_entry"], "SLE-2")
+			self.assertEqual(index.best_fit("RM-1", 700, "OC", exclude={"SLE-2"})["stock_ledger_entry"], "SLE-1")
+			self.assertIsNone(index.best_fit("RM-1", 700, "OC", max_waste=300, exclude={"SLE-2"}))
+			self.assertEqual(load.call_count, 1)
+
+			stock = {"RM-1": [piece("SLE-4", 1000)]}
+			invalidate(["RM-1"])
+			self.assertEqual([p["stock_ledger_entry"] for p in index.get_pieces("RM-1", "OC")], ["SLE-4"])
+			self.assertEqual(load.call_count, 2)
+
+	def test_offcut_invalidation_waits_for_commit(self):
+		frappe.flags.sb_offcut_generations = None
+		frappe.flags.sb_offcut_dirty = None
+		frappe.db.after_commit.reset()
+		stock = {"RM-1": [{"item_code": "RM-1", "length": 1200, "stock_ledger_entry": "SLE-1"}]}
+		index = OffcutIndex()
+		with (
+			patch("sb.sb.offcut_index.get_offcut_pieces", side_effect=lambda items, wh: stock) as load,
+			patch.object(frappe.cache(), "incr", create=True) as incr,
+		):
+			index.get_pieces("RM-1", "OC")
+			invalidate(["RM-1"])
+			self.assertFalse(incr.called)
+
+			# Pieces changed by this transaction are read but not cached
+			index.get_pieces("RM-1", "OC")
+			index.get_pieces("RM-1", "OC")
+			self.assertEqual(load.call_count, 3)
+			self.assertNotIn(("OC", "RM-1"), index.entries)
+
+			frappe.db.after_commit.run()
+			incr.assert_called_once_with(frappe.cache().make_key("sb_offcut_index:RM-1"))
+			self.assertFalse(frappe.flags.sb_offcut_dirty)
+
+		# A rolled-back voucher never bumps
+		with patch.object(frappe.cache(), "incr", create=True) as incr:
+			invalidate(["RM-2"])
+			frappe.db.after_commit.reset()
+			self.assertFalse(incr.called)
+		frappe.flags.sb_offcut_dirty = None
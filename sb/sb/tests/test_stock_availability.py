@@ -0,0 +1,37 @@
+# Copyright (c) 2025, ptpratul2@gmail.com and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from sb.sb.stock_availability import get_stock_snapshot
+from sb.sb.uom import clear_uom_cache
+
+
+class TestStockAvailability(FrappeTestCase):
+	def test_stock_snapshot(self):
+		tables = {
+			"Bin": [
+				frappe._dict(item_code="RM-1", warehouse="Off-Cut - VD", actual_qty=4),
+				frappe._dict(item_code="RM-1", warehouse="Raw Material - VD", actual_qty=24),
+				frappe._dict(item_code="RM-2", warehouse="Raw Material - VD", actual_qty=10),
+			],
+			"Item": [("RM-1", "Nos"), ("RM-2", "Kg")],
+			"UOM Conversion Detail": [frappe._dict(parent="RM-1", uom="Box", conversion_factor=12)],
+			"UOM Conversion Factor": [frappe._dict(from_uom="Gram", to_uom="Kg", value=0.001)],
+			"Soft Reservation": [frappe._dict(item_code="RM-1", warehouse="Raw Material - VD", qty=6)],
+		}
+		clear_uom_cache()
+		with patch("frappe.get_all", side_effect=lambda doctype, **kwargs: tables[doctype]) as get_all:
+			snapshot = get_stock_snapshot(["RM-1", "RM-2", "RM-1"])
+		# Bins, reservations and the three UOM tables, each read once for all items
+		self.assertEqual(get_all.call_count, 5)
+
+		# Open soft reservations are not available
+		self.assertEqual(snapshot.get_qty("RM-1", "Raw Material - VD", "Box"), 1.5)
+		self.assertEqual(snapshot.get_qty("RM-2", "Raw Material - VD", "Gram"), 10000)
+		self.assertEqual(snapshot.get_qty("RM-2", "Off-Cut - VD", "Kg"), 0)
+		self.assertEqual(snapshot.find_warehouse("RM-1", 5), ("Raw Material - VD", 18))
+		self.assertEqual(snapshot.find_warehouse("RM-1", 30), ("", 22))
@@ -0,0 +1,65 @@
+# Copyright (c) 2025, ptpratul2@gmail.com and Contributors
+# See license.txt
+
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from sb.sb.stock_hooks import SLE_UPDATE_CHUNK, clear_length_in_sle, update_length_in_sle
+from sb.sb.tests.query_builder import Case, Table
+
+
+class TestStockHooks(FrappeTestCase):
+	def test_copy_lengths_to_sles(self):
+		# More rows than one UPDATE takes; each transfer row has a source and a target entry
+		row_count = SLE_UPDATE_CHUNK + 500
+		items = [
+			frappe._dict(name=f"SED-{i}", item_code="RM-1", custom_length=1000 + i, custom_total_length=0, qty=2)
+			for i in range(row_count)
+		]
+		items[0].custom_total_length = 5
+		items.append(frappe._dict(name="SED-plain", item_code="RM-2", custom_length=0, custom_total_length=0, qty=1))
+		entry = SimpleNamespace(doctype="Stock Entry", name="STE-1", items=items)
+
+		def sle(voucher_no, detail_no, warehouse):
+			return frappe._dict(
+				voucher_type="Stock Entry", voucher_no=voucher_no, voucher_detail_no=detail_no,
+				warehouse=warehouse, custom_length=None, custom_total_length=None
+			)
+
+		rows = [sle("STE-1", item.name, warehouse) for item in items for warehouse in ("Raw Material - VD", "Off-Cut - VD")]
+		# Another voucher's entry with a clashing detail name is left alone
+		rows.append(sle("STE-2", "SED-1", "Off-Cut - VD"))
+		ledger = Table(rows)
+
+		with (
+			patch("sb.sb.stock_hooks.Case", Case),
+			patch.object(frappe.qb, "DocType", create=True, return_value=ledger),
+			patch.object(frappe.qb, "update", create=True, side_effect=ledger.update),
+			patch("sb.sb.stock_hooks.update_length_bins") as update_length_bins,
+			patch("sb.sb.stock_hooks.invalidate_offcuts"),
+		):
+			update_length_in_sle(entry, "on_submit")
+			self.assertEqual(ledger.updates, 2)
+			update_length_bins.assert_called_once_with(entry)
+
+			by_detail = {(row.voucher_no, row.voucher_detail_no, row.warehouse): row for row in rows}
+			for i in (0, 1, SLE_UPDATE_CHUNK - 1, SLE_UPDATE_CHUNK, row_count - 1):
+				for warehouse in ("Raw Material - VD", "Off-Cut - VD"):
+					row = by_detail[("STE-1", f"SED-{i}", warehouse)]
+					self.assertEqual(row.custom_length, 1000 + i)
+					self.assertEqual(row.custom_total_length, 5 if i == 0 else (1000 + i) * 2)
+			self.assertTrue(all(row.custom_length for row in rows if row.voucher_no == "STE-1" and row.voucher_detail_no != "SED-plain"))
+			self.assertIsNone(by_detail[("STE-1", "SED-plain", "Off-Cut - VD")].custom_length)
+			self.assertIsNone(by_detail[("STE-2", "SED-1", "Off-Cut - VD")].custom_length)
+
+			clear_length_in_sle(entry, "on_cancel")
+			self.assertEqual(ledger.updates, 3)
+			update_length_bins.assert_called_with(entry, sign=-1)
+			self.assertEqual(
+				{(row.custom_length, row.custom_total_length) for row in rows if row.voucher_no == "STE-1"},
+				{(0, 0)}
+			)
+			self.assertIsNone(by_detail[("STE-2", "SED-1", "Off-Cut - VD")].custom_length)
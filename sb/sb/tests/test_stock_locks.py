@@ -0,0 +1,43 @@
+# Copyright (c) 2025, ptpratul2@gmail.com and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from sb.sb.stock_locks import lock_available, retry_on_deadlock
+
+
+class TestStockLocks(FrappeTestCase):
+	def test_reservation_locks(self):
+		with patch("sb.sb.stock_locks.lock_bins", return_value={("RM-1", "Raw Material - VD"): 5}) as lock_bins:
+			lock_available({("RM-1", "Raw Material - VD"): 5})
+			self.assertRaises(frappe.ValidationError, lock_available, {("RM-1", "Raw Material - VD"): 6})
+			self.assertRaises(frappe.ValidationError, lock_available, {("RM-1", "Raw Material - VD"): 5}, {("RM-1", "Raw Material - VD"): 1})
+			self.assertRaises(frappe.ValidationError, lock_available, {("RM-2", "Raw Material - VD"): 1})
+		self.assertEqual(list(lock_bins.call_args.args[0]), [("RM-2", "Raw Material - VD")])
+
+		# Draft transfers move no stock but still hold their bars, and are read only after the Bin lock
+		calls = []
+		with (
+			patch("sb.sb.stock_locks.lock_bins", side_effect=lambda pairs: calls.append("lock") or {("RM-1", "Raw Material - VD"): 5}),
+			patch("sb.sb.stock_locks.get_draft_transfer_qtys", side_effect=lambda pairs: calls.append("drafts") or {("RM-1", "Raw Material - VD"): 3}),
+		):
+			lock_available({("RM-1", "Raw Material - VD"): 5})
+			self.assertRaises(frappe.ValidationError, lock_available, {("RM-1", "Raw Material - VD"): 3}, include_drafts=True)
+			lock_available({("RM-1", "Raw Material - VD"): 1}, {("RM-1", "Raw Material - VD"): 1}, include_drafts=True)
+		self.assertEqual(calls, ["lock", "lock", "drafts", "lock", "drafts"])
+
+		attempts = []
+
+		@retry_on_deadlock
+		def reserve():
+			attempts.append(1)
+			if len(attempts) < 3:
+				raise frappe.QueryDeadlockError
+			return "done"
+
+		with patch("sb.sb.stock_locks.time.sleep"), patch("frappe.db.rollback") as rollback:
+			self.assertEqual(reserve(), "done")
+		self.assertEqual((len(attempts), rollback.call_count), (3, 2))
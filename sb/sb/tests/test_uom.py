@@ -0,0 +1,33 @@
+# Copyright (c) 2025, ptpratul2@gmail.com and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from sb.sb.uom import clear_item_uom_cache, clear_uom_cache, get_conversion_factor, get_uom_info
+
+
+class TestUOM(FrappeTestCase):
+	def test_conversion_cache(self):
+		tables = {
+			"Item": [("RM-1", "Nos"), ("RM-2", "Kg")],
+			"UOM Conversion Detail": [frappe._dict(parent="RM-1", uom="Box", conversion_factor=12)],
+			"UOM Conversion Factor": [frappe._dict(from_uom="Gram", to_uom="Kg", value=0.001)],
+		}
+		clear_uom_cache()
+		with patch("frappe.get_all", side_effect=lambda doctype, **kwargs: tables[doctype]) as get_all:
+			get_uom_info(["RM-1", "RM-2", "RM-1"])
+			self.assertEqual(get_conversion_factor("RM-1", "Box"), 12)
+			self.assertEqual(get_conversion_factor("RM-2", "Gram"), 0.001)
+			self.assertEqual(get_conversion_factor("RM-2", "Kg"), 1)
+			self.assertEqual(get_all.call_count, 3)
+
+			# A later request reads them from the site cache until the Item changes
+			frappe.flags.sb_uom_conversion = None
+			get_uom_info(["RM-1", "RM-2"])
+			self.assertEqual(get_all.call_count, 3)
+			clear_item_uom_cache(frappe._dict(name="RM-1"))
+			self.assertEqual(get_uom_info(["RM-1", "RM-2"])["RM-1"]["factors"], {"Box": 12})
+			self.assertEqual([call.args[0] for call in get_all.call_args_list[3:]], ["Item", "UOM Conversion Detail", "UOM Conversion Factor"])
@@ -0,0 +1,88 @@
+# tracing.py
+# Copyright (c) 2025, ptpratul2@gmail.com and contributors
+# For license information, please see license.txt
+
+"""
+Levelled tracing for the FG selector, the reports and the stock hooks.
+
+Records below the active level are dropped before their message is
+formatted. Enabled records go to a rotating file log (`logs/sb.<name>.log`)
+and to a per-process ring buffer. Debug records are sampled first. Only
+`error()` creates an Error Log row.
+
+The level comes from the document's `trace_level` field when it has one,
+otherwise from the `sb_trace_level` site config key (default "Error").
+`sb_trace_sample_rate` (0 to 1, default 1) sets the share of debug records
+that are kept.
+"""
+
+import logging
+import random
+from collections import deque
+
+import frappe
+from frappe.utils import flt, now_datetime
+
+LEVELS = {"Debug": 10, "Info": 20, "Warning": 30, "Error": 40}
+DEFAULT_LEVEL = "Error"
+RING_BUFFER_SIZE = 1000
+
+_recent = deque(maxlen=RING_BUFFER_SIZE)
+
+
+class Tracer:
+    def __init__(self, name, level=None):
+        self.name = name
+        self.level = level if level in LEVELS else DEFAULT_LEVEL
+        self.threshold = LEVELS[self.level]
+        sample_rate = frappe.conf.get("sb_trace_sample_rate")
+        self.sample_rate = 1.0 if sample_rate is None else flt(sample_rate)
+        self._logger = None
+
+    def enabled_for(self, level):
+        return LEVELS[level] >= self.threshold
+
+    def debug(self, message, *args):
+        if self.threshold > LEVELS["Debug"]:
+            return
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        self._record("Debug", message, args)
+
+    def info(self, message, *args):
+        if self.threshold <= LEVELS["Info"]:
+            self._record("Info", message, args)
+
+    def warning(self, message, *args):
+        if self.threshold <= LEVELS["Warning"]:
+            self._record("Warning", message, args)
+
+    def error(self, message, *args, title=None):
+        """Record a real failure; this is the only level that writes an Error Log row."""
+        message = self._record("Error", message, args)
+        frappe.log_error(message=message, title=title or f"SB {self.name}")
+
+    def _record(self, level, message, args):
+        if args:
+            message = message % args
+        _recent.append({"time": now_datetime(), "tracer": self.name, "level": level, "message": message})
+        if self._logger is None:
+            # frappe's loggers default to WARNING; the filtering already happened above
+            self._logger = frappe.logger(f"sb.{self.name}", allow_site=True)
+            self._logger.setLevel(logging.DEBUG)
+        self._logger.log(LEVELS[level], message)
+        return message
+
+
+def get_tracer(name, doc=None):
+    level = doc.get("trace_level") if doc is not None else None
+    return Tracer(name, level or frappe.conf.get("sb_trace_level"))
+
+
+def get_recent_records(tracer=None, level=None):
+    """Return the buffered records of this process, newest last."""
+    return [
+        record
+        for record in _recent
+        if (not tracer or record["tracer"] == tracer) and (not level or LEVELS[record["level"]] >= LEVELS[level])
+    ]
@@ -0,0 +1,103 @@
+# uom.py
+# Copyright (c) 2025, ptpratul2@gmail.com and contributors
+# For license information, please see license.txt
+
+"""
+UOM conversion factors per item.
+
+An item's stock UOM and its factors (the item's own UOM Conversion Detail
+rows, then the global UOM Conversion Factor to its stock UOM) are kept in
+the `sb_uom_conversion` Redis hash and memoized for the request in
+`frappe.flags`, so a pair is looked up at most once per request. Items
+missing from both are loaded together in three queries.
+
+The Item hooks drop an item's entry when it is saved or deleted, which
+covers its UOM Conversion Detail rows and stock UOM. Saving a UOM
+Conversion Factor drops every entry.
+"""
+
+from collections import defaultdict
+
+import frappe
+from frappe.utils import flt
+
+CACHE_KEY = "sb_uom_conversion"
+
+
+def get_uom_info(item_codes):
+    """Return `{item_code: {"stock_uom": ..., "factors": {uom: factor}}}`."""
+    if frappe.flags.sb_uom_conversion is None:
+        frappe.flags.sb_uom_conversion = {}
+    memo = frappe.flags.sb_uom_conversion
+    cache = frappe.cache()
+
+    missing = []
+    for item_code in set(item_codes):
+        if not item_code or item_code in memo:
+            continue
+        info = cache.hget(CACHE_KEY, item_code)
+        if info is None:
+            missing.append(item_code)
+        else:
+            memo[item_code] = info
+
+    if missing:
+        for item_code, info in load_uom_info(missing).items():
+            cache.hset(CACHE_KEY, item_code, info)
+            memo[item_code] = info
+
+    return {item_code: memo[item_code] for item_code in item_codes if item_code in memo}
+
+
+def get_conversion_factor(item_code, uom):
+    """Stock units in one `uom` of the item; 1 for the stock UOM or an unknown pair."""
+    return get_factor(get_uom_info([item_code]).get(item_code), uom)
+
+
+def get_factor(info, uom):
+    if not info or not uom or uom == info["stock_uom"]:
+        return 1.0
+    return info["factors"].get(uom) or 1.0
+
+
+def load_uom_info(item_codes):
+    stock_uoms = dict(frappe.get_all(
+        "Item", filters={"name": ["in", item_codes]}, fields=["name", "stock_uom"], as_list=True
+    ))
+    # Unknown items are cached too, so they are not queried again
+    info = {item_code: {"stock_uom": stock_uoms.get(item_code), "factors": {}} for item_code in item_codes}
+
+    for row in frappe.get_all(
+        "UOM Conversion Detail",
+        filters={"parent": ["in", list(info)], "parenttype": "Item"},
+        fields=["parent", "uom", "conversion_factor"]
+    ):
+        info[row.parent]["factors"][row.uom] = flt(row.conversion_factor)
+
+    items_by_stock_uom = defaultdict(list)
+    for item_code, item_info in info.items():
+        if item_info["stock_uom"]:
+            items_by_stock_uom[item_info["stock_uom"]].append(item_code)
+
+    if items_by_stock_uom:
+        for row in frappe.get_all(
+            "UOM Conversion Factor",
+            filters={"to_uom": ["in", list(items_by_stock_uom)]},
+            fields=["from_uom", "to_uom", "value"]
+        ):
+            for item_code in items_by_stock_uom[row.to_uom]:
+                info[item_code]["factors"].setdefault(row.from_uom, flt(row.value))
+
+    return info
+
+
+def clear_item_uom_cache(doc, method=None):
+    """Item hook: forget the item's stock UOM and factors."""
+    frappe.cache().hdel(CACHE_KEY, doc.name)
+    (frappe.flags.sb_uom_conversion or {}).pop(doc.name, None)
+
+
+def clear_uom_cache(doc=None, method=None):
+    """UOM Conversion Factor hook: global factors feed every item, so drop them all."""
+    frappe.cache().delete_key(CACHE_KEY)
+    frappe.flags.sb_uom_conversion = None